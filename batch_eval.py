@@ -0,0 +1,332 @@
+"""
+Offline Batch Evaluation
+Runs logged client messages through the detection pipeline (safety zone, greeting and scenario
+for every persona) to audit trigger coverage and false positives
+The JSONL corpus is streamed in chunks to a process pool with a bounded number of chunks in flight,
+so memory stays flat however large the input is
+
+Run: python batch_eval.py messages.jsonl --output classifications.jsonl --summary summary.json
+     python batch_eval.py logs.jsonl.gz --field text --id-field message_id --workers 8
+     cat messages.jsonl | python batch_eval.py - --output -
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from keyword_matcher import get_safety_matcher, normalize_text
+from persona_registry import PERSONAS
+
+
+DEFAULT_CHUNK_SIZE = 2000
+# Chunks queued per worker; bounds memory while keeping every worker busy
+CHUNKS_PER_WORKER = 2
+NO_MATCH = "(none)"
+
+
+def load_personas():
+    """Import the coach modules so their personas are registered (once per process)"""
+    import anne_rosental_coach  # noqa: F401
+    import hiro_lin_coach  # noqa: F401
+
+    return tuple(PERSONAS)
+
+
+def classify_message(text, persona_keys):
+    """
+    Run one message through the detectors, normalizing it once
+    Returns: dict with the safety zone and keywords, and per persona the greeting flag,
+    top scenario and every matched scenario with its triggers; without a trigger match,
+    "semantic" holds the semantic index's pick (the coaches' fallback) and its similarity
+    """
+    normalized = normalize_text(text)
+    safety_matcher = get_safety_matcher()
+    hits = safety_matcher.find_hits(text, normalized)
+    personas = {}
+    for key in persona_keys:
+        persona = PERSONAS[key]
+        matches = persona.scenario_index.match(text, normalized)
+        semantic = None
+        if not matches:
+            scenario, similarity = persona.semantic_index.best(text, normalized)
+            if scenario is not None:
+                semantic = {"scenario": scenario["name"], "similarity": round(similarity, 3)}
+        personas[key] = {
+            "greeting": persona.greeting_detector.is_greeting(text, normalized),
+            "scenario": matches[0].scenario["name"] if matches else None,
+            "confidence": matches[0].confidence if matches else 0.0,
+            "matches": [
+                {"scenario": match.scenario["name"], "triggers": match.triggers}
+                for match in matches
+            ],
+            "semantic": semantic,
+        }
+    return {
+        "safety": safety_matcher.classify(hits),
+        "safety_keywords": sorted({hit.keyword for hit in hits}),
+        "personas": personas,
+    }
+
+
+class EvalCounts:
+    """
+    Aggregate counts for a batch run; sized by the definitions, not by the corpus
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.skipped = 0
+        self.safety_zones = Counter()
+        self.safety_keywords = Counter()
+        self.greetings = Counter()     # persona -> greeting messages
+        self.scenarios = Counter()     # (persona, top scenario) -> messages
+        self.triggers = Counter()      # (persona, trigger) -> messages where it matched
+        self.multi_scenario = Counter()  # persona -> messages matching more than one scenario
+        self.semantic = Counter()      # (persona, scenario) -> messages placed only by the semantic index
+
+    def add(self, result):
+        self.messages += 1
+        self.safety_zones[result["safety"] or NO_MATCH] += 1
+        self.safety_keywords.update(result["safety_keywords"])
+        for key, persona in result["personas"].items():
+            if persona["greeting"]:
+                self.greetings[key] += 1
+            self.scenarios[(key, persona["scenario"] or NO_MATCH)] += 1
+            if len(persona["matches"]) > 1:
+                self.multi_scenario[key] += 1
+            for match in persona["matches"]:
+                self.triggers.update((key, trigger) for trigger in match["triggers"])
+            if persona["semantic"] is not None:
+                self.semantic[(key, persona["semantic"]["scenario"])] += 1
+
+    def merge(self, other):
+        self.messages += other.messages
+        self.skipped += other.skipped
+        for name in ("safety_zones", "safety_keywords", "greetings", "scenarios", "triggers", "multi_scenario",
+                     "semantic"):
+            getattr(self, name).update(getattr(other, name))
+
+    def summary(self, persona_keys):
+        """
+        Returns: JSON-ready dict; unmatched_triggers lists every trigger that never fired
+        """
+        personas = {}
+        for key in persona_keys:
+            persona = PERSONAS[key]
+            all_triggers = [
+                trigger for scenario in persona.scenario_index.scenarios for trigger in scenario["triggers"]
+            ]
+            personas[key] = {
+                "greetings": self.greetings[key],
+                "multi_scenario_messages": self.multi_scenario[key],
+                "scenarios": {
+                    name: count
+                    for (persona_key, name), count in self.scenarios.most_common()
+                    if persona_key == key
+                },
+                "triggers": {
+                    trigger: count
+                    for (persona_key, trigger), count in self.triggers.most_common()
+                    if persona_key == key
+                },
+                "semantic_scenarios": {
+                    name: count
+                    for (persona_key, name), count in self.semantic.most_common()
+                    if persona_key == key
+                },
+                "unmatched_triggers": [
+                    trigger for trigger in all_triggers if not self.triggers[(key, trigger)]
+                ],
+            }
+        return {
+            "messages": self.messages,
+            "skipped_lines": self.skipped,
+            "safety_zones": dict(self.safety_zones.most_common()),
+            "safety_keywords": dict(self.safety_keywords.most_common()),
+            "personas": personas,
+        }
+
+
+def _message_text(line, field):
+    """Returns: the message text from a JSONL line (an object or a bare string), or None"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None, None
+    if isinstance(record, str):
+        return record, None
+    if isinstance(record, dict) and isinstance(record.get(field), str):
+        return record[field], record
+    return None, None
+
+
+def classify_chunk(lines, first_line, field, id_field, persona_keys, with_rows=True):
+    """
+    Worker task: classify a chunk of raw JSONL lines
+    Returns: (output JSONL lines, or [] without with_rows, EvalCounts for the chunk)
+    """
+    counts = EvalCounts()
+    output = []
+    for offset, line in enumerate(lines):
+        if not line.strip():
+            continue
+        text, record = _message_text(line, field)
+        if text is None:
+            counts.skipped += 1
+            continue
+        result = classify_message(text, persona_keys)
+        counts.add(result)
+        if not with_rows:
+            continue
+        row = {"line": first_line + offset}
+        if id_field and record is not None and id_field in record:
+            row["id"] = record[id_field]
+        row.update(result)
+        output.append(json.dumps(row) + "\n")
+    return output, counts
+
+
+def _init_worker():
+    load_personas()
+    get_safety_matcher()
+
+
+def _open_input(path):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def _open_output(path):
+    if path is None:
+        return open(os.devnull, "w")
+    if path == "-":
+        return sys.stdout
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+
+def _chunks(lines, chunk_size):
+    """Yield (first line number, lines) for consecutive chunks of the input"""
+    chunk = []
+    first_line = 1
+    for number, line in enumerate(lines, 1):
+        if not chunk:
+            first_line = number
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield first_line, chunk
+            chunk = []
+    if chunk:
+        yield first_line, chunk
+
+
+def run_batch(input_path, output_path=None, field="message", id_field="id", persona_keys=None,
+              workers=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Classify every message in a JSONL corpus
+    Output lines keep the input order; at most workers * CHUNKS_PER_WORKER chunks are in memory
+    Args:
+        workers: pool size (default: CPU count); 0 runs in this process
+        progress: optional callback(messages_done)
+    Returns: EvalCounts
+    """
+    available = load_personas()
+    persona_keys = tuple(persona_keys or available)
+    for key in persona_keys:
+        if key not in PERSONAS:
+            raise ValueError(f"Unknown persona: {key}")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    totals = EvalCounts()
+    with_rows = output_path is not None
+
+    with _open_input(input_path) as source, _open_output(output_path) as sink:
+        def collect(output, counts):
+            sink.writelines(output)
+            totals.merge(counts)
+            if progress is not None:
+                progress(totals.messages)
+
+        chunks = _chunks(source, chunk_size)
+        if workers == 0:
+            for first_line, lines in chunks:
+                collect(*classify_chunk(lines, first_line, field, id_field, persona_keys, with_rows))
+            return totals
+
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for first_line, lines in chunks:
+                pending.append(pool.submit(
+                    classify_chunk, lines, first_line, field, id_field, persona_keys, with_rows
+                ))
+                if len(pending) >= workers * CHUNKS_PER_WORKER:
+                    collect(*pending.popleft().result())
+            while pending:
+                collect(*pending.popleft().result())
+    return totals
+
+
+def format_summary(summary):
+    lines = [f"{summary['messages']} messages ({summary['skipped_lines']} unreadable lines skipped)", ""]
+    lines.append("Safety zones: " + ", ".join(f"{zone} {count}" for zone, count in summary["safety_zones"].items()))
+    for key, persona in summary["personas"].items():
+        lines.append("")
+        lines.append(f"{key}: {persona['greetings']} greetings, "
+                     f"{persona['multi_scenario_messages']} messages matching several scenarios")
+        for name, count in persona["scenarios"].items():
+            lines.append(f"  {name:<45}{count:>10}")
+        semantic = sum(persona["semantic_scenarios"].values())
+        if semantic:
+            lines.append(f"  {semantic} messages without a trigger match placed by the semantic index")
+        unmatched = persona["unmatched_triggers"]
+        lines.append(f"  {len(unmatched)} triggers never matched" + (": " + ", ".join(unmatched[:20]) if unmatched else ""))
+        if len(unmatched) > 20:
+            lines.append(f"  ... and {len(unmatched) - 20} more (see the JSON summary)")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify a JSONL corpus of client messages with both coaches' detectors")
+    parser.add_argument("input", help="JSONL file (.gz ok), or - for stdin")
+    parser.add_argument("--output", default=None, help="per-message classifications as JSONL (.gz ok, - for stdout)")
+    parser.add_argument("--summary", default=None, help="write aggregate counts as JSON")
+    parser.add_argument("--field", default="message", help="message text field in each JSON object")
+    parser.add_argument("--id-field", default="id", help="field copied to the output to identify the message")
+    parser.add_argument("--persona", action="append", default=None,
+                        help="persona key to evaluate (repeatable, default: all)")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count, 0: no pool)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="messages per worker task")
+    args = parser.parse_args()
+
+    def progress(done):
+        print(f"\r{done} messages", end="", file=sys.stderr, flush=True)
+
+    start = time.perf_counter()
+    counts = run_batch(
+        args.input, args.output, args.field, args.id_field, args.persona,
+        args.workers, args.chunk_size, progress if sys.stderr.isatty() else None,
+    )
+    elapsed = time.perf_counter() - start
+    summary = counts.summary(tuple(args.persona or PERSONAS))
+    summary["elapsed_seconds"] = round(elapsed, 3)
+
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+            f.write("\n")
+    report = sys.stderr if args.output == "-" else sys.stdout
+    print("\n" + format_summary(summary), file=report)
+    print(f"\n{counts.messages / elapsed if elapsed else 0:.0f} messages/s", file=report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Hot Path Benchmarks
+Per-call CPU cost of safety detection, scenario detection (trigger and semantic), greeting
+detection and coaching prompt assembly for both coaches, over short, typical and very long
+(10k-character) messages
+Results are saved as JSON baselines; `compare` flags regressions against a baseline
+Timings only compare on the same machine, so baselines are recorded locally (or in one CI job),
+not committed
+
+Run: python benchmarks.py run                      # write benchmark_baseline.json
+     python benchmarks.py compare                  # re-run and compare with the baseline
+     python benchmarks.py compare old.json new.json
+"""
+
+import argparse
+import hashlib
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import timeit
+
+from anne_rosental_prompt import SafetyProtocol
+from scenario_index import collect_scenarios
+
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+# Timed runs per benchmark; enough for the minimum to settle and the spread to be measured
+DEFAULT_REPEAT = 20
+# A benchmark regresses when it is this much slower than the baseline...
+DEFAULT_THRESHOLD = 0.15
+# ...or, for noisy benchmarks, this many times their run-to-run spread...
+NOISE_FACTOR = 3.0
+# ...and at least this many microseconds slower (ignores noise on sub-microsecond calls)
+MIN_REGRESSION_US = 0.5
+
+LONG_MESSAGE_CHARS = 10000
+CORPUS_SIZE = 50
+
+_SHORT_MESSAGES = [
+    "hi", "hello", "thanks", "ok", "yes", "I don't know", "hey Anne", "good morning",
+    "not really", "maybe", "I'm tired", "help", "hmm", "sure", "I'm stuck",
+]
+
+_FILLER_SENTENCES = [
+    "I have been thinking about this for a while now.",
+    "Work has been busy and I keep coming home late.",
+    "My sister called yesterday and we talked for an hour.",
+    "I'm not sure where to start, honestly.",
+    "Some days are better than others.",
+    "I tried journaling last week but stopped after two days.",
+    "It is hard to explain what I mean.",
+    "I guess I just want things to feel lighter.",
+]
+
+
+def _trigger_phrases():
+    """Every scenario trigger and safety keyword, so corpora exercise real matches"""
+    import anne_rosental_prompt
+    import hiro_lin_prompt
+
+    phrases = []
+    for cls in (anne_rosental_prompt.AnneRosentalScenarios, hiro_lin_prompt.HiroLinScenarios):
+        for scenario in collect_scenarios(cls):
+            phrases.extend(scenario["triggers"])
+    return phrases
+
+
+def build_corpora(seed=1234):
+    """
+    Synthetic message corpora, identical on every run for a given seed
+    Returns: dict of corpus name -> list of messages
+    """
+    rng = random.Random(seed)
+    triggers = _trigger_phrases()
+    safety_words = list(SafetyProtocol.warning_keywords) + list(SafetyProtocol.crisis_keywords)
+
+    def typical_message():
+        parts = rng.sample(_FILLER_SENTENCES, rng.randint(1, 3))
+        parts.insert(rng.randint(0, len(parts)), f"I feel like {rng.choice(triggers)} lately.")
+        if rng.random() < 0.1:
+            parts.append(f"Sometimes I {rng.choice(safety_words)}.")
+        return " ".join(parts)
+
+    def long_message():
+        parts = []
+        length = 0
+        while length < LONG_MESSAGE_CHARS:
+            part = typical_message()
+            parts.append(part)
+            length += len(part) + 1
+        return " ".join(parts)[:LONG_MESSAGE_CHARS]
+
+    return {
+        "short": [rng.choice(_SHORT_MESSAGES) for _ in range(CORPUS_SIZE)],
+        "typical": [typical_message() for _ in range(CORPUS_SIZE)],
+        "long": [long_message() for _ in range(CORPUS_SIZE // 5)],
+    }
+
+
+def definitions_fingerprint():
+    """
+    Hash of the safety keywords and both personas' scenario definitions
+    A baseline only describes the definitions it was recorded with
+    """
+    import anne_rosental_prompt
+    import hiro_lin_prompt
+
+    payload = {
+        "crisis_keywords": list(SafetyProtocol.crisis_keywords),
+        "warning_keywords": list(SafetyProtocol.warning_keywords),
+        "anne": collect_scenarios(anne_rosental_prompt.AnneRosentalScenarios),
+        "hiro": collect_scenarios(hiro_lin_prompt.HiroLinScenarios),
+    }
+    data = json.dumps(payload, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _coaches():
+    from anne_rosental_coach import create_anne_coach
+    from hiro_lin_coach import create_hiro_coach
+
+    return {"anne": create_anne_coach(), "hiro": create_hiro_coach()}
+
+
+def _operations(coach):
+    """Benchmarked operations: name -> function of one message"""
+
+    def build_prompt(user_message):
+        # Same work generate_response does before the model call
+        return coach._response_request(user_message, coach.detect_scenario(user_message))
+
+    return {
+        "detect_safety_issue": coach.detect_safety_issue,
+        "detect_scenario": coach.detect_scenario,
+        "is_greeting": coach.is_greeting,
+        "semantic_scenario": coach.persona.semantic_index.best,
+        "build_prompt": build_prompt,
+    }
+
+
+def time_per_call(fn, messages, repeat=DEFAULT_REPEAT):
+    """
+    Time fn over every message
+    Returns: dict with min_us and median_us per call across `repeat` runs, and spread -
+             how far the median run is above the fastest one, relative to it
+    """
+    def run_corpus():
+        for message in messages:
+            fn(message)
+
+    timer = timeit.Timer(run_corpus)
+    number, _ = timer.autorange()
+    runs = timer.repeat(repeat=repeat, number=number)
+    per_call = [run / (number * len(messages)) * 1e6 for run in runs]
+    fastest = min(per_call)
+    median = statistics.median(per_call)
+    return {
+        "min_us": round(fastest, 3),
+        "median_us": round(median, 3),
+        "spread": round((median - fastest) / fastest, 4) if fastest else 0.0,
+    }
+
+
+def run_benchmarks(repeat=DEFAULT_REPEAT, only=None):
+    """
+    Returns: results dict with metadata and per-benchmark timings keyed "persona.operation.corpus"
+    """
+    corpora = build_corpora()
+    results = {}
+    for persona, coach in _coaches().items():
+        for operation, fn in _operations(coach).items():
+            for corpus_name, messages in corpora.items():
+                name = f"{persona}.{operation}.{corpus_name}"
+                if only and only not in name:
+                    continue
+                results[name] = time_per_call(fn, messages, repeat)
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "definitions": definitions_fingerprint(),
+        },
+        "results": results,
+    }
+
+
+def regression_threshold(base, timing, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns: relative slowdown that counts as a regression for one benchmark - the threshold, or
+             NOISE_FACTOR times the larger run-to-run spread of the two timings if that is wider
+    """
+    spread = max(base.get("spread", 0.0), timing.get("spread", 0.0))
+    return max(threshold, NOISE_FACTOR * spread)
+
+
+def same_machine(baseline, current):
+    """Returns: True if both results were recorded on the same platform and Python version"""
+    keys = ("platform", "python")
+    return all(baseline["meta"].get(key) == current["meta"].get(key) for key in keys)
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD, metric="min_us"):
+    """
+    Returns: (rows, regressions) where each row is (name, baseline_us, current_us, change)
+    """
+    rows = []
+    regressions = []
+    for name, timing in sorted(current["results"].items()):
+        base = baseline["results"].get(name)
+        if base is None:
+            rows.append((name, None, timing[metric], None))
+            continue
+        change = (timing[metric] - base[metric]) / base[metric] if base[metric] else 0.0
+        row = (name, base[metric], timing[metric], change)
+        rows.append(row)
+        if (change > regression_threshold(base, timing, threshold)
+                and timing[metric] - base[metric] >= MIN_REGRESSION_US):
+            regressions.append(row)
+    return rows, regressions
+
+
+def format_comparison(rows, regressions):
+    lines = [f"{'benchmark':<40}{'baseline us':>13}{'current us':>13}{'change':>9}"]
+    flagged = {row[0] for row in regressions}
+    for name, base, current, change in rows:
+        base_text = "-" if base is None else f"{base:.3f}"
+        change_text = "new" if change is None else f"{change:+.1%}"
+        marker = "  REGRESSION" if name in flagged else ""
+        lines.append(f"{name:<40}{base_text:>13}{current:>13.3f}{change_text:>9}{marker}")
+    return "\n".join(lines)
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detection and prompt assembly hot paths")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks and save the results")
+    run_parser.add_argument("--output", default=DEFAULT_BASELINE)
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    run_parser.add_argument("--only", default=None, help="substring filter on benchmark names")
+
+    compare_parser = subparsers.add_parser("compare", help="compare results with a baseline")
+    compare_parser.add_argument("baseline", nargs="?", default=DEFAULT_BASELINE)
+    compare_parser.add_argument("current", nargs="?", default=None,
+                                help="saved results to compare (default: run the benchmarks now)")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="relative slowdown that counts as a regression (widened for noisy benchmarks)")
+    compare_parser.add_argument("--metric", choices=("min_us", "median_us"), default="min_us")
+    compare_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    compare_parser.add_argument("--only", default=None)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_benchmarks(args.repeat, args.only)
+        _save(results, args.output)
+        for name, timing in sorted(results["results"].items()):
+            print(f"{name:<40}{timing['min_us']:>12.3f} us{timing['median_us']:>12.3f} us (median)")
+        print(f"Saved {len(results['results'])} benchmarks to {args.output}")
+        return
+
+    baseline = _load(args.baseline)
+    current = _load(args.current) if args.current else run_benchmarks(args.repeat, args.only)
+    rows, regressions = compare_results(baseline, current, args.threshold, args.metric)
+    print(format_comparison(rows, regressions))
+
+    if baseline["meta"].get("definitions") != current["meta"].get("definitions"):
+        print("\nKeyword lists or scenario definitions changed since the baseline - "
+              "record a new baseline with this change so its cost is known")
+    if not same_machine(baseline, current):
+        print("\nThe baseline was recorded on a different platform or Python version, so the timings "
+              "are not comparable - record a baseline on this machine first (not checking for regressions)")
+        return
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%} (or the benchmark's noise)")
+        sys.exit(1)
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,537 @@
+"""
+Headless Chat API
+ASGI service for the coaches, independent of the Streamlit app: create a session, send messages
+(whole or streamed as server-sent events), reset a session and read its history
+
+Turns run on the async coaches behind a bounded pool: at most max_concurrent_turns per process,
+max_queued_turns waiting, and anything beyond that is rejected with 503 and Retry-After.
+Sessions live in the session store (session_store.py), so any replica can serve any session;
+each replica keeps only recently used coaches in memory, restores the rest lazily, and brings a
+kept coach up to date at the start of a turn if another replica has answered or blocked its session.
+Idempotency keys are claimed in the store, so a completed turn is answered once across replicas
+(a duplicate that arrives while another replica is still answering gets 409 and Retry-After);
+a turn that failed is released, so its retry calls the model again.
+
+Run: python chat_api.py --port 8000
+     uvicorn chat_api:app --host 0.0.0.0 --port 8000 --workers 4
+
+Endpoints:
+    POST /v1/sessions                      {"persona": "anne", "country_code": "US", "welcome": true}
+    POST /v1/sessions/{id}/messages        {"message": "...", "stream": false}  (Idempotency-Key header)
+    POST /v1/sessions/{id}/reset
+    GET  /v1/sessions/{id}/history?limit=100
+    GET  /health
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+from collections import OrderedDict
+from contextlib import AsyncExitStack, asynccontextmanager
+from urllib.parse import parse_qs
+
+from coach_engine import create_async_coach
+from persona_registry import PERSONAS
+from session_store import get_session_store, DEFAULT_DISPLAY_LIMIT
+
+
+# Longest accepted request body and client message
+MAX_BODY_BYTES = 64 * 1024
+MAX_MESSAGE_CHARS = 20000
+# Most chat messages one history request returns
+MAX_HISTORY_LIMIT = 1000
+
+
+class ApiSettings:
+    """
+    Limits of one API process; every value can be overridden with an environment variable
+    """
+
+    def __init__(self, max_concurrent_turns=32, max_queued_turns=64, queue_timeout=10.0,
+                 max_live_sessions=1000, retry_after=1):
+        self.max_concurrent_turns = max_concurrent_turns
+        self.max_queued_turns = max_queued_turns
+        self.queue_timeout = queue_timeout
+        self.max_live_sessions = max_live_sessions
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_env(cls):
+        """Build settings from COACH_API_* environment variables, falling back to defaults"""
+        defaults = cls()
+        return cls(
+            max_concurrent_turns=int(os.getenv("COACH_API_MAX_CONCURRENT_TURNS", defaults.max_concurrent_turns)),
+            max_queued_turns=int(os.getenv("COACH_API_MAX_QUEUED_TURNS", defaults.max_queued_turns)),
+            queue_timeout=float(os.getenv("COACH_API_QUEUE_TIMEOUT", defaults.queue_timeout)),
+            max_live_sessions=int(os.getenv("COACH_API_MAX_LIVE_SESSIONS", defaults.max_live_sessions)),
+            retry_after=int(os.getenv("COACH_API_RETRY_AFTER", defaults.retry_after)),
+        )
+
+
+class ApiError(Exception):
+    """Turned into a JSON error response"""
+
+    def __init__(self, status, message, error_type="invalid_request_error", headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.error_type = error_type
+        self.headers = headers or {}
+
+
+class TurnPool:
+    """
+    Bounded pool of turn slots with a bounded wait queue (backpressure)
+    Only used from the event loop, so the counters need no lock
+    """
+
+    def __init__(self, max_concurrent, max_queued, queue_timeout, retry_after):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Hold a turn slot for the body of the with block
+        Raises: ApiError 503 when the queue is full or the wait times out
+        """
+        if self._slots.locked() and self.queued >= self.max_queued:
+            raise self._overloaded()
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._overloaded() from None
+        finally:
+            self.queued -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+    def _overloaded(self):
+        self.rejected += 1
+        return ApiError(503, "Too many turns in progress, retry shortly", "overloaded",
+                        {"Retry-After": str(self.retry_after)})
+
+
+class LiveSession:
+    """A session's coach on this replica; the lock keeps its turns in order"""
+
+    def __init__(self, coach):
+        self.coach = coach
+        self.lock = asyncio.Lock()
+
+
+class SessionManager:
+    """
+    Recently used coaches by session id (LRU); others are restored from the store on demand
+    """
+
+    def __init__(self, store, max_live_sessions):
+        self.store = store
+        self.max_live_sessions = max_live_sessions
+        self._live = OrderedDict()
+        self._restoring = {}
+
+    def __len__(self):
+        return len(self._live)
+
+    async def create(self, persona, country_code):
+        """Returns: (session id, LiveSession) for a new stored session"""
+        coach = create_async_coach(persona, country_code)
+        session_id = await asyncio.to_thread(self.store.create_session, persona, country_code)
+        coach.attach_session(self.store, session_id)
+        session = LiveSession(coach)
+        self._remember(session_id, session)
+        return session_id, session
+
+    async def get(self, session_id):
+        """
+        Returns: the LiveSession, restoring it from the store if this replica has not got it
+        Raises: ApiError 404 for an unknown session
+        """
+        session = self._live.get(session_id)
+        if session is not None:
+            self._live.move_to_end(session_id)
+            return session
+        # Concurrent requests for the same session share one restore
+        task = self._restoring.get(session_id)
+        if task is None:
+            task = asyncio.ensure_future(self._restore(session_id))
+            self._restoring[session_id] = task
+            task.add_done_callback(lambda _: self._restoring.pop(session_id, None))
+        session = await asyncio.shield(task)
+        if session is None:
+            raise ApiError(404, f"Unknown session: {session_id}", "not_found")
+        return session
+
+    async def refresh(self, session_id, session):
+        """
+        Restore the coach from the store if another replica moved its session on (call under session.lock)
+        Returns: the coach
+        Raises: ApiError 404 if the session is gone from the store
+        """
+        snapshot = await asyncio.to_thread(self.store.load, session_id, 0)
+        if snapshot is None:
+            self._live.pop(session_id, None)
+            raise ApiError(404, f"Unknown session: {session_id}", "not_found")
+        if session.coach.session_outdated(snapshot):
+            session.coach.restore_session(snapshot)
+        return session.coach
+
+    def rename(self, old_session_id, new_session_id):
+        """Keep a reset session's coach under its new stored session id"""
+        session = self._live.pop(old_session_id, None)
+        if session is not None:
+            self._remember(new_session_id, session)
+
+    async def _restore(self, session_id):
+        snapshot = await asyncio.to_thread(self.store.load, session_id, 0)
+        if snapshot is None or snapshot.persona not in PERSONAS:
+            return None
+        coach = create_async_coach(snapshot.persona, snapshot.country_code)
+        coach.restore_session(snapshot)
+        coach.attach_session(self.store, session_id)
+        session = LiveSession(coach)
+        self._remember(session_id, session)
+        return session
+
+    def _remember(self, session_id, session):
+        self._live[session_id] = session
+        self._live.move_to_end(session_id)
+        # Evict idle coaches only; their sessions stay in the store
+        for candidate in list(self._live):
+            if len(self._live) <= self.max_live_sessions:
+                break
+            if candidate != session_id and not self._live[candidate].lock.locked():
+                del self._live[candidate]
+
+
+def load_personas():
+    """Import the coach modules so their personas are registered"""
+    import anne_rosental_coach  # noqa: F401
+    import hiro_lin_coach  # noqa: F401
+
+    return tuple(PERSONAS)
+
+
+class Request:
+    """The parts of an ASGI HTTP request the handlers need"""
+
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1")
+                        for name, value in scope.get("headers", [])}
+        self._receive = receive
+
+    async def json(self):
+        """
+        Returns: the JSON object body ({} for an empty body)
+        Raises: ApiError 400 / 413
+        """
+        chunks = []
+        size = 0
+        while True:
+            message = await self._receive()
+            if message["type"] == "http.disconnect":
+                raise ApiError(400, "Client disconnected")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise ApiError(413, f"Request body over {MAX_BODY_BYTES} bytes")
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+        raw = b"".join(chunks)
+        if not raw.strip():
+            return {}
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            raise ApiError(400, "Request body is not valid JSON") from None
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return body
+
+
+async def _send_json(send, status, payload, headers=None):
+    data = json.dumps(payload).encode("utf-8")
+    response_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())]
+    response_headers.extend((name.lower().encode(), value.encode()) for name, value in (headers or {}).items())
+    await send({"type": "http.response.start", "status": status, "headers": response_headers})
+    await send({"type": "http.response.body", "body": data})
+
+
+async def _single_delta(reply):
+    """A stored reply as a one-delta stream"""
+    yield reply
+
+
+def _event(payload):
+    return {"type": "http.response.body", "body": b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n",
+            "more_body": True}
+
+
+class ChatAPI:
+    """
+    The ASGI application
+    Args:
+        store: SessionStore (default: session_store.get_session_store() on first use)
+    """
+
+    ROUTES = [
+        ("POST", re.compile(r"^/v1/sessions/?$"), "create_session"),
+        ("POST", re.compile(r"^/v1/sessions/(?P<session_id>[^/]+)/messages/?$"), "send_message"),
+        ("POST", re.compile(r"^/v1/sessions/(?P<session_id>[^/]+)/reset/?$"), "reset_session"),
+        ("GET", re.compile(r"^/v1/sessions/(?P<session_id>[^/]+)/history/?$"), "history"),
+        ("GET", re.compile(r"^/health/?$"), "health"),
+    ]
+
+    def __init__(self, settings=None, store=None):
+        load_personas()
+        self.settings = settings or ApiSettings.from_env()
+        self._store = store
+        self._pool = None
+        self._sessions = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = get_session_store()
+        return self._store
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            settings = self.settings
+            self._pool = TurnPool(settings.max_concurrent_turns, settings.max_queued_turns,
+                                  settings.queue_timeout, settings.retry_after)
+        return self._pool
+
+    @property
+    def sessions(self):
+        if self._sessions is None:
+            self._sessions = SessionManager(self.store, self.settings.max_live_sessions)
+        return self._sessions
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        request = Request(scope, receive)
+        try:
+            handler, params = self._route(request)
+            await handler(request, send, **params)
+        except ApiError as error:
+            await _send_json(send, error.status, {
+                "error": {"message": error.message, "type": error.error_type}
+            }, error.headers)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _route(self, request):
+        allowed = []
+        for method, pattern, name in self.ROUTES:
+            match = pattern.match(request.path)
+            if match is None:
+                continue
+            if method == request.method:
+                return getattr(self, name), match.groupdict()
+            allowed.append(method)
+        if allowed:
+            raise ApiError(405, f"Method {request.method} not allowed", headers={"Allow": ", ".join(allowed)})
+        raise ApiError(404, "Not found", "not_found")
+
+    # Handlers
+
+    async def create_session(self, request, send):
+        body = await request.json()
+        persona = body.get("persona")
+        if persona not in PERSONAS:
+            raise ApiError(400, f"persona must be one of: {', '.join(sorted(PERSONAS))}")
+        country_code = body.get("country_code", "US")
+        if not isinstance(country_code, str) or not country_code:
+            raise ApiError(400, "country_code must be an ISO country code")
+
+        session_id, session = await self.sessions.create(persona, country_code.upper())
+        welcome = None
+        if body.get("welcome", True):
+            async with self.pool.slot(), session.lock:
+                welcome = await session.coach.get_welcome_message()
+                await asyncio.to_thread(self.store.append_display, session_id, "assistant", welcome)
+        await _send_json(send, 201, {
+            "session_id": session_id,
+            "persona": persona,
+            "country_code": session.coach.user_country_code,
+            "welcome": welcome,
+        })
+
+    async def send_message(self, request, send, session_id):
+        body = await request.json()
+        message = body.get("message")
+        if not isinstance(message, str) or not message.strip():
+            raise ApiError(400, "message must be a non-empty string")
+        if len(message) > MAX_MESSAGE_CHARS:
+            raise ApiError(400, f"message is longer than {MAX_MESSAGE_CHARS} characters")
+        turn_id = request.headers.get("idempotency-key") or body.get("turn_id")
+        session = await self.sessions.get(session_id)
+
+        async with AsyncExitStack() as stack:
+            # Slot first, so a busy session cannot queue turns past the pool's bounds
+            await stack.enter_async_context(self.pool.slot())
+            await stack.enter_async_context(session.lock)
+            coach = await self.sessions.refresh(session_id, session)
+            # A resubmitted turn is answered from the coach's turn registry (or, if another replica
+            # answered it, from the store) and shown only once
+            repeated = turn_id is not None and turn_id in coach.turns
+            claimed = False
+            reply = None
+            if turn_id is not None and not repeated:
+                claimed, reply = await asyncio.to_thread(self.store.claim_turn, session_id, turn_id)
+                if not claimed and reply is None:
+                    raise ApiError(409, "This turn is still being answered, retry shortly", "conflict",
+                                   {"Retry-After": str(self.settings.retry_after)})
+                repeated = not claimed
+            if not repeated:
+                await asyncio.to_thread(self.store.append_display, session_id, "user", message)
+
+            try:
+                if reply is not None:
+                    if body.get("stream"):
+                        await self._stream_reply(send, coach, _single_delta(reply), session_id)
+                elif body.get("stream"):
+                    reply = await self._stream_reply(
+                        send, coach, coach.stream_response(message, turn_id=turn_id), session_id
+                    )
+                else:
+                    reply = await coach.generate_response(message, turn_id=turn_id)
+            finally:
+                if claimed:
+                    # Only a completed turn is shared with other replicas; after an error reply, an
+                    # exception or a closed stream the claim is released so a retry is answered again
+                    completed = coach.turns.result(turn_id)
+                    if completed is not None:
+                        await asyncio.to_thread(self.store.finish_turn, session_id, turn_id, completed)
+                    else:
+                        await asyncio.to_thread(self.store.release_turn, session_id, turn_id)
+            if not repeated and reply:
+                await asyncio.to_thread(self.store.append_display, session_id, "assistant", reply)
+
+        if not body.get("stream"):
+            await _send_json(send, 200, {
+                "session_id": session_id,
+                "reply": reply,
+                "session_blocked": coach.session_blocked,
+            })
+
+    async def _stream_reply(self, send, coach, deltas, session_id):
+        """
+        Send the reply as server-sent events: {"delta": ...} per chunk, then
+        {"done": true, "reply": ..., "session_blocked": ...}
+        Returns: the complete reply text
+        """
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+        })
+        parts = []
+        try:
+            async for delta in deltas:
+                parts.append(delta)
+                await send(_event({"delta": delta}))
+        finally:
+            await deltas.aclose()
+        reply = "".join(parts)
+        await send(_event({
+            "done": True,
+            "session_id": session_id,
+            "reply": reply,
+            "session_blocked": coach.session_blocked,
+        }))
+        await send({"type": "http.response.body", "body": b""})
+        return reply
+
+    async def reset_session(self, request, send, session_id):
+        session = await self.sessions.get(session_id)
+        async with session.lock:
+            coach = session.coach
+            coach.reset_session()
+            # A reset conversation is a new stored session, as in the Streamlit app
+            new_session_id = await asyncio.to_thread(
+                self.store.create_session, coach.persona_key, coach.user_country_code
+            )
+            coach.attach_session(self.store, new_session_id)
+            self.sessions.rename(session_id, new_session_id)
+        await _send_json(send, 200, {"session_id": new_session_id, "previous_session_id": session_id})
+
+    async def history(self, request, send, session_id):
+        try:
+            limit = int(request.query.get("limit", [DEFAULT_DISPLAY_LIMIT])[0])
+        except ValueError:
+            raise ApiError(400, "limit must be an integer") from None
+        if not 0 <= limit <= MAX_HISTORY_LIMIT:
+            raise ApiError(400, f"limit must be between 0 and {MAX_HISTORY_LIMIT}")
+        snapshot = await asyncio.to_thread(self.store.load, session_id, limit)
+        if snapshot is None:
+            raise ApiError(404, f"Unknown session: {session_id}", "not_found")
+        await _send_json(send, 200, {
+            "session_id": session_id,
+            "persona": snapshot.persona,
+            "country_code": snapshot.country_code,
+            "session_blocked": snapshot.session_blocked,
+            "summary": snapshot.summary,
+            "messages": snapshot.display_messages,
+        })
+
+    async def health(self, request, send):
+        pool = self.pool
+        await _send_json(send, 200, {
+            "status": "ok",
+            "active_turns": pool.active,
+            "queued_turns": pool.queued,
+            "rejected_turns": pool.rejected,
+            "live_sessions": len(self.sessions),
+        })
+
+
+app = ChatAPI()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless chat API for the coaches (ASGI, served by uvicorn)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run("chat_api:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1057 @@
+"""
+Coach Engine
+Conversation flow, safety routing and model calls shared by every coach
+Each coach is a Persona from persona_registry; an engine instance only holds its own session
+(history window, crisis block, cached welcome, usage ledger and optional session store)
+"""
+
+import asyncio
+import time
+
+from anne_rosental_prompt import SafetyProtocol  # Shared helplines
+from keyword_matcher import get_safety_matcher, normalize_text
+from persona_registry import get_persona
+from scenario_index import ScenarioMatch
+from llm_client import get_client, get_async_client, get_settings  # Shared, lazily created clients
+from resilience import resilient_caller, CALL_DEADLINES
+from model_routing import model_router
+from turn_tracing import tracer, span, traced, set_turn_type, set_outcome, record_usage, current_trace
+from usage_ledger import UsageLedger, process_usage
+from response_pool import response_pool
+from turn_registry import TurnRegistry
+from model_cache import ModelCacheMiss
+from crisis_templates import (
+    build_followup_instruction,
+    CRISIS_MODE_MODEL, CRISIS_MODE_LOCAL_FOLLOWUP, DEFAULT_CRISIS_MODE
+)
+from conversation_window import (
+    ConversationWindow, DEFAULT_TOKEN_BUDGET, DEFAULT_KEEP_TURNS, build_summary_prompt
+)
+
+
+class CoachEngine:
+    """
+    Coaching engine for one session with one persona
+    Handles conversation flow, scenario detection, and safety protocols
+    Subclasses set the persona class attribute; otherwise pass persona= (a Persona or its key)
+    """
+    
+    persona = None
+    
+    # Crisis and warning keywords are the same for every coach, one matcher per process
+    safety_matcher = get_safety_matcher()
+    
+    # Fall back to the persona's semantic index when no trigger phrase matches
+    semantic_fallback = True
+    
+    def __init__(self, user_country_code="US", history_token_budget=DEFAULT_TOKEN_BUDGET,
+                 history_keep_turns=DEFAULT_KEEP_TURNS, crisis_mode=DEFAULT_CRISIS_MODE, persona=None):
+        if persona is not None:
+            self.persona = get_persona(persona) if isinstance(persona, str) else persona
+        if self.persona is None:
+            raise ValueError("CoachEngine needs a persona")
+        self.conversation_history = []
+        self.history_window = ConversationWindow(
+            token_budget=history_token_budget,
+            keep_turns=history_keep_turns,
+            summarizer=self._summarize_history,
+            # Replayed runs need the same history in every request, so they fold inline
+            background=not get_settings().cache_mode,
+        )
+        self.is_new_session = True
+        self._cached_welcome = None
+        self.user_country_code = user_country_code
+        self.session_blocked = False
+        self.crisis_mode = crisis_mode
+        # Token usage for this session, also rolled up into the process-wide totals
+        self.usage_ledger = UsageLedger(self.persona_key, parent=process_usage)
+        self._turn_scenario = None
+        # Idempotency keys of recent turns, so a resubmitted turn is answered once
+        self.turns = TurnRegistry()
+        # Optional persistence (see attach_session)
+        self.session_store = None
+        self.session_id = None
+        self._persisted_summary = ""
+        self._persisted_count = 0  # History messages in the stored session, as far as this coach knows
+    
+    # Shared, read-only persona data
+    
+    @property
+    def persona_key(self):
+        """Key for process-wide shared resources (response pool, routing, ledgers, etc.)"""
+        return self.persona.key
+    
+    @property
+    def prompts(self):
+        return self.persona.prompts
+    
+    @property
+    def scenario_index(self):
+        return self.persona.scenario_index
+    
+    @property
+    def greeting_detector(self):
+        return self.persona.greeting_detector
+    
+    @property
+    def crisis_responder(self):
+        return self.persona.crisis_responder
+        
+    def detect_safety_issue(self, user_message):
+        """
+        Detect if user message contains crisis or warning signals
+        Returns: 'crisis', 'warning', or None
+        """
+        return self.safety_matcher.classify(self.detect_safety_hits(user_message))
+    
+    def detect_safety_hits(self, user_message):
+        """
+        Find every crisis and warning keyword in the message in a single pass
+        Returns: list of SafetyHit (keyword, start, end, zone)
+        """
+        return self.safety_matcher.find_hits(user_message)
+    
+    def detect_scenario(self, user_message):
+        """
+        Detect which coaching scenario best matches the user's message
+        Returns: matching scenario or None
+        """
+        matches = self.detect_scenarios(user_message)
+        return matches[0].scenario if matches else None
+    
+    def detect_scenarios(self, user_message):
+        """
+        Find every scenario whose triggers appear in the message
+        Without a trigger hit, the closest scenario by meaning (if similar enough) is returned
+        Returns: list of ScenarioMatch ranked by hits and trigger specificity
+        """
+        normalized = normalize_text(user_message)
+        return (self.scenario_index.match(user_message, normalized)
+                or self._semantic_matches(user_message, normalized))
+    
+    def _semantic_matches(self, user_message, normalized):
+        """
+        Returns: [ScenarioMatch] for the semantically closest scenario (no triggers), or []
+        """
+        if not self.semantic_fallback:
+            return []
+        scenario, similarity = self.persona.semantic_index.best(user_message, normalized)
+        if scenario is None:
+            return []
+        return [ScenarioMatch(scenario=scenario, triggers=[], hits=0, score=similarity,
+                              confidence=round(similarity, 3))]
+    
+    def is_greeting(self, user_message):
+        """Check if message is only a greeting (short, word-level match)"""
+        return self.greeting_detector.is_greeting(user_message)
+    
+    def get_welcome_message(self):
+        """Get welcome message - served from the shared pool and cached for the session"""
+        with tracer.turn(self.persona_key, "welcome"):
+            if self._cached_welcome is None:
+                request, fallback = self._welcome_request()
+                pooled = response_pool.get(self._welcome_pool_key(), lambda: self._complete_blocking("welcome", request))
+                if pooled is None:
+                    set_outcome("fallback")
+                self._cached_welcome = pooled or fallback
+            return self._cached_welcome
+    
+    def stream_welcome_message(self):
+        """Stream welcome message as text deltas - pooled messages are returned whole"""
+        return self._traced_stream("welcome", self._stream_welcome_turn())
+    
+    def _stream_welcome_turn(self):
+        """Body of stream_welcome_message"""
+        if self._cached_welcome is None:
+            request, fallback = self._welcome_request()
+            key = self._welcome_pool_key()
+            factory = lambda: self._complete_blocking("welcome", request)
+            prefetching = response_pool.is_filling(key)
+            self._cached_welcome = response_pool.take(key, factory)
+            # A welcome prefetched while the client was choosing is nearly done - wait rather than call again
+            if self._cached_welcome is None and prefetching and response_pool.wait(key, CALL_DEADLINES["welcome"]):
+                self._cached_welcome = response_pool.take(key, factory)
+        if self._cached_welcome is not None:
+            yield self._cached_welcome
+            return
+        
+        parts = []
+        for delta in self._stream_welcome():
+            parts.append(delta)
+            yield delta
+        self._cached_welcome = "".join(parts).strip()
+    
+    def _welcome_pool_key(self):
+        """Shared response pool key for this coach's welcome messages"""
+        return (self.persona_key, "welcome", self.user_country_code)
+    
+    def prefetch_welcome(self):
+        """
+        Start generating a welcome in the background, e.g. while the client is still choosing a coach
+        The message goes to the shared pool, so a coach that is not chosen serves a later session
+        Returns: Future, or None if a welcome is already pooled or being generated
+        """
+        request, _ = self._welcome_request()
+        return response_pool.prefetch(self._welcome_pool_key(), lambda: self._complete_blocking("welcome", request))
+    
+    def _generate_welcome(self):
+        """Generate personalized welcome message"""
+        request, fallback = self._welcome_request()
+        return self._complete_or_fallback("welcome", request, fallback)
+    
+    def _stream_welcome(self):
+        """Stream personalized welcome message as text deltas"""
+        request, fallback = self._welcome_request()
+        return self._stream_or_fallback("welcome", request, fallback)
+    
+    @traced("prompt_build")
+    def _welcome_request(self):
+        """Build the chat request and local fallback text for the welcome message"""
+        request = dict(
+            messages=self.prompts.messages([], self.persona.welcome_prompt),
+            **model_router.params("welcome", self.persona_key)
+        )
+        fallback = self.persona.welcome_fallback
+        return request, fallback
+    
+    def generate_response(self, user_message, turn_id=None):
+        """
+        Generate the coach's response based on user message
+        Main orchestration method
+        Args:
+            turn_id: optional idempotency key; resubmitting a turn that is in flight or answered
+                returns its reply without routing the message or calling the model again
+        """
+        record = None
+        if turn_id is not None:
+            record, owner = self.turns.begin(turn_id)
+            if not owner:
+                return self._duplicate_reply(self.turns.wait(record))
+        reply = None
+        outcome = None
+        try:
+            with tracer.turn(self.persona_key) as trace:
+                reply = self._respond(user_message)
+                outcome = trace.outcome
+            return reply
+        finally:
+            if record is not None:
+                self._end_turn(record, reply, outcome)
+    
+    def _respond(self, user_message):
+        """Route and answer one turn (body of generate_response)"""
+        turn_type, matched_scenario = self._route_turn(user_message)
+        
+        if turn_type == 'blocked':
+            return self._blocked_message()
+        if turn_type == 'greeting':
+            return self._generate_greeting()
+        if turn_type == 'crisis':
+            return self._generate_crisis_response(user_message)
+        if turn_type == 'warning':
+            return self._generate_warning_response(user_message)
+        
+        # Add user message to history
+        self._record_message("user", user_message)
+        
+        # Call OpenAI API (retries, deadline and circuit breaker handled by the shared caller)
+        try:
+            response = self._create("coaching", self._response_request(user_message, matched_scenario))
+            
+            assistant_message = response.choices[0].message.content
+            self._record_message("assistant", assistant_message)
+            
+            return assistant_message
+            
+        except ModelCacheMiss:
+            raise
+        except Exception as e:
+            set_outcome("error")
+            return self._connection_error_message()
+    
+    def stream_response(self, user_message, turn_id=None):
+        """
+        Stream the coach's response as text deltas
+        The complete message is added to the history once the stream finishes
+        turn_id: optional idempotency key (see generate_response); duplicates get the reply whole
+        """
+        if turn_id is None:
+            return self._traced_stream(None, self._stream_turn(user_message))
+        traces = []
+        deltas = self._traced_stream(None, self._stream_turn(user_message), traces)
+        return self._idempotent_stream(turn_id, deltas, traces)
+    
+    def _idempotent_stream(self, turn_id, deltas, traces):
+        """
+        Stream a turn once per idempotency key
+        A stream closed part-way (e.g. the client disconnected) abandons the turn, so duplicates
+        never get a truncated reply and a retry with the same key is answered again
+        traces: filled with the turn's trace by _traced_stream, for the turn's outcome
+        """
+        record, owner = self.turns.begin(turn_id)
+        if not owner:
+            deltas.close()
+            yield self._duplicate_reply(self.turns.wait(record))
+            return
+        parts = []
+        finished = False
+        try:
+            for delta in deltas:
+                parts.append(delta)
+                yield delta
+            finished = True
+        finally:
+            self._end_turn(record, "".join(parts) if finished else None, traces[0].outcome if traces else None)
+    
+    def _end_turn(self, record, reply, outcome):
+        """
+        Store a turn's reply for its duplicates, or forget a turn that produced no reply or only the
+        connection error message, so a retry with the same key calls the model again
+        outcome: the turn trace's outcome (ok, fallback or error), None if the turn did not finish
+        """
+        if reply and outcome not in (None, "error"):
+            self.turns.finish(record, reply)
+        else:
+            self.turns.abandon(record)
+    
+    def _duplicate_reply(self, reply):
+        """Reply for a resubmitted turn: the original reply, if the original turn produced one"""
+        return reply if reply is not None else self._connection_error_message()
+    
+    def _stream_turn(self, user_message):
+        """Route and stream one turn (body of stream_response)"""
+        turn_type, matched_scenario = self._route_turn(user_message)
+        
+        if turn_type == 'blocked':
+            yield self._blocked_message()
+            return
+        if turn_type == 'greeting':
+            yield from self._stream_greeting()
+            return
+        if turn_type == 'crisis':
+            yield from self._stream_crisis_response(user_message)
+            return
+        if turn_type == 'warning':
+            yield from self._stream_warning_response(user_message)
+            return
+        
+        self._record_message("user", user_message)
+        
+        parts = []
+        try:
+            for delta in self._stream_deltas("coaching", self._response_request(user_message, matched_scenario)):
+                parts.append(delta)
+                yield delta
+        except ModelCacheMiss:
+            raise
+        except Exception as e:
+            set_outcome("error")
+            if not parts:
+                yield self._connection_error_message()
+                return
+        
+        self._record_message("assistant", "".join(parts))
+    
+    def _route_turn(self, user_message, persist_block=True):
+        """
+        Decide how a turn is handled before any model call
+        persist_block: write a crisis block to the session store here (async coaches write it off the loop)
+        Returns: (turn_type, matched_scenario) where turn_type is
+        'blocked', 'greeting', 'crisis', 'warning' or 'coaching'
+        """
+        # Check if session is blocked after crisis
+        if self.session_blocked:
+            set_turn_type('blocked')
+            return 'blocked', None
+        
+        # Mark session as started
+        if self.is_new_session:
+            self.is_new_session = False
+        
+        # Normalize once for every detector
+        with span("normalization"):
+            normalized = normalize_text(user_message)
+        
+        # PRIORITY: Check for safety issues
+        with span("safety"):
+            safety_level = self.safety_matcher.classify(self.safety_matcher.find_hits(user_message, normalized))
+        
+        if safety_level == 'crisis':
+            self.session_blocked = True
+            if persist_block and self.session_store is not None:
+                # Persist the block first so it survives a restart or a move to another replica
+                self.session_store.set_blocked(self.session_id)
+            turn_type = 'crisis'
+        elif safety_level == 'warning':
+            turn_type = 'warning'
+        elif self.greeting_detector.is_greeting(user_message, normalized):
+            turn_type = 'greeting'
+        else:
+            # Detect scenario
+            with span("scenario"):
+                matches = (self.scenario_index.match(user_message, normalized)
+                           or self._semantic_matches(user_message, normalized))
+            matched_scenario = matches[0].scenario if matches else None
+            self._turn_scenario = matched_scenario["name"] if matched_scenario else None
+            set_turn_type('coaching')
+            return 'coaching', matched_scenario
+        
+        set_turn_type(turn_type)
+        return turn_type, None
+    
+    @traced("prompt_build")
+    def _response_request(self, user_message, matched_scenario):
+        """Build the chat request for a coaching turn (history must already include the user message)"""
+        # Shared persona prefix first, per-turn scenario and client words last
+        instruction = self.prompts.coaching_instruction(user_message, matched_scenario)
+        
+        return dict(
+            messages=self.prompts.messages(self.history_window.build_messages(), instruction),
+            **model_router.params("coaching", self.persona_key)
+        )
+    
+    def _record_message(self, role, content):
+        """Add a message to the transcript and the prompt window"""
+        self.conversation_history.append({"role": role, "content": content})
+        self.history_window.append(role, content)
+        self._persist_message(role, content)
+    
+    def _persist_message(self, role, content):
+        """Append a message (and the summary, if it changed) to the attached session store"""
+        if self.session_store is None:
+            return
+        summary, window_size = self.history_window.saved_state()
+        self.session_store.append_turn(
+            self.session_id, role, content,
+            window_size=window_size,
+            summary=summary if summary != self._persisted_summary else None,
+        )
+        self._persisted_summary = summary
+        self._persisted_count += 1
+    
+    def _blocked_message(self):
+        """Reply for any message after a crisis has blocked the session"""
+        return "I'm unable to continue our conversation right now. Please reach out to the professional resources I shared with you. Your safety is the priority."
+    
+    def _connection_error_message(self):
+        """Reply when the coaching turn could not reach the model (details are logged, not shown)"""
+        return self.persona.connection_error_message
+    
+    def _create(self, call_type, request, stream=False):
+        """
+        Run a chat request on the shared sync client through the resilient caller
+        Raises: CircuitOpenError while upstream is unhealthy, or the last upstream error
+        """
+        if stream:
+            # Ask for a final usage chunk so streamed turns report token counts too
+            request = dict(request, stream_options={"include_usage": True})
+        attempt = {}
+
+        def send(timeout):
+            attempt["start"] = time.perf_counter()  # Only the attempt that succeeds is timed
+            return get_client().chat.completions.create(stream=stream, timeout=timeout, **request)
+
+        with span("summary" if call_type == "summary" else "upstream"):
+            response = resilient_caller.call(call_type, send)
+        if stream:
+            return self._timed_stream(call_type, request["model"], response, attempt["start"])
+        self._record_latency(call_type, request["model"], attempt["start"])
+        self._record_usage(call_type, request["model"], getattr(response, "usage", None))
+        return response
+    
+    def _timed_stream(self, call_type, model, stream, start):
+        """Yield a streamed response's chunks, recording its latency once the last one has arrived"""
+        yield from stream
+        self._record_latency(call_type, model, start)
+    
+    def _record_latency(self, call_type, model, start):
+        """Feed the router's SLO checks with the time the successful attempt took to complete the reply"""
+        route = model_router.route(call_type, self.persona_key)
+        model_router.record_latency(route, model, time.perf_counter() - start)
+    
+    def _complete_or_fallback(self, call_type, request, fallback):
+        """Run a chat request and return the stripped text, or the fallback on error"""
+        try:
+            return self._complete_blocking(call_type, request)
+        except ModelCacheMiss:
+            raise  # A replay run must surface unrecorded requests, not hide them behind a fallback
+        except Exception as e:
+            set_outcome("fallback")
+            return fallback
+    
+    def _complete_blocking(self, call_type, request):
+        """Run a chat request on the shared sync client and return the stripped text"""
+        response = self._create(call_type, request)
+        return response.choices[0].message.content.strip()
+    
+    def _stream_or_fallback(self, call_type, request, fallback):
+        """Stream a chat request as text deltas, yielding the fallback if it fails before any text"""
+        received = False
+        try:
+            for delta in self._stream_deltas(call_type, request):
+                received = True
+                yield delta
+        except ModelCacheMiss:
+            raise
+        except Exception as e:
+            if not received:
+                set_outcome("fallback")
+                yield fallback
+            else:
+                set_outcome("error")  # Cut off part-way
+    
+    def _stream_deltas(self, call_type, request):
+        """Yield non-empty text deltas from a streamed chat completion"""
+        stream = self._create(call_type, request, stream=True)
+        started = False
+        for chunk in stream:
+            if not chunk.choices:
+                # The usage chunk comes last, with no choices
+                self._record_usage(call_type, request["model"], getattr(chunk, "usage", None))
+                continue
+            delta = chunk.choices[0].delta.content
+            if not started and delta:
+                # Match the stripped non-streaming output
+                delta = delta.lstrip()
+            if delta:
+                started = True
+                yield delta
+    
+    def _record_usage(self, call_type, model, usage):
+        """Add a response's token usage to the current turn trace and the session ledger"""
+        record_usage(usage)
+        scenario = self._turn_scenario if call_type == "coaching" else None
+        # Calls outside a turn are background pool fills - shared cost, so process totals only
+        # (history folds also run after their turn, but are this session's cost)
+        in_session = current_trace() is not None or call_type == "summary"
+        ledger = self.usage_ledger if in_session else process_usage
+        ledger.record(call_type, model, usage, scenario, persona=self.persona_key)
+    
+    def _traced_stream(self, turn_type, deltas, traces=None):
+        """
+        Yield deltas inside a turn trace, marking the first one as time to first token
+        traces: optional list the trace is appended to, so the caller can read its outcome
+        """
+        with tracer.turn(self.persona_key, turn_type) as trace:
+            if traces is not None:
+                traces.append(trace)
+            for delta in deltas:
+                trace.first_token()
+                yield delta
+    
+    def _summarize_history(self, previous_summary, messages):
+        """Fold older turns into the running conversation summary using the summary model route"""
+        response = self._create("summary", dict(
+            messages=build_summary_prompt(previous_summary, messages),
+            **model_router.params("summary", self.persona_key)
+        ))
+        return response.choices[0].message.content.strip()
+    
+    def _generate_greeting(self):
+        """Get a greeting response - served from the shared pool"""
+        request, fallback = self._greeting_request()
+        pooled = response_pool.get(self._greeting_pool_key(), lambda: self._complete_blocking("greeting", request))
+        if pooled is None:
+            set_outcome("fallback")
+        return pooled or fallback
+    
+    def _stream_greeting(self):
+        """Stream a greeting response - pooled greetings are returned whole"""
+        request, fallback = self._greeting_request()
+        pooled = response_pool.take(self._greeting_pool_key(), lambda: self._complete_blocking("greeting", request))
+        if pooled is not None:
+            return iter([pooled])
+        return self._stream_or_fallback("greeting", request, fallback)
+    
+    def _greeting_pool_key(self):
+        """Shared response pool key for greetings (not country specific)"""
+        return (self.persona_key, "greeting", None)
+    
+    @traced("prompt_build")
+    def _greeting_request(self):
+        """Build the chat request and local fallback text for the greeting message"""
+        request = dict(
+            messages=self.prompts.messages([], self.persona.greeting_prompt),
+            **model_router.params("greeting", self.persona_key)
+        )
+        fallback = self.persona.greeting_fallback
+        return request, fallback
+    
+    def _generate_crisis_response(self, user_message):
+        """Generate crisis response with appropriate helpline"""
+        if self.crisis_mode != CRISIS_MODE_MODEL:
+            # Helpline block is rendered locally - no model latency on the safety-critical path
+            return self.crisis_responder.render(self.user_country_code)
+        request, fallback = self._crisis_request(user_message)
+        return self._complete_or_fallback("crisis", request, fallback)
+    
+    def _stream_crisis_response(self, user_message):
+        """
+        Stream crisis response with appropriate helpline as text deltas
+        Local modes yield the helpline block first, then an optional model follow-up
+        """
+        request, fallback = self._crisis_request(user_message)
+        if self.crisis_mode == CRISIS_MODE_MODEL:
+            yield from self._stream_or_fallback("crisis", request, fallback)
+            return
+        
+        yield fallback
+        if self.crisis_mode != CRISIS_MODE_LOCAL_FOLLOWUP:
+            return
+        
+        started = False
+        try:
+            for delta in self._stream_deltas("crisis", self._crisis_followup_request(request, fallback)):
+                if not started:
+                    started = True
+                    yield "\n\n"
+                yield delta
+        except ModelCacheMiss:
+            raise
+        except Exception as e:
+            # The helpline is already on screen - a failed follow-up is not shown
+            set_outcome("fallback")
+    
+    def _crisis_followup_request(self, request, local_message):
+        """Crisis request extended with the follow-up-only instruction"""
+        followup = dict(request)
+        followup["messages"] = request["messages"] + [
+            {"role": "system", "content": build_followup_instruction(local_message)}
+        ]
+        followup["max_tokens"] = 120
+        return followup
+    
+    @traced("prompt_build")
+    def _crisis_request(self, user_message):
+        """Build the chat request and local fallback text for the crisis message"""
+        crisis_prompt = self._safety_prompt(self.persona.crisis_prompt, user_message)
+        
+        request = dict(
+            messages=self.prompts.messages([], crisis_prompt),
+            **model_router.params("crisis", self.persona_key)
+        )
+        fallback = self.crisis_responder.render(self.user_country_code)
+        return request, fallback
+    
+    def _generate_warning_response(self, user_message):
+        """Generate dynamic warning response for amber zone situations"""
+        request, fallback = self._warning_request(user_message)
+        return self._complete_or_fallback("warning", request, fallback)
+    
+    def _stream_warning_response(self, user_message):
+        """Stream dynamic warning response for amber zone situations as text deltas"""
+        request, fallback = self._warning_request(user_message)
+        return self._stream_or_fallback("warning", request, fallback)
+    
+    @traced("prompt_build")
+    def _warning_request(self, user_message):
+        """Build the chat request and local fallback text for the warning message"""
+        warning_prompt = self._safety_prompt(self.persona.warning_prompt, user_message)
+        
+        request = dict(
+            messages=self.prompts.messages([], warning_prompt),
+            **model_router.params("warning", self.persona_key)
+        )
+        fallback = self._safety_prompt(self.persona.warning_fallback)
+        return request, fallback
+    
+    def _safety_prompt(self, template, user_message=""):
+        """Fill a persona crisis/warning template with the client's words and local helpline"""
+        helpline = SafetyProtocol.get_helpline_for_country(self.user_country_code)
+        return template.format(
+            user_message=user_message,
+            helpline_name=helpline["name"],
+            helpline_number=helpline["number"],
+            helpline_hours=helpline["hours"],
+        )
+    
+    def reset_session(self):
+        """Reset conversation for a new session"""
+        self.conversation_history = []
+        self.history_window.reset()
+        self.is_new_session = True
+        self._cached_welcome = None
+        self.session_blocked = False
+        self._turn_scenario = None
+        self.turns.clear()
+        self.usage_ledger.reset()
+        # A stored session is not reused for the new conversation - attach a new one
+        self.session_store = None
+        self.session_id = None
+        self._persisted_summary = ""
+        self._persisted_count = 0
+    
+    def attach_session(self, store, session_id):
+        """
+        Persist this coach's conversation, summary and crisis block to a session store
+        Args:
+            store: a session_store.SessionStore
+            session_id: id from store.create_session
+        """
+        self.session_store = store
+        self.session_id = session_id
+        self._persisted_summary = self.history_window.summary
+    
+    def restore_session(self, snapshot):
+        """
+        Restore a stored session (session_store.SessionSnapshot)
+        Only the recent window and the summary are loaded, so the transcript starts at the window
+        """
+        self.conversation_history = list(snapshot.history)
+        self.history_window.restore(snapshot.history, snapshot.summary)
+        self.session_blocked = snapshot.session_blocked
+        self.is_new_session = not snapshot.history and not snapshot.summary
+        self._persisted_summary = snapshot.summary
+        self._persisted_count = snapshot.history_count
+    
+    def session_outdated(self, snapshot):
+        """
+        True if the stored session moved on without this coach (another replica answered a turn
+        or blocked it), so the coach must restore_session(snapshot) before its next turn
+        """
+        return (snapshot.history_count != self._persisted_count
+                or snapshot.session_blocked != self.session_blocked)
+    
+    def get_conversation_history(self):
+        """Return full conversation history"""
+        return self.conversation_history
+
+
+class AsyncCoachEngine(CoachEngine):
+    """
+    Async variant of CoachEngine for serving many concurrent sessions
+    Model calls go through the shared async client from llm_client; detection and prompts are shared with the sync coach
+    generate_response, get_welcome_message and the _generate_* methods return awaitables;
+    stream_response and stream_welcome_message are async generators
+    """
+    
+    async def get_welcome_message(self):
+        """Get welcome message - served from the shared pool and cached for the session"""
+        with tracer.turn(self.persona_key, "welcome"):
+            if self._cached_welcome is None:
+                request, fallback = self._welcome_request()
+                self._cached_welcome = await self._pooled_or_generate(
+                    "welcome", self._welcome_pool_key(), request, fallback
+                )
+            return self._cached_welcome
+    
+    def stream_welcome_message(self):
+        """Stream welcome message as text deltas - pooled messages are returned whole"""
+        return self._traced_stream("welcome", self._stream_welcome_turn())
+    
+    async def _stream_welcome_turn(self):
+        """Body of stream_welcome_message"""
+        if self._cached_welcome is None:
+            request, fallback = self._welcome_request()
+            key = self._welcome_pool_key()
+            factory = lambda: self._complete_blocking("welcome", request)
+            prefetching = response_pool.is_filling(key)
+            self._cached_welcome = response_pool.take(key, factory)
+            if self._cached_welcome is None and prefetching and await asyncio.to_thread(
+                response_pool.wait, key, CALL_DEADLINES["welcome"]
+            ):
+                self._cached_welcome = response_pool.take(key, factory)
+        if self._cached_welcome is not None:
+            yield self._cached_welcome
+            return
+        
+        parts = []
+        async for delta in self._stream_welcome():
+            parts.append(delta)
+            yield delta
+        self._cached_welcome = "".join(parts).strip()
+    
+    async def generate_response(self, user_message, turn_id=None):
+        """
+        Generate the coach's response based on user message without blocking the event loop
+        turn_id: optional idempotency key (see CoachEngine.generate_response)
+        """
+        record = None
+        if turn_id is not None:
+            record, owner = self.turns.begin(turn_id)
+            if not owner:
+                return self._duplicate_reply(await self.turns.wait_async(record))
+        reply = None
+        outcome = None
+        try:
+            with tracer.turn(self.persona_key) as trace:
+                reply = await self._respond(user_message)
+                outcome = trace.outcome
+            return reply
+        finally:
+            if record is not None:
+                self._end_turn(record, reply, outcome)
+    
+    async def _respond(self, user_message):
+        """Route and answer one turn (body of generate_response)"""
+        turn_type, matched_scenario = await self._route_turn_async(user_message)
+        
+        if turn_type == 'blocked':
+            return self._blocked_message()
+        if turn_type == 'greeting':
+            return await self._generate_greeting()
+        if turn_type == 'crisis':
+            return await self._generate_crisis_response(user_message)
+        if turn_type == 'warning':
+            return await self._generate_warning_response(user_message)
+        
+        await self._record_message_async("user", user_message)
+        
+        try:
+            response = await self._create_async("coaching", self._response_request(user_message, matched_scenario))
+            
+            assistant_message = response.choices[0].message.content
+            await self._record_message_async("assistant", assistant_message)
+            
+            return assistant_message
+            
+        except ModelCacheMiss:
+            raise
+        except Exception as e:
+            set_outcome("error")
+            return self._connection_error_message()
+    
+    def stream_response(self, user_message, turn_id=None):
+        """
+        Stream the coach's response as text deltas without blocking the event loop
+        turn_id: optional idempotency key (see CoachEngine.stream_response)
+        """
+        if turn_id is None:
+            return self._traced_stream(None, self._stream_turn(user_message))
+        traces = []
+        deltas = self._traced_stream(None, self._stream_turn(user_message), traces)
+        return self._idempotent_stream(turn_id, deltas, traces)
+    
+    async def _idempotent_stream(self, turn_id, deltas, traces):
+        """
+        Stream a turn once per idempotency key
+        A stream closed part-way (e.g. the client disconnected) abandons the turn, so duplicates
+        never get a truncated reply and a retry with the same key is answered again
+        traces: filled with the turn's trace by _traced_stream, for the turn's outcome
+        """
+        record, owner = self.turns.begin(turn_id)
+        if not owner:
+            await deltas.aclose()
+            yield self._duplicate_reply(await self.turns.wait_async(record))
+            return
+        parts = []
+        finished = False
+        try:
+            async for delta in deltas:
+                parts.append(delta)
+                yield delta
+            finished = True
+        finally:
+            self._end_turn(record, "".join(parts) if finished else None, traces[0].outcome if traces else None)
+    
+    async def _stream_turn(self, user_message):
+        """Route and stream one turn (body of stream_response)"""
+        turn_type, matched_scenario = await self._route_turn_async(user_message)
+        
+        if turn_type == 'blocked':
+            yield self._blocked_message()
+            return
+        if turn_type == 'greeting':
+            deltas = self._stream_greeting()
+        elif turn_type == 'crisis':
+            deltas = self._stream_crisis_response(user_message)
+        elif turn_type == 'warning':
+            deltas = self._stream_warning_response(user_message)
+        else:
+            deltas = None
+        
+        if deltas is not None:
+            async for delta in deltas:
+                yield delta
+            return
+        
+        await self._record_message_async("user", user_message)
+        
+        parts = []
+        try:
+            async for delta in self._stream_deltas("coaching", self._response_request(user_message, matched_scenario)):
+                parts.append(delta)
+                yield delta
+        except ModelCacheMiss:
+            raise
+        except Exception as e:
+            set_outcome("error")
+            if not parts:
+                yield self._connection_error_message()
+                return
+        
+        await self._record_message_async("assistant", "".join(parts))
+    
+    async def _generate_greeting(self):
+        """Get a greeting response - served from the shared pool"""
+        request, fallback = self._greeting_request()
+        return await self._pooled_or_generate("greeting", self._greeting_pool_key(), request, fallback)
+    
+    async def _stream_greeting(self):
+        """Stream a greeting response - pooled greetings are returned whole"""
+        request, fallback = self._greeting_request()
+        pooled = response_pool.take(self._greeting_pool_key(), lambda: self._complete_blocking("greeting", request))
+        if pooled is not None:
+            yield pooled
+            return
+        async for delta in self._stream_or_fallback("greeting", request, fallback):
+            yield delta
+    
+    async def _generate_crisis_response(self, user_message):
+        """Generate crisis response with appropriate helpline"""
+        if self.crisis_mode != CRISIS_MODE_MODEL:
+            return self.crisis_responder.render(self.user_country_code)
+        request, fallback = self._crisis_request(user_message)
+        return await self._complete_or_fallback("crisis", request, fallback)
+    
+    async def _stream_crisis_response(self, user_message):
+        """Stream crisis response: local helpline block first, then an optional model follow-up"""
+        request, fallback = self._crisis_request(user_message)
+        if self.crisis_mode == CRISIS_MODE_MODEL:
+            async for delta in self._stream_or_fallback("crisis", request, fallback):
+                yield delta
+            return
+        
+        yield fallback
+        if self.crisis_mode != CRISIS_MODE_LOCAL_FOLLOWUP:
+            return
+        
+        started = False
+        try:
+            async for delta in self._stream_deltas("crisis", self._crisis_followup_request(request, fallback)):
+                if not started:
+                    started = True
+                    yield "\n\n"
+                yield delta
+        except ModelCacheMiss:
+            raise
+        except Exception as e:
+            set_outcome("fallback")
+    
+    async def _pooled_or_generate(self, call_type, key, request, fallback):
+        """Take a pooled message, or generate one on the async client and add it to the pool"""
+        # Background fills run on the pool's threads with the sync client
+        pooled = response_pool.take(key, lambda: self._complete_blocking(call_type, request))
+        if pooled is None:
+            pooled = await self._complete_or_fallback(call_type, request, fallback)
+            if pooled != fallback:
+                response_pool.add(key, pooled)
+        return pooled
+    
+    async def _traced_stream(self, turn_type, deltas, traces=None):
+        """Yield deltas inside a turn trace (see CoachEngine._traced_stream)"""
+        with tracer.turn(self.persona_key, turn_type) as trace:
+            if traces is not None:
+                traces.append(trace)
+            async for delta in deltas:
+                trace.first_token()
+                yield delta
+    
+    async def _route_turn_async(self, user_message):
+        """_route_turn with the crisis block written to the session store off the event loop"""
+        turn_type, matched_scenario = self._route_turn(user_message, persist_block=False)
+        if turn_type == 'crisis' and self.session_store is not None:
+            await asyncio.to_thread(self.session_store.set_blocked, self.session_id)
+        return turn_type, matched_scenario
+    
+    async def _record_message_async(self, role, content):
+        """Add a message to the transcript and the prompt window"""
+        self.conversation_history.append({"role": role, "content": content})
+        await self.history_window.append_async(role, content)
+        if self.session_store is not None:
+            await asyncio.to_thread(self._persist_message, role, content)
+    
+    async def _summarize_history(self, previous_summary, messages):
+        """Fold older turns into the running conversation summary using the summary model route"""
+        response = await self._create_async("summary", dict(
+            messages=build_summary_prompt(previous_summary, messages),
+            **model_router.params("summary", self.persona_key)
+        ))
+        return response.choices[0].message.content.strip()
+    
+    async def _create_async(self, call_type, request, stream=False):
+        """Run a chat request on the shared async client through the resilient caller"""
+        if stream:
+            request = dict(request, stream_options={"include_usage": True})
+        attempt = {}
+
+        def send(timeout):
+            attempt["start"] = time.perf_counter()
+            return get_async_client().chat.completions.create(stream=stream, timeout=timeout, **request)
+
+        with span("summary" if call_type == "summary" else "upstream"):
+            response = await resilient_caller.call_async(call_type, send)
+        if stream:
+            return self._timed_stream(call_type, request["model"], response, attempt["start"])
+        self._record_latency(call_type, request["model"], attempt["start"])
+        self._record_usage(call_type, request["model"], getattr(response, "usage", None))
+        return response
+    
+    async def _timed_stream(self, call_type, model, stream, start):
+        """Yield a streamed response's chunks (see CoachEngine._timed_stream)"""
+        async for chunk in stream:
+            yield chunk
+        self._record_latency(call_type, model, start)
+    
+    async def _complete_or_fallback(self, call_type, request, fallback):
+        """Run a chat request and return the stripped text, or the fallback on error"""
+        try:
+            response = await self._create_async(call_type, request)
+            return response.choices[0].message.content.strip()
+        except ModelCacheMiss:
+            raise
+        except Exception as e:
+            set_outcome("fallback")
+            return fallback
+    
+    async def _stream_or_fallback(self, call_type, request, fallback):
+        """Stream a chat request as text deltas, yielding the fallback if it fails before any text"""
+        received = False
+        try:
+            async for delta in self._stream_deltas(call_type, request):
+                received = True
+                yield delta
+        except ModelCacheMiss:
+            raise
+        except Exception as e:
+            if not received:
+                set_outcome("fallback")
+                yield fallback
+            else:
+                set_outcome("error")  # Cut off part-way
+    
+    async def _stream_deltas(self, call_type, request):
+        """Yield non-empty text deltas from a streamed chat completion"""
+        stream = await self._create_async(call_type, request, stream=True)
+        started = False
+        async for chunk in stream:
+            if not chunk.choices:
+                self._record_usage(call_type, request["model"], getattr(chunk, "usage", None))
+                continue
+            delta = chunk.choices[0].delta.content
+            if not started and delta:
+                # Match the stripped non-streaming output
+                delta = delta.lstrip()
+            if delta:
+                started = True
+                yield delta
+
+
+def create_coach(persona_key, user_country_code="US"):
+    """
+    Factory function to create a coach for any registered persona
+    Args:
+        persona_key: registry key, e.g. "anne" or "hiro"
+        user_country_code: ISO country code for helpline localization
+    """
+    return CoachEngine(user_country_code, persona=persona_key)
+
+
+def create_async_coach(persona_key, user_country_code="US"):
+    """
+    Factory function to create an async coach for any registered persona
+    Args:
+        persona_key: registry key, e.g. "anne" or "hiro"
+        user_country_code: ISO country code for helpline localization
+    """
+    return AsyncCoachEngine(user_country_code, persona=persona_key)
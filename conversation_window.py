@@ -0,0 +1,314 @@
+"""
+Conversation Window
+Token-budgeted conversation history for model calls
+Keeps the most recent turns verbatim and folds older turns into a running summary
+Folding runs in the background, so a summary call never delays the turn that evicted the messages
+"""
+
+import asyncio
+import inspect
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from model_cache import ModelCacheMiss
+
+
+# Defaults sized for GPT-4's 8k context with room for the system prompt and reply
+DEFAULT_TOKEN_BUDGET = 2500
+DEFAULT_KEEP_TURNS = 6
+DEFAULT_FOLD_EVERY = 3
+DEFAULT_SUMMARY_TOKENS = 300
+
+# Per-message overhead for role and separators in the chat format
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+# Background folds for every sync window in the process (created on first use)
+FOLD_WORKERS = 4
+_fold_executor = None
+_fold_executor_lock = threading.Lock()
+
+
+def _get_fold_executor():
+    global _fold_executor
+    with _fold_executor_lock:
+        if _fold_executor is None:
+            _fold_executor = ThreadPoolExecutor(max_workers=FOLD_WORKERS, thread_name_prefix="history-fold")
+        return _fold_executor
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate (~4 characters per token for English text)
+    Returns: estimated token count
+    """
+    if not text:
+        return 0
+    return int(math.ceil(len(text) / 4.0))
+
+
+def estimate_message_tokens(message):
+    """Estimate tokens for a single chat message including format overhead"""
+    return estimate_tokens(message["content"]) + _MESSAGE_OVERHEAD_TOKENS
+
+
+def _first_sentence(text, max_chars=160):
+    text = " ".join(text.split())
+    for stop in (". ", "? ", "! "):
+        cut = text.find(stop)
+        if 0 < cut < max_chars:
+            return text[:cut + 1]
+    if len(text) > max_chars:
+        return text[:max_chars].rstrip() + "..."
+    return text
+
+
+def extractive_summary(previous_summary, messages, max_tokens=DEFAULT_SUMMARY_TOKENS):
+    """
+    Local summarizer: keeps the first sentence of each folded message
+    Oldest lines are dropped first once the summary exceeds max_tokens
+    Returns: updated summary text
+    """
+    lines = previous_summary.splitlines() if previous_summary else []
+    for message in messages:
+        speaker = "Client" if message["role"] == "user" else "Coach"
+        lines.append(f"- {speaker}: {_first_sentence(message['content'])}")
+
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def build_summary_prompt(previous_summary, messages, max_tokens=DEFAULT_SUMMARY_TOKENS):
+    """
+    Build the chat messages for a model-written summary update
+    Returns: list of chat messages
+    """
+    transcript = "\n".join(
+        f"{'Client' if message['role'] == 'user' else 'Coach'}: {message['content']}"
+        for message in messages
+    )
+    prompt = f"""You maintain a running summary of a coaching conversation.
+
+CURRENT SUMMARY:
+{previous_summary or "(empty)"}
+
+NEW EXCHANGES TO FOLD IN:
+{transcript}
+
+Rewrite the summary so it includes the new exchanges. Keep:
+- What the client is dealing with and how they feel about it
+- Insights, commitments, and next steps that were agreed
+- Any safety concerns that came up
+
+Write in third person, plain bullet points, under {max_tokens * 3 // 4} words.
+"""
+    return [{"role": "system", "content": prompt}]
+
+
+class ConversationWindow:
+    """
+    History sent to the model on each turn
+    The last keep_turns exchanges stay verbatim; older ones are folded into a summary
+    Evicted messages are sent verbatim after the previous summary until their fold finishes
+    """
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, keep_turns=DEFAULT_KEEP_TURNS,
+                 fold_every=DEFAULT_FOLD_EVERY, summary_tokens=DEFAULT_SUMMARY_TOKENS,
+                 summarizer=None, background=True):
+        """
+        Args:
+            token_budget: max estimated tokens for summary + verbatim messages
+            keep_turns: user/assistant exchanges always kept verbatim
+            fold_every: extra exchanges allowed before folding, so summaries are batched
+            summary_tokens: target size of the running summary
+            summarizer: callable(previous_summary, messages) -> new summary
+            background: fold off the calling turn (False folds inline, e.g. for replayable runs)
+        """
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.fold_every = fold_every
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+        self.background = background
+        self.messages = []
+        self.summary = ""
+        self.pending = []  # Evicted messages not yet folded into the summary
+        self._message_tokens = 0
+        self._fold = None  # Future or Task of the running background fold
+        self._generation = 0  # Bumped by restore/reset so a stale fold is dropped
+        self._lock = threading.Lock()
+
+    def append(self, role, content):
+        """Add a message and fold older turns if the window is over budget"""
+        evicted = self._push(role, content)
+        if not evicted:
+            return
+        if not self.background:
+            self.summary = self._summarize(self.summary, evicted)
+            return
+        with self._lock:
+            self.pending.extend(evicted)
+        self._start_fold()
+
+    async def append_async(self, role, content):
+        """
+        Async variant of append for coaches running on an event loop
+        The summarizer may be a coroutine function
+        """
+        evicted = self._push(role, content)
+        if not evicted:
+            return
+        if not self.background:
+            self.summary = await self._summarize_async(self.summary, evicted)
+            return
+        with self._lock:
+            self.pending.extend(evicted)
+        self._start_fold_async()
+
+    def token_count(self):
+        """Estimated tokens for the history this window sends"""
+        return self._message_tokens + estimate_tokens(self.summary)
+
+    def saved_state(self):
+        """
+        Summary and the count of messages not folded into it yet, read together for a session store
+        Returns: (summary, verbatim message count)
+        """
+        with self._lock:
+            return self.summary, len(self.pending) + len(self.messages)
+
+    def build_messages(self):
+        """
+        History to send to the model: summary (if any), messages still being folded, recent messages
+        Returns: list of chat messages
+        """
+        with self._lock:
+            summary = self.summary
+            messages = self.pending + self.messages
+        if not summary:
+            return messages
+        summary_message = {
+            "role": "system",
+            "content": f"SUMMARY OF THE EARLIER CONVERSATION:\n{summary}",
+        }
+        return [summary_message] + messages
+
+    def restore(self, messages, summary=""):
+        """
+        Load a saved window (e.g. from a session store) without re-summarizing anything
+        Args:
+            messages: messages that were still verbatim in the window
+            summary: running summary of everything older
+        """
+        with self._lock:
+            self._generation += 1
+            self._fold = None
+            self.pending = []
+            self.messages = [{"role": message["role"], "content": message["content"]} for message in messages]
+            self.summary = summary or ""
+            self._message_tokens = sum(estimate_message_tokens(message) for message in self.messages)
+
+    def reset(self):
+        """Clear summary and messages"""
+        self.restore([])
+
+    def _push(self, role, content):
+        """
+        Add a message and evict older ones if the window is over budget
+        Returns: list of evicted messages still to be folded into the summary
+        """
+        message = {"role": role, "content": content}
+        with self._lock:
+            self.messages.append(message)
+            self._message_tokens += estimate_message_tokens(message)
+
+            keep_messages = self.keep_turns * 2
+            over_turns = len(self.messages) >= keep_messages + self.fold_every * 2
+            over_budget = self.token_count() > self.token_budget
+            if not over_turns and not over_budget:
+                return []
+
+            evicted = []
+            while len(self.messages) > keep_messages:
+                evicted.append(self._pop_oldest())
+            # A few very long messages can still exceed the budget - fold them too
+            while len(self.messages) > 1 and self.token_count() > self.token_budget:
+                evicted.append(self._pop_oldest())
+            return evicted
+
+    def _pop_oldest(self):
+        message = self.messages.pop(0)
+        self._message_tokens -= estimate_message_tokens(message)
+        return message
+
+    def _next_fold(self):
+        """
+        Claim the pending messages for a new fold, unless one is already running
+        Returns: (generation, previous summary, messages to fold), or None
+        """
+        if self._fold is not None or not self.pending:
+            return None
+        return self._generation, self.summary, list(self.pending)
+
+    def _start_fold(self):
+        with self._lock:
+            job = self._next_fold()
+            if job is None:
+                return
+            self._fold = _get_fold_executor().submit(self._run_fold, *job)
+
+    def _run_fold(self, generation, previous_summary, batch):
+        summary = self._summarize(previous_summary, batch)
+        if self._finish_fold(generation, summary, batch):
+            self._start_fold()
+
+    def _start_fold_async(self):
+        with self._lock:
+            job = self._next_fold()
+            if job is None:
+                return
+            self._fold = asyncio.get_running_loop().create_task(self._run_fold_async(*job))
+
+    async def _run_fold_async(self, generation, previous_summary, batch):
+        summary = await self._summarize_async(previous_summary, batch)
+        if self._finish_fold(generation, summary, batch):
+            self._start_fold_async()
+
+    def _finish_fold(self, generation, summary, batch):
+        """
+        Replace the summary and drop the folded messages from pending
+        Returns: True if more messages were evicted while this fold ran
+        """
+        with self._lock:
+            if generation != self._generation:
+                return False  # Restored or reset while folding
+            self.summary = summary
+            del self.pending[:len(batch)]
+            self._fold = None
+            return bool(self.pending)
+
+    def _summarize(self, previous_summary, evicted):
+        if self.summarizer is not None:
+            try:
+                summary = self.summarizer(previous_summary, evicted)
+                if summary:
+                    return summary
+            except ModelCacheMiss:
+                raise  # Replay runs must not hide an unrecorded request behind the fallback
+            except Exception:
+                pass
+        return extractive_summary(previous_summary, evicted, self.summary_tokens)
+
+    async def _summarize_async(self, previous_summary, evicted):
+        summary = None
+        if self.summarizer is not None:
+            try:
+                summary = self.summarizer(previous_summary, evicted)
+                if inspect.isawaitable(summary):
+                    summary = await summary
+            except ModelCacheMiss:
+                raise
+            except Exception:
+                summary = None
+        return summary or extractive_summary(previous_summary, evicted, self.summary_tokens)
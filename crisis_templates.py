@@ -0,0 +1,65 @@
+"""
+Local Crisis Responses
+Persona-voiced crisis messages with helpline details, rendered for every country at import time
+The helpline reaches the client immediately - no model call on the safety-critical path
+"""
+
+from anne_rosental_prompt import SafetyProtocol
+
+
+# Crisis handling modes
+CRISIS_MODE_MODEL = "model"                    # Model-written response (local text only on error)
+CRISIS_MODE_LOCAL = "local"                    # Local helpline response only
+CRISIS_MODE_LOCAL_FOLLOWUP = "local_followup"  # Local helpline response, then a streamed model follow-up
+
+CRISIS_MODES = (CRISIS_MODE_MODEL, CRISIS_MODE_LOCAL, CRISIS_MODE_LOCAL_FOLLOWUP)
+DEFAULT_CRISIS_MODE = CRISIS_MODE_LOCAL_FOLLOWUP
+
+
+class LocalCrisisResponder:
+    """
+    Precompiled crisis messages for one persona, one per helpline country
+    Templates use {helpline_name}, {helpline_number} and {helpline_hours}
+    """
+
+    def __init__(self, template, helplines=None):
+        if helplines is None:
+            helplines = SafetyProtocol.helplines
+        self.template = template
+        self._messages = {
+            country_code: template.format(
+                helpline_name=helpline["name"],
+                helpline_number=helpline["number"],
+                helpline_hours=helpline["hours"],
+            )
+            for country_code, helpline in helplines.items()
+        }
+
+    def render(self, country_code):
+        """
+        Returns: the crisis message for the country (international fallback if unknown)
+        """
+        message = self._messages.get(country_code)
+        if message is None:
+            message = self._messages["DEFAULT"]
+        return message
+
+
+def build_followup_instruction(local_message):
+    """
+    Instruction for the optional model-written follow-up after the local crisis message
+    Returns: instruction text appended to the crisis request
+    """
+    return f"""=== FOLLOW-UP ONLY ===
+
+The client has ALREADY been shown this message, including the helpline details:
+\"\"\"
+{local_message}
+\"\"\"
+
+Write ONLY a short follow-up (2-3 sentences) in your own voice that:
+- Responds to what the client actually shared, with deep empathy
+- Encourages them to reach out to the helpline right now
+- Does NOT repeat the helpline name, number, or the text above
+- Does NOT continue coaching or ask questions
+"""
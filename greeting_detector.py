@@ -0,0 +1,64 @@
+"""
+Greeting Detection
+Word-level check for short messages that are only a greeting
+"Hi Anne!" is a greeting; "this is too much" or "hi, I can't sleep" are not
+"""
+
+import re
+
+from keyword_matcher import normalize_text
+
+
+# Longest message (in words) still treated as a pure greeting
+MAX_GREETING_WORDS = 5
+
+GREETING_WORDS = {"hi", "hello", "hey", "hallo", "greetings", "hiya", "howdy"}
+
+GREETING_PHRASES = [
+    ("good", "morning"),
+    ("good", "afternoon"),
+    ("good", "evening"),
+]
+
+# Words that may follow a greeting without adding content ("hi there", "hello again")
+FILLER_WORDS = {"there", "again", "all", "coach", "dr", "doctor"}
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+class GreetingDetector:
+    """
+    Detects messages that contain nothing but a greeting, optionally addressed to the coach
+    """
+
+    def __init__(self, coach_names=()):
+        """
+        Args:
+            coach_names: words the client may use to address the coach (e.g. "anne", "rosental")
+        """
+        self.filler_words = FILLER_WORDS | {name.lower() for name in coach_names}
+
+    def is_greeting(self, message, normalized=None):
+        """
+        Args:
+            normalized: optional pre-normalized text (see keyword_matcher.normalize_text)
+        Returns: True if the message is only a greeting
+        """
+        if normalized is None:
+            normalized = normalize_text(message)
+        words = _WORD.findall(normalized)
+        if not words or len(words) > MAX_GREETING_WORDS:
+            return False
+
+        rest = None
+        if words[0] in GREETING_WORDS:
+            rest = words[1:]
+        else:
+            for phrase in GREETING_PHRASES:
+                if tuple(words[:len(phrase)]) == phrase:
+                    rest = words[len(phrase):]
+                    break
+        if rest is None:
+            return False
+
+        return all(word in self.filler_words or word in GREETING_WORDS for word in rest)
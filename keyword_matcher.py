@@ -0,0 +1,199 @@
+"""
+Keyword Matching Engine
+Aho-Corasick automaton that finds every keyword hit in a single pass over the message
+Used for safety detection so cost does not grow with the size of the keyword lists
+"""
+
+import threading
+from collections import deque, namedtuple
+
+from anne_rosental_prompt import SafetyProtocol
+
+
+# A single keyword hit: offsets are into the original message
+KeywordMatch = namedtuple("KeywordMatch", ["keyword", "start", "end", "payload"])
+
+# A single safety hit: zone is 'crisis' or 'warning'
+SafetyHit = namedtuple("SafetyHit", ["keyword", "start", "end", "zone"])
+
+# Typographic variants folded to their plain equivalents (1:1 so offsets stay valid)
+_CHAR_FOLDS = str.maketrans({
+    "‘": "'", "’": "'", "ʼ": "'", "′": "'",
+    "“": '"', "”": '"',
+    "–": "-", "—": "-",
+    " ": " ",
+})
+
+
+def normalize_text(text):
+    """
+    Lowercase and fold typographic characters without changing string length
+    Returns: normalized text whose offsets line up with the input
+    """
+    folded = text.translate(_CHAR_FOLDS)
+    lowered = folded.lower()
+    if len(lowered) == len(folded):
+        return lowered
+    # Some characters expand when lowercased - keep those as-is to preserve offsets
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in folded)
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+class KeywordMatcher:
+    """
+    Multi-keyword matcher built once and reused for every message
+    Matches respect word boundaries, so "attack" does not fire inside "counterattack" or "attacks";
+    with prefix_matches the right boundary is not checked, so "attacks" and "jumping" do match
+    """
+
+    def __init__(self, entries, prefix_matches=False):
+        """
+        Args:
+            entries: iterable of (keyword, payload) pairs
+            prefix_matches: also match keywords followed by more letters (inflected forms)
+        """
+        self.prefix_matches = prefix_matches
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._keywords = []
+
+        for keyword, payload in entries:
+            normalized = normalize_text(keyword.strip())
+            if not normalized:
+                continue
+            self._add(normalized, keyword, payload)
+
+        self._build_failure_links()
+
+    def __len__(self):
+        return len(self._keywords)
+
+    def _add(self, normalized, keyword, payload):
+        state = 0
+        for char in normalized:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(len(self._keywords))
+        self._keywords.append((keyword, len(normalized), payload))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                # Inherit the outputs of the longest proper suffix
+                self._output[next_state] = (
+                    self._output[next_state] + self._output[self._fail[next_state]]
+                )
+
+    def find_all(self, text, normalized=None):
+        """
+        Find every keyword occurrence in text
+        Args:
+            text: original message
+            normalized: optional pre-normalized text (see normalize_text)
+        Returns: list of KeywordMatch ordered by position
+        """
+        if normalized is None:
+            normalized = normalize_text(text)
+
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        keywords = self._keywords
+        length = len(normalized)
+        check_right = not self.prefix_matches
+
+        matches = []
+        state = 0
+        for index, char in enumerate(normalized):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not output[state]:
+                continue
+
+            end = index + 1
+            if check_right and end < length and _is_word_char(normalized[end]):
+                continue
+            for keyword_id in output[state]:
+                keyword, size, payload = keywords[keyword_id]
+                start = end - size
+                if start > 0 and _is_word_char(normalized[start - 1]):
+                    continue
+                matches.append(KeywordMatch(keyword, start, end, payload))
+
+        matches.sort(key=lambda match: (match.start, -match.end))
+        return matches
+
+
+class SafetyMatcher:
+    """
+    Crisis and warning keyword detection for SafetyProtocol
+    One automaton covers both zones; crisis hits take priority
+    Only the left word boundary is checked: missing an inflected crisis phrase
+    ("overdosed", "jumping off") is worse than a false alarm
+    """
+
+    CRISIS = "crisis"
+    WARNING = "warning"
+
+    def __init__(self, crisis_keywords, warning_keywords):
+        entries = [(keyword, self.CRISIS) for keyword in crisis_keywords]
+        entries += [(keyword, self.WARNING) for keyword in warning_keywords]
+        self._matcher = KeywordMatcher(entries, prefix_matches=True)
+
+    def find_hits(self, text, normalized=None):
+        """
+        Returns: list of SafetyHit (keyword, start, end, zone) for every hit in text
+        """
+        return [
+            SafetyHit(match.keyword, match.start, match.end, match.payload)
+            for match in self._matcher.find_all(text, normalized)
+        ]
+
+    def classify(self, hits):
+        """
+        Reduce a list of hits to a single zone
+        Returns: 'crisis', 'warning', or None
+        """
+        zones = {hit.zone for hit in hits}
+        if self.CRISIS in zones:
+            return self.CRISIS
+        if self.WARNING in zones:
+            return self.WARNING
+        return None
+
+
+_safety_matcher = None
+_safety_matcher_lock = threading.Lock()
+
+
+def get_safety_matcher():
+    """
+    Get the process-wide SafetyMatcher, building it on first use
+    """
+    global _safety_matcher
+    if _safety_matcher is None:
+        with _safety_matcher_lock:
+            if _safety_matcher is None:
+                _safety_matcher = SafetyMatcher(
+                    SafetyProtocol.crisis_keywords,
+                    SafetyProtocol.warning_keywords,
+                )
+    return _safety_matcher
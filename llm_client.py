@@ -0,0 +1,193 @@
+"""
+LLM Client Provider
+Lazily created OpenAI clients shared by every coach in the process
+Connection pooling, keep-alive and timeouts are configured in one place
+"""
+
+import os
+import threading
+
+
+class ClientSettings:
+    """
+    Connection settings for the shared OpenAI clients
+    Every value can be overridden with an environment variable (see .env.example)
+    Client-level retries default to off: resilience.ResilientCaller owns retries and backoff
+    cache_mode (record, replay or auto) puts the clients behind model_cache's record/replay store
+    """
+
+    def __init__(self, api_key=None, base_url=None, max_connections=100,
+                 max_keepalive_connections=20, keepalive_expiry=30.0,
+                 timeout=60.0, connect_timeout=5.0, max_retries=0,
+                 cache_mode=None, cache_dir="model_cache", cache_latency="none"):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.cache_mode = cache_mode
+        self.cache_dir = cache_dir
+        self.cache_latency = cache_latency
+
+    @classmethod
+    def from_env(cls):
+        """Build settings from environment variables, falling back to defaults"""
+        defaults = cls()
+        return cls(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", defaults.max_connections)),
+            max_keepalive_connections=int(
+                os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", defaults.max_keepalive_connections)
+            ),
+            keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", defaults.keepalive_expiry)),
+            timeout=float(os.getenv("OPENAI_TIMEOUT", defaults.timeout)),
+            connect_timeout=float(os.getenv("OPENAI_CONNECT_TIMEOUT", defaults.connect_timeout)),
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", defaults.max_retries)),
+            cache_mode=os.getenv("COACH_MODEL_CACHE") or None,
+            cache_dir=os.getenv("COACH_MODEL_CACHE_DIR", defaults.cache_dir),
+            cache_latency=os.getenv("COACH_MODEL_CACHE_LATENCY", defaults.cache_latency),
+        )
+
+    def model_cache(self):
+        """Returns: a model_cache.ModelCache for cache_mode, or None when recording/replay is off"""
+        if not self.cache_mode:
+            return None
+        from model_cache import ModelCache
+
+        return ModelCache(self.cache_mode, self.cache_dir, self.cache_latency)
+
+    def client_kwargs(self, http_client):
+        """Keyword arguments for OpenAI / AsyncOpenAI"""
+        kwargs = {
+            "api_key": self.api_key,
+            "max_retries": self.max_retries,
+            "http_client": http_client,
+        }
+        if self.base_url:
+            kwargs["base_url"] = self.base_url
+        return kwargs
+
+    def http_client_kwargs(self):
+        """Keyword arguments for the pooled httpx client"""
+        import httpx
+
+        return {
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            "timeout": httpx.Timeout(self.timeout, connect=self.connect_timeout),
+        }
+
+
+_lock = threading.Lock()
+_settings = None
+_client = None
+_async_client = None
+
+
+def _load_settings():
+    global _settings
+    if _settings is None:
+        from dotenv import load_dotenv
+
+        # Load environment variables
+        load_dotenv()
+        _settings = ClientSettings.from_env()
+    return _settings
+
+
+def configure(settings=None, **overrides):
+    """
+    Replace the connection settings used for clients created from now on
+    Existing clients are dropped so the next call builds them with the new settings
+    Args:
+        settings: a ClientSettings instance (defaults to the environment)
+        overrides: individual ClientSettings fields to change
+    """
+    global _settings, _client, _async_client
+    with _lock:
+        if settings is None:
+            settings = _load_settings()
+        for name, value in overrides.items():
+            if not hasattr(settings, name):
+                raise TypeError(f"Unknown client setting: {name}")
+            setattr(settings, name, value)
+        _settings = settings
+        _client = None
+        _async_client = None
+
+
+def get_settings():
+    """Get the active connection settings"""
+    with _lock:
+        return _load_settings()
+
+
+def _create_client(settings):
+    from openai import OpenAI, DefaultHttpxClient
+
+    http_client = DefaultHttpxClient(**settings.http_client_kwargs())
+    return OpenAI(**settings.client_kwargs(http_client))
+
+
+def _create_async_client(settings):
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    http_client = DefaultAsyncHttpxClient(**settings.http_client_kwargs())
+    return AsyncOpenAI(**settings.client_kwargs(http_client))
+
+
+def get_client():
+    """
+    Get the shared OpenAI client, creating it on first use
+    With a cache_mode set, the client records/replays through model_cache and only creates the
+    real client on a cache miss
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                settings = _load_settings()
+                cache = settings.model_cache()
+                if cache is None:
+                    _client = _create_client(settings)
+                else:
+                    from model_cache import CachedClient
+
+                    _client = CachedClient(cache, lambda: _create_client(settings))
+    return _client
+
+
+def get_async_client():
+    """
+    Get the shared AsyncOpenAI client, creating it on first use (see get_client for cache_mode)
+    """
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                settings = _load_settings()
+                cache = settings.model_cache()
+                if cache is None:
+                    _async_client = _create_async_client(settings)
+                else:
+                    from model_cache import AsyncCachedClient
+
+                    _async_client = AsyncCachedClient(cache, lambda: _create_async_client(settings))
+    return _async_client
+
+
+def set_client(client=None, async_client=None):
+    """
+    Inject clients (e.g. test doubles); pass None to go back to lazy creation
+    """
+    global _client, _async_client
+    with _lock:
+        _client = client
+        _async_client = async_client
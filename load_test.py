@@ -0,0 +1,384 @@
+"""
+Coach Load Test
+Drives scripted multi-turn sessions through the Anne and Hiro coaches at a chosen
+concurrency and reports p50 / p95 / p99 latency per turn type
+Every turn's outcome (ok, fallback or error) comes from its trace; only ok turns count towards
+the percentiles, and fallback / error turns are reported per turn type
+By default an in-process stub server (stub_server.py) stands in for OpenAI, so no tokens are spent
+
+Run: python load_test.py --sessions 200 --concurrency 20
+     python load_test.py --mode async --stream --latency 0.8 --error-rate 0.02
+     python load_test.py --base-url http://127.0.0.1:8100/v1   # external stub server
+     python load_test.py --base-url https://api.openai.com/v1 --cache record --sessions 20
+     python load_test.py --cache replay --cache-latency original   # recorded responses, no server
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_client
+import stub_server
+from turn_tracing import tracer, OUTCOMES
+
+
+# Scripted sessions: the welcome message, then these client turns in order
+SESSION_SCRIPTS = [
+    [
+        "Hi",
+        "I feel completely overwhelmed by everything at work",
+        "I keep putting off the project I care about most",
+        "Maybe I could start with ten minutes tomorrow",
+    ],
+    [
+        "Hello there",
+        "I can't decide whether to take the new job offer",
+        "I'm scared of making the wrong choice",
+        "Lately I just feel numb and nothing matters",
+        "Thank you, I'll think about talking to someone",
+    ],
+    [
+        "I keep overthinking every conversation I have",
+        "My partner and I argue about the same things",
+        "Sometimes I feel lonely even with friends around",
+    ],
+    [
+        "Hey",
+        "I've been thinking I want to end my life",
+        "Are you still there?",
+    ],
+]
+
+PERSONAS = ("anne", "hiro")
+TURN_TYPES = ("welcome", "greeting", "coaching", "warning", "crisis", "blocked")
+PERCENTILES = (50, 95, 99)
+
+# Outcomes of the turns the current session ran, filled by OutcomeSink
+_session_outcomes = contextvars.ContextVar("load_test_outcomes", default=None)
+
+
+def _coach_factory(persona, mode):
+    import anne_rosental_coach, hiro_lin_coach  # Register the personas
+    from coach_engine import create_coach, create_async_coach
+
+    create = create_async_coach if mode == "async" else create_coach
+    return lambda: create(persona)
+
+
+def classify_turn(coach, user_message):
+    """
+    Turn type the coach will use for this message, using only its public detectors
+    Returns: one of TURN_TYPES
+    """
+    if coach.session_blocked:
+        return "blocked"
+    safety_level = coach.detect_safety_issue(user_message)
+    if safety_level:
+        return safety_level
+    if coach.is_greeting(user_message):
+        return "greeting"
+    return "coaching"
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class OutcomeSink:
+    """
+    Trace sink that hands each finished turn's outcome to the session that ran it
+    Turns run (and their traces finish) in the session's own thread or task context
+    """
+
+    def emit(self, record):
+        outcomes = _session_outcomes.get()
+        if outcomes is not None:
+            outcomes.append(record["outcome"])
+
+
+def _start_turn():
+    """Returns: the list the next turn's outcome is appended to"""
+    outcomes = _session_outcomes.get()
+    if outcomes is None:
+        outcomes = []
+        _session_outcomes.set(outcomes)
+    outcomes.clear()
+    return outcomes
+
+
+def _turn_outcome(outcomes):
+    """The most severe outcome traced for a turn (a turn without a trace counts as ok)"""
+    return max(outcomes, key=OUTCOMES.index, default="ok")
+
+
+class LatencyRecorder:
+    """
+    Thread-safe collection of latency samples keyed by (persona, turn type, metric)
+    and turn outcome counts keyed by (persona, turn type, outcome)
+    """
+
+    def __init__(self):
+        self._samples = defaultdict(list)
+        self._outcomes = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record_turn(self, persona, turn_type, outcome, samples):
+        """
+        Count a finished turn; its latency samples ({metric: seconds}) are kept only if it was ok
+        A fallback or an error reply is fast and would make the percentiles look better than they are
+        """
+        with self._lock:
+            self._outcomes[(persona, turn_type, outcome)] += 1
+            if outcome != "ok":
+                return
+            for metric, seconds in samples.items():
+                self._samples[(persona, turn_type, metric)].append(seconds)
+
+    def outcomes(self):
+        """
+        Returns: list of dicts with persona, turn_type and a count per outcome
+        """
+        counts = defaultdict(dict)
+        with self._lock:
+            for (persona, turn_type, outcome), count in self._outcomes.items():
+                counts[(persona, turn_type)][outcome] = count
+        return [
+            dict({"persona": persona, "turn_type": turn_type},
+                 **{outcome: by_outcome.get(outcome, 0) for outcome in OUTCOMES})
+            for (persona, turn_type), by_outcome in sorted(
+                counts.items(), key=lambda item: (item[0][0], TURN_TYPES.index(item[0][1]))
+            )
+        ]
+
+    def summary(self):
+        """
+        Returns: list of dicts with persona, turn_type, metric, count and percentiles in ms (ok turns only)
+        """
+        rows = []
+        with self._lock:
+            items = sorted(
+                self._samples.items(),
+                key=lambda item: (item[0][0], TURN_TYPES.index(item[0][1]), item[0][2]),
+            )
+        for (persona, turn_type, metric), samples in items:
+            values = sorted(samples)
+            row = {"persona": persona, "turn_type": turn_type, "metric": metric, "count": len(values)}
+            for pct in PERCENTILES:
+                row[f"p{pct}_ms"] = round(percentile(values, pct) * 1000, 1)
+            rows.append(row)
+        return rows
+
+
+def run_session(persona, script, recorder, stream=False):
+    """Run one scripted session on a sync coach"""
+    coach = _coach_factory(persona, "sync")()
+    welcome = coach.stream_welcome_message if stream else coach.get_welcome_message
+    reply = coach.stream_response if stream else coach.generate_response
+
+    _run_turn(recorder, persona, "welcome", welcome, stream)
+    for user_message in script:
+        turn_type = classify_turn(coach, user_message)
+        _run_turn(recorder, persona, turn_type, lambda: reply(user_message), stream)
+
+
+def _run_turn(recorder, persona, turn_type, call, stream):
+    """
+    Time one turn and record it with its traced outcome
+    call: runs the turn; returns the reply's delta stream when stream is set
+    """
+    outcomes = _start_turn()
+    start = time.perf_counter()
+    first = None
+    try:
+        if stream:
+            for _ in call():
+                if first is None:
+                    first = time.perf_counter()
+        else:
+            call()
+    except Exception:
+        # e.g. ModelCacheMiss in replay mode - counted, and the session goes on
+        outcomes.append("error")
+    _record_turn(recorder, persona, turn_type, outcomes, start, first)
+
+
+async def run_session_async(persona, script, recorder, stream=False):
+    """Run one scripted session on an async coach"""
+    coach = _coach_factory(persona, "async")()
+    welcome = coach.stream_welcome_message if stream else coach.get_welcome_message
+    reply = coach.stream_response if stream else coach.generate_response
+
+    await _run_turn_async(recorder, persona, "welcome", welcome, stream)
+    for user_message in script:
+        turn_type = classify_turn(coach, user_message)
+        await _run_turn_async(recorder, persona, turn_type, lambda: reply(user_message), stream)
+
+
+async def _run_turn_async(recorder, persona, turn_type, call, stream):
+    """Async variant of _run_turn; call returns an async delta stream or a coroutine"""
+    outcomes = _start_turn()
+    start = time.perf_counter()
+    first = None
+    try:
+        if stream:
+            async for _ in call():
+                if first is None:
+                    first = time.perf_counter()
+        else:
+            await call()
+    except Exception:
+        outcomes.append("error")
+    _record_turn(recorder, persona, turn_type, outcomes, start, first)
+
+
+def _record_turn(recorder, persona, turn_type, outcomes, start, first):
+    samples = {"total": time.perf_counter() - start}
+    if first is not None:
+        samples["ttft"] = first - start
+    recorder.record_turn(persona, turn_type, _turn_outcome(outcomes), samples)
+
+
+def _session_plan(sessions, personas):
+    """Sessions alternate personas; each persona cycles through every script"""
+    return [
+        (personas[i % len(personas)], SESSION_SCRIPTS[(i // len(personas)) % len(SESSION_SCRIPTS)])
+        for i in range(sessions)
+    ]
+
+
+def run_load(sessions=100, concurrency=10, mode="sync", stream=False, personas=PERSONAS):
+    """
+    Run the scripted sessions against whatever endpoint llm_client is configured for
+    Returns: (LatencyRecorder, wall-clock seconds)
+    """
+    recorder = LatencyRecorder()
+    plan = _session_plan(sessions, personas)
+    sinks = tracer.sinks
+    tracer.add_sink(OutcomeSink())
+    start = time.perf_counter()
+    try:
+        _run_plan(plan, recorder, concurrency, mode, stream)
+    finally:
+        tracer.set_sinks(sinks)
+    return recorder, time.perf_counter() - start
+
+
+def _run_plan(plan, recorder, concurrency, mode, stream):
+    if mode == "async":
+        async def run_all():
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def bounded(persona, script):
+                async with semaphore:
+                    await run_session_async(persona, script, recorder, stream)
+
+            await asyncio.gather(*(bounded(persona, script) for persona, script in plan))
+
+        asyncio.run(run_all())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(run_session, persona, script, recorder, stream)
+                       for persona, script in plan]
+            for future in futures:
+                future.result()
+
+
+def format_report(rows, elapsed, sessions, outcomes=()):
+    """Returns: a plain-text table of the latency summary (ok turns) and the turn outcome counts"""
+    header = f"{'persona':<8}{'turn':<10}{'metric':<8}{'count':>7}" + "".join(
+        f"{f'p{pct} ms':>10}" for pct in PERCENTILES
+    )
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(
+            f"{row['persona']:<8}{row['turn_type']:<10}{row['metric']:<8}{row['count']:>7}"
+            + "".join(f"{row[f'p{pct}_ms']:>10}" for pct in PERCENTILES)
+        )
+    if outcomes:
+        header = f"{'persona':<8}{'turn':<10}" + "".join(f"{outcome:>10}" for outcome in OUTCOMES)
+        lines += ["", header, "-" * len(header)]
+        for row in outcomes:
+            lines.append(
+                f"{row['persona']:<8}{row['turn_type']:<10}"
+                + "".join(f"{row[outcome]:>10}" for outcome in OUTCOMES)
+            )
+    lines.append("")
+    lines.append(f"{sessions} sessions in {elapsed:.2f}s ({sessions / elapsed:.1f} sessions/s)")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the coaches against a stub OpenAI server")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync",
+                        help="threads with sync coaches, or asyncio with async coaches")
+    parser.add_argument("--stream", action="store_true", help="stream responses and report TTFT")
+    parser.add_argument("--persona", choices=PERSONAS + ("both",), default="both")
+    parser.add_argument("--base-url", default=None,
+                        help="use an already running server instead of the in-process stub")
+    parser.add_argument("--json", dest="json_path", default=None, help="also write the summary as JSON")
+    parser.add_argument("--cache", choices=("record", "replay", "auto"), default=None,
+                        help="record model responses to --cache-dir, or replay them (see model_cache.py)")
+    parser.add_argument("--cache-dir", default="model_cache", help="recorded responses directory")
+    parser.add_argument("--cache-latency", default="none",
+                        help="replay latency: none, original, or seconds to first token")
+    stub_server.add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    # Pure replay never reaches upstream, so there is nothing to start
+    if base_url is None and args.cache != "replay":
+        server = stub_server.start_server(stub_server.settings_from_args(args))
+        base_url = server.base_url
+    settings = llm_client.get_settings()
+    llm_client.configure(
+        base_url=base_url,
+        api_key=(settings.api_key or "stub") if args.base_url else "stub",
+        max_connections=max(args.concurrency, settings.max_connections),
+        cache_mode=args.cache,
+        cache_dir=args.cache_dir,
+        cache_latency=args.cache_latency,
+    )
+
+    personas = PERSONAS if args.persona == "both" else (args.persona,)
+    try:
+        recorder, elapsed = run_load(args.sessions, args.concurrency, args.mode, args.stream, personas)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    rows = recorder.summary()
+    outcomes = recorder.outcomes()
+    print(format_report(rows, elapsed, args.sessions, outcomes))
+    if args.cache:
+        client = llm_client.get_async_client() if args.mode == "async" else llm_client.get_client()
+        stats = client.cache.stats()
+        print(f"model cache ({stats['mode']}): {stats['hits']} hits, {stats['misses']} misses")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "sessions": args.sessions,
+                "concurrency": args.concurrency,
+                "mode": args.mode,
+                "stream": args.stream,
+                "elapsed_seconds": round(elapsed, 3),
+                "results": rows,
+                "outcomes": outcomes,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
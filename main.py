@@ -3,9 +3,17 @@ AI Coaching System - Streamlit Frontend
 Multi-coach platform with Dr. Anne Rosental and Hiro Lin
 """
 
+import uuid
+
 import streamlit as st
 from anne_rosental_coach import create_anne_coach
 from hiro_lin_coach import create_hiro_coach
+from turn_tracing import tracer
+from usage_ledger import process_usage
+from session_store import get_session_store
+
+# Turn trace sinks from COACH_TRACE_SINKS (only the first run adds them)
+tracer.configure_from_env()
 
 # Page configuration
 st.set_page_config(
@@ -79,17 +87,154 @@ if 'messages' not in st.session_state:
     st.session_state.messages = []
 if 'country_code' not in st.session_state:
     st.session_state.country_code = "US"
+if 'pending_welcome' not in st.session_state:
+    st.session_state.pending_welcome = False
+if 'last_turn' not in st.session_state:
+    st.session_state.last_turn = None
+if 'prefetched_country' not in st.session_state:
+    st.session_state.prefetched_country = None
+
+# Coach names and factories by persona key (used to restore stored sessions)
+COACHES = {
+    "anne": ("Dr. Anne Rosental", create_anne_coach),
+    "hiro": ("Hiro Lin", create_hiro_coach),
+}
+
+
+def prefetch_welcomes(country_code):
+    """
+    Start both coaches' welcome messages in the background while the client is still choosing
+    The chosen coach's welcome is then served from the shared pool; the other one stays pooled
+    for later sessions
+    """
+    if st.session_state.prefetched_country == country_code:
+        return
+    st.session_state.prefetched_country = country_code
+    for _, factory in COACHES.values():
+        factory(country_code).prefetch_welcome()
+
+
+def start_stored_session(coach):
+    """Create a stored session for the coach and put its id in the URL"""
+    store = get_session_store()
+    session_id = store.create_session(coach.persona_key, coach.user_country_code)
+    coach.attach_session(store, session_id)
+    st.query_params["session"] = session_id
+
+
+def restore_stored_session():
+    """
+    Lazily restore the session named in the URL after a restart or on another replica
+    Only the recent prompt window, the summary, the crisis block and recent chat messages are loaded
+    """
+    session_id = st.query_params.get("session")
+    if not session_id or st.session_state.coach_instance is not None:
+        return
+    store = get_session_store()
+    snapshot = store.load(session_id)
+    if snapshot is None or snapshot.persona not in COACHES:
+        return
+    coach_name, factory = COACHES[snapshot.persona]
+    coach = factory(snapshot.country_code)
+    coach.restore_session(snapshot)
+    coach.attach_session(store, session_id)
+    st.session_state.coach_selected = coach_name
+    st.session_state.coach_instance = coach
+    st.session_state.country_code = snapshot.country_code
+    st.session_state.messages = [
+        make_message(message["role"], message["content"]) for message in snapshot.display_messages
+    ]
+    st.session_state.pending_welcome = False
+
+
+# Phrases that style a coach message as a crisis or warning message in the chat
+DISPLAY_CRISIS_PHRASES = ("emergency", "crisis", "suicide", "professional help immediately")
+DISPLAY_WARNING_PHRASES = ("professional care", "therapist", "counselor", "helpline")
+
+
+def classify_display(role, content):
+    """
+    Safety styling for a chat message
+    Returns: 'crisis', 'warning', or None (always None for user messages)
+    """
+    if role == "user":
+        return None
+    lowered = content.lower()
+    if any(phrase in lowered for phrase in DISPLAY_CRISIS_PHRASES):
+        return "crisis"
+    if any(phrase in lowered for phrase in DISPLAY_WARNING_PHRASES):
+        return "warning"
+    return None
+
+
+def render_message_html(role, content, level, coach_name):
+    """Chat bubble HTML for a message"""
+    if role == "user":
+        return f"""
+        <div class="chat-message user-message">
+            <strong>You:</strong><br>{content}
+        </div>
+        """
+    if level == "crisis":
+        return f"""
+        <div class="safety-critical">
+            <strong>🚨 {coach_name}:</strong><br>{content}
+        </div>
+        """
+    if level == "warning":
+        return f"""
+        <div class="safety-warning">
+            <strong>⚠️ {coach_name}:</strong><br>{content}
+        </div>
+        """
+    return f"""
+        <div class="chat-message assistant-message">
+            <strong>{coach_name}:</strong><br>{content}
+        </div>
+        """
+
+
+def make_message(role, content):
+    """
+    Chat message with its safety classification and HTML, computed once so reruns only replay it
+    """
+    coach_name = st.session_state.coach_selected.split()[1]  # Get first name
+    level = classify_display(role, content)
+    return {
+        "role": role,
+        "content": content,
+        "level": level,
+        "html": render_message_html(role, content, level, coach_name),
+    }
+
+
+def add_message(role, content):
+    """Add a chat message to the display and the stored session"""
+    st.session_state.messages.append(make_message(role, content))
+    coach = st.session_state.coach_instance
+    if coach is not None and coach.session_id is not None:
+        coach.session_store.append_display(coach.session_id, role, content)
+
+
+restore_stored_session()
 
 
 def reset_session():
     """Reset the coaching session"""
     st.session_state.messages = []
+    st.session_state.pending_welcome = False
+    st.session_state.last_turn = None
     if st.session_state.coach_instance:
         st.session_state.coach_instance.reset_session()
+        start_stored_session(st.session_state.coach_instance)
+    else:
+        st.query_params.pop("session", None)
 
 
 def select_coach(coach_name, country_code):
     """Select a coach and initialize"""
+    # The previous coach is replaced, so there is nothing of it to reset or store
+    st.session_state.coach_instance = None
     reset_session()
     st.session_state.coach_selected = coach_name
     st.session_state.country_code = country_code
@@ -99,10 +244,73 @@ def select_coach(coach_name, country_code):
         st.session_state.coach_instance = create_anne_coach(country_code)
     elif coach_name == "Hiro Lin":
         st.session_state.coach_instance = create_hiro_coach(country_code)
+    start_stored_session(st.session_state.coach_instance)
+    
+    # Welcome message is streamed into the chat on the next run
+    st.session_state.pending_welcome = True
+
+
+def submit_turn():
+    """
+    chat_input callback: give each submission its own idempotency key
+    Runs once per submit, so a rerun of the same submission keeps its key while a deliberate
+    repeat of the same words ("yes") is a new turn
+    """
+    st.session_state.last_turn = {
+        "id": uuid.uuid4().hex, "text": st.session_state.chat_message, "shown": False, "answered": False,
+    }
+
+
+def stream_assistant_message(deltas):
+    """Render coach reply deltas live and return the complete message"""
+    coach_name = st.session_state.coach_selected.split()[1]  # Get first name
+    placeholder = st.empty()
+    text = ""
+    for delta in deltas:
+        text += delta
+        placeholder.markdown(f"""
+        <div class="chat-message assistant-message">
+            <strong>{coach_name}:</strong><br>{text}▌
+        </div>
+        """, unsafe_allow_html=True)
+    placeholder.empty()
+    return text
+
+
+def usage_rows(breakdown, label):
+    """Table rows for one usage breakdown (by call type, scenario, ...)"""
+    return [
+        {label: key, "calls": value["calls"], "prompt": value["prompt_tokens"],
+         "completion": value["completion_tokens"], "cost ($)": value["cost_usd"]}
+        for key, value in sorted(breakdown.items(), key=lambda item: -item[1]["cost_usd"])
+    ]
+
+
+def render_usage_debug(ledger):
+    """Debug view of token usage and estimated cost for this session and the whole process"""
+    session = ledger.summary()
+    total = session["total"]
+    st.markdown(f"**This session:** {total['calls']} calls, {total['total_tokens']} tokens, "
+                f"~${total['cost_usd']:.4f}")
+    if session["by_call_type"]:
+        st.dataframe(usage_rows(session["by_call_type"], "call type"), hide_index=True)
+    if session["by_scenario"]:
+        st.dataframe(usage_rows(session["by_scenario"], "scenario"), hide_index=True)
+    
+    process = process_usage.summary()
+    process_total = process["total"]
+    st.markdown(f"**All sessions (this process):** {process_total['total_tokens']} tokens, "
+                f"~${process_total['cost_usd']:.4f}")
+    if process["by_persona"]:
+        st.dataframe(usage_rows(process["by_persona"], "persona"), hide_index=True)
     
-    # Get welcome message
-    welcome_msg = st.session_state.coach_instance.get_welcome_message()
-    st.session_state.messages.append({"role": "assistant", "content": welcome_msg})
+    st.download_button(
+        "Export session usage (JSONL)",
+        data=ledger.to_jsonl(),
+        file_name="coach_usage.jsonl",
+        mime="application/jsonl",
+        use_container_width=True,
+    )
 
 
 # Sidebar for coach selection
@@ -123,6 +331,8 @@ with st.sidebar:
         }[x],
         index=0
     )
+    if st.session_state.coach_selected is None:
+        prefetch_welcomes(country_code)
     
     st.markdown("---")
     st.markdown("#### Choose Your Coach")
@@ -189,6 +399,10 @@ with st.sidebar:
             st.session_state.coach_instance = None
             reset_session()
             st.rerun()
+        
+        st.markdown("---")
+        with st.expander("🧾 Token usage (debug)"):
+            render_usage_debug(st.session_state.coach_instance.usage_ledger)
 
 
 # Main chat interface
@@ -222,59 +436,41 @@ else:
     # Chat interface when coach is selected
     st.markdown(f'<h1 class="main-header">Coaching Session with {st.session_state.coach_selected}</h1>', unsafe_allow_html=True)
     
-    # Display chat messages
+    # Display chat messages (classified and rendered when they were added)
     for message in st.session_state.messages:
-        if message["role"] == "user":
-            st.markdown(f"""
-            <div class="chat-message user-message">
-                <strong>You:</strong><br>{message["content"]}
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            coach_name = st.session_state.coach_selected.split()[1]  # Get first name
-            
-            # Check for safety keywords in response
-            is_crisis = any(keyword in message["content"].lower() for keyword in 
-                          ["emergency", "crisis", "suicide", "professional help immediately"])
-            is_warning = any(keyword in message["content"].lower() for keyword in 
-                           ["professional care", "therapist", "counselor", "helpline"])
-            
-            if is_crisis:
-                st.markdown(f"""
-                <div class="safety-critical">
-                    <strong>🚨 {coach_name}:</strong><br>{message["content"]}
-                </div>
-                """, unsafe_allow_html=True)
-            elif is_warning:
-                st.markdown(f"""
-                <div class="safety-warning">
-                    <strong>⚠️ {coach_name}:</strong><br>{message["content"]}
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div class="chat-message assistant-message">
-                    <strong>{coach_name}:</strong><br>{message["content"]}
-                </div>
-                """, unsafe_allow_html=True)
+        st.markdown(message["html"], unsafe_allow_html=True)
+    
+    # Stream the welcome message for a newly selected coach
+    if st.session_state.pending_welcome:
+        st.session_state.pending_welcome = False
+        welcome_msg = stream_assistant_message(st.session_state.coach_instance.stream_welcome_message())
+        add_message("assistant", welcome_msg)
+        st.rerun()
     
     # Chat input
-    user_input = st.chat_input("Share what's on your mind...")
+    user_input = st.chat_input("Share what's on your mind...", key="chat_message", on_submit=submit_turn)
     
     if user_input:
         # Check if session is blocked
         if st.session_state.coach_instance.session_blocked:
             st.error("⛔ This session has been ended for your safety. Please reach out to the professional resources shared above.")
         else:
-            # Add user message
-            st.session_state.messages.append({"role": "user", "content": user_input})
+            # A rerun of the same submission reuses the turn's idempotency key, so the coach answers it once
+            turn = st.session_state.last_turn
+            if not turn["shown"]:
+                turn["shown"] = True
+                add_message("user", user_input)
+                st.markdown(st.session_state.messages[-1]["html"], unsafe_allow_html=True)
             
-            # Generate coach response
-            with st.spinner(f"{st.session_state.coach_selected} is thinking..."):
-                response = st.session_state.coach_instance.generate_response(user_input)
+            # Stream coach response as it is generated
+            response = stream_assistant_message(
+                st.session_state.coach_instance.stream_response(user_input, turn_id=turn["id"])
+            )
             
-            # Add coach response
-            st.session_state.messages.append({"role": "assistant", "content": response})
+            # Add coach response (once per turn)
+            if not turn["answered"]:
+                turn["answered"] = True
+                add_message("assistant", response)
             
             # Rerun to display new messages
             st.rerun()
@@ -0,0 +1,352 @@
+"""
+Model Call Record / Replay
+Wraps the shared OpenAI clients so chat completions can be recorded to disk once and served back
+later, making regression runs over scripted sessions free, deterministic and fast
+
+Each response is stored under the SHA-256 of its request (model, messages and every sampling
+parameter; stream, stream_options and timeout are left out, so a recorded completion also replays
+as a stream) in a content-addressed directory: <cache dir>/<first two hex digits>/<hash>.json
+
+Modes:
+    record  - always call upstream and (over)write the stored response
+    replay  - only serve stored responses; a request that was never recorded raises ModelCacheMiss
+    auto    - serve stored responses, call upstream and record on a miss
+
+Enable with COACH_MODEL_CACHE=<mode> (and COACH_MODEL_CACHE_DIR, COACH_MODEL_CACHE_LATENCY),
+or llm_client.configure(cache_mode=..., cache_dir=..., cache_latency=...)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+
+DEFAULT_CACHE_DIR = "model_cache"
+
+RECORD = "record"
+REPLAY = "replay"
+AUTO = "auto"
+MODES = (RECORD, REPLAY, AUTO)
+
+# Replay latency: "none" serves instantly, "original" sleeps as long as the recorded call took,
+# a number of seconds simulates a fixed time to first token
+NO_LATENCY = "none"
+ORIGINAL_LATENCY = "original"
+
+# Request fields that do not change the completion
+_TRANSPORT_FIELDS = ("stream", "stream_options", "timeout")
+
+
+class ModelCacheMiss(LookupError):
+    """Raised in replay mode for a request that was never recorded"""
+
+
+def request_key(request):
+    """
+    Returns: hex SHA-256 of the request's model, messages and sampling parameters
+    """
+    payload = {name: value for name, value in request.items() if name not in _TRANSPORT_FIELDS}
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def parse_latency(value):
+    """
+    Returns: NO_LATENCY, ORIGINAL_LATENCY or a non-negative number of seconds
+    Raises: ValueError for anything else
+    """
+    if value in (None, "", NO_LATENCY):
+        return NO_LATENCY
+    if value == ORIGINAL_LATENCY:
+        return ORIGINAL_LATENCY
+    seconds = float(value)
+    if seconds < 0:
+        raise ValueError("Replay latency must not be negative")
+    return seconds
+
+
+def _usage_dict(usage):
+    if usage is None:
+        return None
+    return {
+        name: getattr(usage, name, 0) or 0
+        for name in ("prompt_tokens", "completion_tokens", "total_tokens")
+    }
+
+
+class ResponseStore:
+    """
+    Content-addressed store of recorded responses, one JSON file per request hash
+    Files are written to a temporary name and renamed, so concurrent writers never leave a torn file
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        """Returns: the stored entry dict, or None"""
+        try:
+            with open(self.path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, entry):
+        path = self.path(key)
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as f:
+                json.dump(entry, f, indent=1, ensure_ascii=False)
+                f.write("\n")
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+
+class _Recording:
+    """
+    Collects one upstream call (whole or streamed) into a store entry
+    """
+
+    def __init__(self, key, request):
+        self.key = key
+        self.request = {name: value for name, value in request.items() if name not in _TRANSPORT_FIELDS}
+        self.start = time.perf_counter()
+        self.first_token_latency = None
+        self.deltas = []
+        self.finish_reason = None
+        self.usage = None
+
+    def add_chunk(self, chunk):
+        if not chunk.choices:
+            self.usage = _usage_dict(getattr(chunk, "usage", None))
+            return
+        choice = chunk.choices[0]
+        if choice.delta.content:
+            if self.first_token_latency is None:
+                self.first_token_latency = time.perf_counter() - self.start
+            self.deltas.append(choice.delta.content)
+        finish_reason = getattr(choice, "finish_reason", None)
+        if finish_reason:
+            self.finish_reason = finish_reason
+
+    def entry(self, response=None):
+        latency = time.perf_counter() - self.start
+        if response is not None:
+            choice = response.choices[0]
+            content = choice.message.content
+            deltas = None
+            self.finish_reason = getattr(choice, "finish_reason", None)
+            self.usage = _usage_dict(getattr(response, "usage", None))
+        else:
+            content = "".join(self.deltas)
+            deltas = self.deltas
+        return {
+            "key": self.key,
+            "request": self.request,
+            "content": content,
+            "deltas": deltas,
+            "finish_reason": self.finish_reason,
+            "usage": self.usage,
+            "latency": round(latency, 4),
+            "first_token_latency": round(self.first_token_latency if self.first_token_latency is not None
+                                         else latency, 4),
+            "recorded_at": time.time(),
+        }
+
+
+def _response(entry):
+    """A stored entry as a chat completion with the attributes the coaches read"""
+    usage = entry.get("usage")
+    return SimpleNamespace(
+        id="chatcmpl-replay-" + entry["key"][:16],
+        model=entry["request"].get("model"),
+        choices=[SimpleNamespace(
+            index=0,
+            message=SimpleNamespace(role="assistant", content=entry["content"]),
+            finish_reason=entry.get("finish_reason") or "stop",
+        )],
+        usage=SimpleNamespace(**usage) if usage else None,
+    )
+
+
+def _replay_deltas(entry):
+    """Recorded stream deltas, or the recorded text split into word-sized deltas"""
+    if entry.get("deltas"):
+        return entry["deltas"]
+    words = (entry.get("content") or "").split(" ")
+    return [word if index == 0 else " " + word for index, word in enumerate(words)]
+
+
+def _chunk(delta=None, finish_reason=None, usage=None):
+    if usage is not None:
+        return SimpleNamespace(choices=[], usage=SimpleNamespace(**usage))
+    return SimpleNamespace(
+        choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=delta), finish_reason=finish_reason)],
+        usage=None,
+    )
+
+
+def _replay_chunks(entry, request):
+    """Returns: the stream chunks for a stored entry, with a usage chunk if the request asked for one"""
+    chunks = [_chunk(delta) for delta in _replay_deltas(entry)]
+    chunks.append(_chunk(finish_reason=entry.get("finish_reason") or "stop"))
+    if (request.get("stream_options") or {}).get("include_usage") and entry.get("usage"):
+        chunks.append(_chunk(usage=entry["usage"]))
+    return chunks
+
+
+class ModelCache:
+    """
+    Record / replay policy over a ResponseStore
+    """
+
+    def __init__(self, mode=AUTO, directory=DEFAULT_CACHE_DIR, latency=NO_LATENCY):
+        if mode not in MODES:
+            raise ValueError(f"Unknown model cache mode: {mode} (expected one of {', '.join(MODES)})")
+        self.mode = mode
+        self.store = ResponseStore(directory)
+        self.latency = parse_latency(latency)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, request):
+        """
+        Returns: (key, stored entry or None when upstream should be called)
+        Raises: ModelCacheMiss in replay mode
+        """
+        key = request_key(request)
+        entry = None if self.mode == RECORD else self.store.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if entry is None and self.mode == REPLAY:
+            raise ModelCacheMiss(f"No recorded response for request {key} (model {request.get('model')})")
+        return key, entry
+
+    def stats(self):
+        with self._lock:
+            return {"mode": self.mode, "hits": self.hits, "misses": self.misses}
+
+    def delays(self, entry, chunk_count):
+        """
+        Returns: (seconds before the first chunk, seconds between later chunks) for a replay
+        """
+        if self.latency == NO_LATENCY:
+            return 0.0, 0.0
+        if self.latency != ORIGINAL_LATENCY:
+            return self.latency, 0.0
+        first = entry.get("first_token_latency") or 0.0
+        rest = max(0.0, (entry.get("latency") or 0.0) - first)
+        return first, rest / max(1, chunk_count - 1)
+
+    def response_delay(self, entry):
+        """Returns: seconds to wait before serving a whole (non-streamed) response"""
+        if self.latency == NO_LATENCY:
+            return 0.0
+        if self.latency != ORIGINAL_LATENCY:
+            return self.latency
+        return entry.get("latency") or 0.0
+
+
+class CachedClient:
+    """
+    Stands in for an OpenAI client: client.chat.completions.create() goes through the cache
+    Args:
+        upstream: zero-argument callable returning the real client, only called on a cache miss
+    """
+
+    def __init__(self, cache, upstream):
+        self.cache = cache
+        self._upstream_factory = upstream
+        self._upstream = None
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def upstream(self):
+        if self._upstream is None:
+            with self._lock:
+                if self._upstream is None:
+                    self._upstream = self._upstream_factory()
+        return self._upstream
+
+    def create(self, stream=False, **request):
+        key, entry = self.cache.lookup(request)
+        if entry is not None:
+            if stream:
+                return self._replay_stream(entry, request)
+            time.sleep(self.cache.response_delay(entry))
+            return _response(entry)
+        recording = _Recording(key, request)
+        response = self.upstream().chat.completions.create(stream=stream, **request)
+        if stream:
+            return self._record_stream(recording, response)
+        self.cache.store.put(key, recording.entry(response))
+        return response
+
+    def _replay_stream(self, entry, request):
+        chunks = _replay_chunks(entry, request)
+        first, between = self.cache.delays(entry, len(chunks))
+        for index, chunk in enumerate(chunks):
+            delay = first if index == 0 else between
+            if delay:
+                time.sleep(delay)
+            yield chunk
+
+    def _record_stream(self, recording, stream):
+        for chunk in stream:
+            recording.add_chunk(chunk)
+            yield chunk
+        # Only complete streams are stored; one abandoned mid-way is not a valid recording
+        self.cache.store.put(recording.key, recording.entry())
+
+
+class AsyncCachedClient(CachedClient):
+    """
+    Async variant of CachedClient: create() is awaited and streams are async iterators
+    """
+
+    async def create(self, stream=False, **request):
+        key, entry = self.cache.lookup(request)
+        if entry is not None:
+            if stream:
+                return self._replay_stream(entry, request)
+            delay = self.cache.response_delay(entry)
+            if delay:
+                await asyncio.sleep(delay)
+            return _response(entry)
+        recording = _Recording(key, request)
+        response = await self.upstream().chat.completions.create(stream=stream, **request)
+        if stream:
+            return self._record_stream(recording, response)
+        self.cache.store.put(key, recording.entry(response))
+        return response
+
+    async def _replay_stream(self, entry, request):
+        chunks = _replay_chunks(entry, request)
+        first, between = self.cache.delays(entry, len(chunks))
+        for index, chunk in enumerate(chunks):
+            delay = first if index == 0 else between
+            if delay:
+                await asyncio.sleep(delay)
+            yield chunk
+
+    async def _record_stream(self, recording, stream):
+        async for chunk in stream:
+            recording.add_chunk(chunk)
+            yield chunk
+        self.cache.store.put(recording.key, recording.entry())
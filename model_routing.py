@@ -0,0 +1,168 @@
+"""
+Model Routing
+Routing table from (call type, persona) to model and sampling parameters
+Each route has a fallback chain: when the primary model's recent latency on that route breaks
+the route's SLO, requests drop to the next model until the primary recovers
+While model_cache records or replays, every route is pinned to its primary model
+"""
+
+import threading
+import time
+from collections import deque
+
+
+# Seconds of latency history used for SLO checks
+LATENCY_WINDOW_SECONDS = 60.0
+# Fewer recent samples than this are not enough to judge a model
+MIN_LATENCY_SAMPLES = 5
+# Percentile compared against the route SLO
+SLO_PERCENTILE = 0.95
+
+ANY_PERSONA = "*"
+
+
+class Route:
+    """
+    Model and sampling parameters for one call type
+    """
+
+    def __init__(self, model, temperature, max_tokens, fallbacks=(), latency_slo=None, **extra):
+        """
+        Args:
+            model: primary model
+            temperature, max_tokens: sampling parameters
+            fallbacks: smaller / faster models to use, in order, when the SLO is breached
+            latency_slo: p95 latency target in seconds (None disables fallback)
+            extra: other request parameters (presence_penalty, frequency_penalty, ...)
+        """
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.fallbacks = tuple(fallbacks)
+        self.latency_slo = latency_slo
+        self.extra = extra
+
+    @property
+    def chain(self):
+        return (self.model,) + self.fallbacks
+
+    def params(self, model=None):
+        """Request parameters for the given model in this route's chain"""
+        params = {
+            "model": model or self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+        params.update(self.extra)
+        return params
+
+
+# Short formulaic turns go to fast models; coaching turns keep GPT-4
+ROUTES = {
+    ("welcome", ANY_PERSONA): Route("gpt-4o-mini", temperature=0.9, max_tokens=80),
+    ("greeting", ANY_PERSONA): Route("gpt-4o-mini", temperature=0.9, max_tokens=80),
+    ("summary", ANY_PERSONA): Route("gpt-4o-mini", temperature=0.3, max_tokens=300),
+    ("crisis", ANY_PERSONA): Route(
+        "gpt-4", temperature=0.7, max_tokens=350,
+        fallbacks=["gpt-4o"], latency_slo=6.0,
+    ),
+    ("warning", ANY_PERSONA): Route(
+        "gpt-4", temperature=0.8, max_tokens=250,
+        fallbacks=["gpt-4o", "gpt-4o-mini"], latency_slo=8.0,
+    ),
+    ("coaching", "anne"): Route(
+        "gpt-4", temperature=0.8, max_tokens=300,
+        fallbacks=["gpt-4o", "gpt-4o-mini"], latency_slo=8.0,
+        presence_penalty=0.3, frequency_penalty=0.3,
+    ),
+    ("coaching", "hiro"): Route(
+        "gpt-4", temperature=0.7, max_tokens=250,  # Lower temperature and shorter for Hiro's concise style
+        fallbacks=["gpt-4o", "gpt-4o-mini"], latency_slo=8.0,
+        presence_penalty=0.2, frequency_penalty=0.2,
+    ),
+}
+
+
+class ModelRouter:
+    """
+    Resolves routes and tracks recent latency per (route, model) for SLO-based fallback
+    Samples are whole-reply times of successful attempts, so retries, backoff and stream
+    time-to-first-token never mix with them
+    """
+
+    def __init__(self, routes=None, window_seconds=LATENCY_WINDOW_SECONDS):
+        self.routes = dict(ROUTES if routes is None else routes)
+        self.window_seconds = window_seconds
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def route(self, call_type, persona):
+        """
+        Returns: the Route for a call type and persona (persona-specific first, then any persona)
+        """
+        route = self.routes.get((call_type, persona))
+        if route is None:
+            route = self.routes.get((call_type, ANY_PERSONA))
+        if route is None:
+            raise KeyError(f"No model route for {call_type!r} / {persona!r}")
+        return route
+
+    def params(self, call_type, persona):
+        """
+        Request parameters for a call, skipping models that currently break the route's SLO
+        Returns: dict with model, temperature, max_tokens and any extra parameters
+        """
+        route = self.route(call_type, persona)
+        return route.params(self.select_model(route))
+
+    def select_model(self, route):
+        """First model in the route's chain that meets its latency SLO (last one if none do)"""
+        if route.latency_slo is None or _model_cache_active():
+            return route.model
+        for model in route.chain:
+            latency = self.recent_latency(route, model)
+            if latency is None or latency <= route.latency_slo:
+                return model
+        return route.chain[-1]
+
+    def record_latency(self, route, model, seconds):
+        """Record the time a model took to complete a reply on a route"""
+        now = time.monotonic()
+        with self._lock:
+            samples = self._latencies.setdefault((route, model), deque())
+            samples.append((now, seconds))
+            self._trim(samples, now)
+
+    def recent_latency(self, route, model):
+        """
+        Returns: SLO percentile of the model's recent latencies on the route, or None with too few samples
+        """
+        with self._lock:
+            samples = self._latencies.get((route, model))
+            if not samples:
+                return None
+            self._trim(samples, time.monotonic())
+            if len(samples) < MIN_LATENCY_SAMPLES:
+                return None
+            values = sorted(latency for _, latency in samples)
+        index = min(len(values) - 1, int(len(values) * SLO_PERCENTILE))
+        return values[index]
+
+    def _trim(self, samples, now):
+        # Old samples expire, so a demoted model is retried once its bad window passes
+        while samples and now - samples[0][0] > self.window_seconds:
+            samples.popleft()
+
+
+def _model_cache_active():
+    """
+    Recorded responses are keyed by model, so a fallback would turn a replay into a cache miss
+    Returns: True while the shared clients record or replay through model_cache
+    """
+    from llm_client import get_settings
+
+    return bool(get_settings().cache_mode)
+
+
+# Shared router for the whole process
+model_router = ModelRouter()
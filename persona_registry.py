@@ -0,0 +1,118 @@
+"""
+Persona Registry
+Everything that makes one coach different from another, compiled once per process
+Persona modules (anne_rosental_coach.py, hiro_lin_coach.py) register themselves on import;
+every session of that coach shares the same read-only Persona
+"""
+
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+from scenario_index import get_scenario_index, collect_scenarios
+from semantic_index import SemanticScenarioIndex
+from prompt_compiler import PromptCompiler
+from greeting_detector import GreetingDetector
+from crisis_templates import LocalCrisisResponder
+
+
+# Compiled persona data shared by every session of a coach
+Persona = namedtuple("Persona", [
+    "key",                       # Key for shared resources (response pool, routing, ledgers, stored sessions)
+    "name",                      # Display name
+    "prompts",                   # PromptCompiler with the persona prefix and scenario blocks
+    "scenario_index",            # ScenarioIndex over the persona's scenarios
+    "semantic_index",            # SemanticScenarioIndex, used when no trigger phrase matches
+    "greeting_detector",         # GreetingDetector that knows the coach's name
+    "crisis_responder",          # LocalCrisisResponder with the persona's crisis message per country
+    "welcome_prompt",
+    "welcome_fallback",
+    "greeting_prompt",
+    "greeting_fallback",
+    "crisis_prompt",             # Templates: {user_message}, {helpline_name}, {helpline_number}, {helpline_hours}
+    "warning_prompt",
+    "warning_fallback",          # Template: {helpline_name}, {helpline_number}, {helpline_hours}
+    "connection_error_message",
+])
+
+
+def safety_requirements(context):
+    """
+    Render a SafetyProtocol context's response requirements as prompt lines
+    Returns: "- requirement" lines, each ending in a newline
+    """
+    return "".join(f"- {requirement}\n" for requirement in context["response_requirements"])
+
+
+def build_persona(key, name, scenarios_cls, base_prompt, coach_names, context_label, focus_label, focus_key,
+                  scenario_guidance, open_guidance, crisis_message, welcome_prompt, welcome_fallback,
+                  greeting_prompt, greeting_fallback, crisis_prompt, warning_prompt, warning_fallback,
+                  connection_error_message):
+    """
+    Compile a persona's prompts, scenario indexes, greeting detector and crisis messages
+    Args:
+        scenarios_cls: class with scenarioN dicts
+        coach_names: words the client may use to address the coach
+        context_label, focus_label, focus_key, scenario_guidance, open_guidance: see PromptCompiler
+        crisis_message: LocalCrisisResponder template
+    Returns: Persona
+    """
+    scenarios = collect_scenarios(scenarios_cls)
+    return Persona(
+        key=key,
+        name=name,
+        prompts=PromptCompiler(
+            base_prompt=base_prompt,
+            scenarios=scenarios,
+            context_label=context_label,
+            focus_label=focus_label,
+            focus_key=focus_key,
+            scenario_guidance=scenario_guidance,
+            open_guidance=open_guidance,
+        ),
+        scenario_index=get_scenario_index(scenarios_cls),
+        semantic_index=SemanticScenarioIndex(scenarios, focus_key),
+        greeting_detector=GreetingDetector(coach_names=coach_names),
+        crisis_responder=LocalCrisisResponder(crisis_message),
+        welcome_prompt=welcome_prompt,
+        welcome_fallback=welcome_fallback,
+        greeting_prompt=greeting_prompt,
+        greeting_fallback=greeting_fallback,
+        crisis_prompt=crisis_prompt,
+        warning_prompt=warning_prompt,
+        warning_fallback=warning_fallback,
+        connection_error_message=connection_error_message,
+    )
+
+
+_personas = {}
+_personas_lock = threading.Lock()
+
+# Read-only view of every registered persona, by key
+PERSONAS = MappingProxyType(_personas)
+
+
+def register_persona(persona):
+    """
+    Add a persona to the process-wide registry
+    Registering the same coach again (a reloaded module) replaces its entry
+    Returns: the persona
+    Raises: ValueError if another coach is already registered under the key
+    """
+    with _personas_lock:
+        existing = _personas.get(persona.key)
+        if existing is not None and existing.name != persona.name:
+            raise ValueError(f"Persona key {persona.key!r} is already used by {existing.name}")
+        _personas[persona.key] = persona
+    return persona
+
+
+def get_persona(key):
+    """
+    Returns: the registered Persona for a key
+    Raises: KeyError for an unknown key (is its coach module imported?)
+    """
+    persona = _personas.get(key)
+    if persona is None:
+        raise KeyError(f"Unknown persona: {key}")
+    return persona
@@ -0,0 +1,94 @@
+"""
+Prompt Compiler
+Precompiles each persona's prompt fragments once per process
+Every request starts with the same byte-identical system message so provider-side
+prompt caching can reuse it; per-turn content only appears at the end
+"""
+
+USER_MESSAGE_SLOT = "{user_message}"
+
+
+def _split_template(template):
+    """Split a guidance template around the user message slot"""
+    before, slot, after = template.partition(USER_MESSAGE_SLOT)
+    if not slot:
+        raise ValueError("Guidance template must contain " + USER_MESSAGE_SLOT)
+    return before, after
+
+
+class PromptCompiler:
+    """
+    Compiled prompt fragments for one persona
+    Request layout: [persona prefix] + history + [per-turn instruction]
+    """
+
+    def __init__(self, base_prompt, scenarios, context_label, focus_label, focus_key,
+                 scenario_guidance, open_guidance):
+        """
+        Args:
+            base_prompt: persona system prompt, sent unchanged as the first message
+            scenarios: list of scenario dicts
+            context_label: heading for the scenario's context (e.g. "PSYCHOLOGICAL CONTEXT")
+            focus_label: heading for the scenario's focus list
+            focus_key: scenario dict key holding the focus list
+            scenario_guidance: guidance after a detected scenario, with a {user_message} slot
+            open_guidance: guidance when no scenario matched, with a {user_message} slot
+        """
+        self.prefix = base_prompt
+        self.prefix_message = {"role": "system", "content": base_prompt}
+        self.context_label = context_label
+        self.focus_label = focus_label
+        self.focus_key = focus_key
+
+        self._scenario_guidance = _split_template(scenario_guidance)
+        before, after = _split_template(open_guidance)
+        self._open_instruction = (
+            "=== CURRENT INTERACTION CONTEXT ===\n\n" + before,
+            after,
+        )
+        self._scenario_instructions = {}
+        for scenario in scenarios:
+            self._scenario_instructions[scenario["name"]] = self._compile_scenario(scenario)
+
+    def _compile_scenario(self, scenario):
+        block = "=== CURRENT INTERACTION CONTEXT ===\n\n"
+        block += self.scenario_block(scenario)
+        before, after = self._scenario_guidance
+        return block + before, after
+
+    def scenario_block(self, scenario):
+        """
+        Context and focus block for a scenario
+        Returns: block text
+        """
+        block = f"""DETECTED SCENARIO: {scenario['name']}
+
+{self.context_label}:
+{scenario['context']}
+
+{self.focus_label}:
+"""
+        for focus in scenario[self.focus_key]:
+            block += f"- {focus}\n"
+        return block
+
+    def coaching_instruction(self, user_message, scenario=None):
+        """
+        Per-turn instruction for a coaching turn
+        Returns: instruction text (precompiled fragments around the client's words)
+        """
+        if scenario is None:
+            before, after = self._open_instruction
+        else:
+            compiled = self._scenario_instructions.get(scenario["name"])
+            if compiled is None:
+                compiled = self._compile_scenario(scenario)
+            before, after = compiled
+        return before + user_message + after
+
+    def messages(self, history, instruction):
+        """
+        Build request messages with the shared prefix first and the instruction last
+        Returns: list of chat messages
+        """
+        return [self.prefix_message] + list(history) + [{"role": "system", "content": instruction}]
@@ -0,0 +1,246 @@
+"""
+Resilient Model Calls
+Per-call-type deadlines, jittered exponential backoff on 429 / 5xx / connection errors,
+and a circuit breaker that sends coaches to their local fallbacks while upstream is unhealthy
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# Total time budget (seconds) per call type, across all attempts
+CALL_DEADLINES = {
+    "welcome": 10.0,
+    "greeting": 8.0,
+    "crisis": 12.0,
+    "warning": 15.0,
+    "coaching": 30.0,
+    "summary": 20.0,
+}
+DEFAULT_DEADLINE = 30.0
+
+# Attempts shorter than this are not worth starting
+_MIN_ATTEMPT_SECONDS = 0.5
+
+_RETRYABLE_ERRORS = {"APITimeoutError", "APIConnectionError", "InternalServerError", "RateLimitError"}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the circuit breaker is open"""
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a call type's time budget runs out before a successful attempt"""
+
+
+def is_retryable(error):
+    """
+    Retry on rate limits, server errors, timeouts and connection failures
+    Returns: True if the error is worth another attempt
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    return any(cls.__name__ in _RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+def _retry_after_seconds(error):
+    """Server-suggested delay from a Retry-After header, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, error=None):
+        """
+        Args:
+            attempt: number of the attempt that just failed (1-based)
+        Returns: seconds to wait before the next attempt
+        """
+        retry_after = _retry_after_seconds(error) if error is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for reset_timeout seconds
+    Then lets a single trial call through (half-open); success closes it, failure re-opens it
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow(self):
+        """
+        Returns: True if a call may go upstream now
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """
+        Give back a half-open trial that ended without an upstream verdict (cancelled or a local error),
+        so the next call can take the trial instead of the breaker staying open for good
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning("Model circuit breaker opened after %d failures", self._failures)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class ResilientCaller:
+    """
+    Wraps model calls with deadlines, retries and the circuit breaker
+    The wrapped function receives the per-attempt timeout in seconds
+    """
+
+    def __init__(self, breaker=None, policy=None, deadlines=None):
+        self.breaker = breaker or CircuitBreaker()
+        self.policy = policy or RetryPolicy()
+        self.deadlines = dict(CALL_DEADLINES if deadlines is None else deadlines)
+
+    def deadline_for(self, call_type):
+        return self.deadlines.get(call_type, DEFAULT_DEADLINE)
+
+    def call(self, call_type, fn):
+        """
+        Run fn(timeout) with retries until it succeeds or the call type's deadline is spent
+        Raises: CircuitOpenError, DeadlineExceededError, or the last non-retryable error
+        """
+        deadline = time.monotonic() + self.deadline_for(call_type)
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = self._attempt_timeout(call_type, deadline)
+            try:
+                result = fn(timeout)
+            except Exception as error:
+                delay = self._after_failure(call_type, attempt, deadline, error)
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def call_async(self, call_type, fn):
+        """
+        Async variant of call: fn(timeout) returns an awaitable
+        """
+        deadline = time.monotonic() + self.deadline_for(call_type)
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = self._attempt_timeout(call_type, deadline)
+            try:
+                result = await fn(timeout)
+            except Exception as error:
+                delay = self._after_failure(call_type, attempt, deadline, error)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled (e.g. the client went away) - no verdict on upstream health
+                self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def _attempt_timeout(self, call_type, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining < _MIN_ATTEMPT_SECONDS:
+            raise DeadlineExceededError(f"{call_type} call exceeded its deadline")
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Upstream unavailable, skipping {call_type} call")
+        return remaining
+
+    def _after_failure(self, call_type, attempt, deadline, error):
+        """
+        Record a failed attempt and decide whether to retry
+        Returns: seconds to wait before retrying (re-raises when giving up)
+        """
+        retryable = is_retryable(error)
+        if retryable:
+            self.breaker.record_failure()
+        elif getattr(error, "status_code", None) is not None:
+            # Upstream answered (e.g. a 400) - it is reachable, so do not hold the breaker open
+            self.breaker.record_success()
+        else:
+            # A local error (a bug, a replay cache miss) says nothing about upstream health
+            self.breaker.release_trial()
+        logger.warning("%s call failed (attempt %d): %s", call_type, attempt, error)
+
+        if not retryable or attempt >= self.policy.max_attempts:
+            raise error
+        delay = self.policy.delay(attempt, error)
+        if time.monotonic() + delay + _MIN_ATTEMPT_SECONDS > deadline:
+            raise error
+        return delay
+
+
+# Shared by every coach in the process - all personas talk to the same upstream
+resilient_caller = ResilientCaller()
@@ -0,0 +1,176 @@
+"""
+Response Pool
+Process-wide pool of pre-generated coach messages (welcomes, greetings)
+Keyed by (persona, kind, country); filled in the background, rotated for variety, refreshed on a TTL
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from model_cache import ModelCacheMiss
+
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_TTL_SECONDS = 60 * 60
+DEFAULT_FILL_WORKERS = 2
+
+
+class ResponsePool:
+    """
+    Pre-generated messages shared by every session in the process
+    Expired messages are still served while fresh ones are generated, so reads never wait on a refresh
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 fill_workers=DEFAULT_FILL_WORKERS):
+        self.size = size
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+        self._cursors = {}
+        self._filling = set()
+        self._lock = threading.Lock()
+        # Signalled when a message is added or a fill ends (see wait)
+        self._changed = threading.Condition(self._lock)
+        self._executor = ThreadPoolExecutor(
+            max_workers=fill_workers, thread_name_prefix="response-pool"
+        )
+
+    def take(self, key, factory):
+        """
+        Get the next pooled message without blocking
+        Schedules a background fill when the pool is short or stale
+        Args:
+            key: (persona, kind, country) tuple
+            factory: callable returning a freshly generated message (may raise)
+        Returns: message text, or None if nothing is pooled yet
+        """
+        with self._lock:
+            entries = self._entries.get(key, [])
+            now = time.monotonic()
+            fresh = [entry for entry in entries if now - entry[1] < self.ttl_seconds]
+            if fresh:
+                pick_from = fresh
+            else:
+                pick_from = entries
+            message = None
+            if pick_from:
+                cursor = self._cursors.get(key, 0)
+                message = pick_from[cursor % len(pick_from)][0]
+                self._cursors[key] = cursor + 1
+            needs_fill = len(fresh) < self.size
+
+        if needs_fill:
+            self.fill(key, factory)
+        return message
+
+    def get(self, key, factory):
+        """
+        Get a pooled message, generating one synchronously if the pool is empty
+        Returns: message text, or None if the pool is empty and generation failed
+        """
+        message = self.take(key, factory)
+        if message is not None:
+            return message
+        try:
+            message = factory()
+        except ModelCacheMiss:
+            raise  # Replay runs must not hide an unrecorded request behind the fallback
+        except Exception:
+            return None
+        self.add(key, message)
+        return message
+
+    def add(self, key, message):
+        """Add a generated message to the pool, dropping expired and excess entries"""
+        if not message:
+            return
+        with self._lock:
+            now = time.monotonic()
+            entries = [
+                entry for entry in self._entries.get(key, [])
+                if now - entry[1] < self.ttl_seconds
+            ]
+            entries.append((message, now))
+            self._entries[key] = entries[-self.size:]
+            self._changed.notify_all()
+
+    def fill(self, key, factory, target=None):
+        """
+        Top the pool up to target messages (default: its size) in the background
+        (one fill per key at a time)
+        Returns: Future for the fill, or None if one is already running
+        """
+        with self._lock:
+            if key in self._filling:
+                return None
+            self._filling.add(key)
+        return self._executor.submit(self._fill, key, factory, target or self.size)
+
+    def prefetch(self, key, factory, count=1):
+        """
+        Speculatively generate messages before anyone asks for them
+        Only count messages are generated; take() tops the pool up to its size later
+        Returns: Future for the fill, or None if enough are pooled or a fill is already running
+        """
+        if self.count(key) >= count:
+            return None
+        return self.fill(key, factory, target=count)
+
+    def is_filling(self, key):
+        """True while a background fill for key is running"""
+        with self._lock:
+            return key in self._filling
+
+    def wait(self, key, timeout):
+        """
+        Wait for a running fill of key to pool a fresh message
+        Returns: True if a fresh message is pooled, False if the fill ended without one or timed out
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while not self._fresh_count(key):
+                remaining = deadline - time.monotonic()
+                if key not in self._filling or remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            return True
+
+    def count(self, key):
+        """Number of fresh messages pooled for key"""
+        with self._lock:
+            return self._fresh_count(key)
+
+    def _fresh_count(self, key):
+        now = time.monotonic()
+        return sum(1 for entry in self._entries.get(key, []) if now - entry[1] < self.ttl_seconds)
+
+    def clear(self, key=None):
+        """Drop pooled messages for one key, or for all keys"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self._cursors.clear()
+            else:
+                self._entries.pop(key, None)
+                self._cursors.pop(key, None)
+
+    def _fill(self, key, factory, target):
+        try:
+            while self.count(key) < target:
+                message = factory()
+                if not message:
+                    break
+                self.add(key, message)
+        except Exception:
+            # Upstream failure - the next take() schedules another attempt
+            # (a ModelCacheMiss is counted in the cache stats and raised again by the caller's own call)
+            pass
+        finally:
+            with self._lock:
+                self._filling.discard(key)
+                self._changed.notify_all()
+
+
+# Shared pool for the whole process
+response_pool = ResponsePool()
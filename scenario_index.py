@@ -0,0 +1,117 @@
+"""
+Scenario Trigger Index
+Inverted index from trigger phrase to coaching scenario, built once per scenario set
+Resolves and ranks every matching scenario in a single pass over the message
+"""
+
+import re
+import threading
+from collections import namedtuple
+
+from keyword_matcher import KeywordMatcher
+
+
+# A ranked scenario hit: triggers are the distinct trigger phrases found in the message
+ScenarioMatch = namedtuple("ScenarioMatch", ["scenario", "triggers", "hits", "score", "confidence"])
+
+_SCENARIO_ATTR = re.compile(r"^scenario(\d+)$")
+
+
+def collect_scenarios(scenarios_cls):
+    """
+    Collect scenarioN dicts from a scenarios class in numeric order
+    Returns: list of scenario dicts
+    """
+    numbered = []
+    for attr in dir(scenarios_cls):
+        found = _SCENARIO_ATTR.match(attr)
+        if found:
+            numbered.append((int(found.group(1)), getattr(scenarios_cls, attr)))
+    return [scenario for _, scenario in sorted(numbered, key=lambda item: item[0])]
+
+
+def trigger_specificity(trigger):
+    """
+    Multi-word triggers are more specific than single words
+    Returns: number of words in the trigger
+    """
+    return len(trigger.split())
+
+
+class ScenarioIndex:
+    """
+    Precomputed trigger -> scenario index
+    Ranking: distinct triggers matched, then total trigger specificity, then scenario order
+    """
+
+    def __init__(self, scenarios):
+        """
+        Args:
+            scenarios: list of scenario dicts with a "triggers" list
+        """
+        self.scenarios = list(scenarios)
+        entries = []
+        for position, scenario in enumerate(self.scenarios):
+            for trigger in scenario["triggers"]:
+                entries.append((trigger, position))
+        self._matcher = KeywordMatcher(entries)
+
+    @classmethod
+    def from_scenarios_class(cls, scenarios_cls):
+        return cls(collect_scenarios(scenarios_cls))
+
+    def match(self, text, normalized=None):
+        """
+        Find all scenarios whose triggers appear in the message
+        Returns: list of ScenarioMatch, best match first
+        """
+        found = {}
+        for keyword_match in self._matcher.find_all(text, normalized):
+            position = keyword_match.payload
+            triggers, hits = found.get(position, ({}, 0))
+            triggers[keyword_match.keyword] = True
+            found[position] = (triggers, hits + 1)
+
+        ranked = []
+        for position, (triggers, hits) in found.items():
+            specificity = sum(trigger_specificity(trigger) for trigger in triggers)
+            # Repeated mentions count, but less than new distinct triggers
+            score = specificity + 0.25 * (hits - len(triggers))
+            ranked.append((len(triggers), specificity, -position, position, list(triggers), hits, score))
+        ranked.sort(reverse=True)
+
+        return [
+            ScenarioMatch(
+                scenario=self.scenarios[position],
+                triggers=triggers,
+                hits=hits,
+                score=score,
+                confidence=round(1.0 - 0.5 ** score, 3),
+            )
+            for _, _, _, position, triggers, hits, score in ranked
+        ]
+
+    def best(self, text, normalized=None):
+        """
+        Returns: the top-ranked scenario dict or None
+        """
+        matches = self.match(text, normalized)
+        return matches[0].scenario if matches else None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_scenario_index(scenarios_cls):
+    """
+    Get the process-wide ScenarioIndex for a scenarios class, building it on first use
+    """
+    index = _indexes.get(scenarios_cls)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(scenarios_cls)
+            if index is None:
+                index = ScenarioIndex.from_scenarios_class(scenarios_cls)
+                _indexes[scenarios_cls] = index
+    return index
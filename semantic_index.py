@@ -0,0 +1,171 @@
+"""
+Semantic Scenario Index
+Offline fallback for messages that use none of a scenario's exact trigger phrases
+Each scenario's triggers, context and focus text become one hashed TF-IDF vector over words and
+character n-grams; all scenarios live in a single NumPy matrix, so a message is scored against
+every scenario with one matrix-vector product over the message's non-zero features
+"""
+
+import math
+import re
+import zlib
+
+import numpy as np
+
+from keyword_matcher import normalize_text
+
+
+# Hashed feature space (power of two); collisions only blur rare features
+DEFAULT_DIMENSIONS = 1 << 15
+# Character n-gram sizes, taken within words padded with spaces
+NGRAM_SIZES = (3, 4)
+# Cosine similarity a scenario needs to count as a match (tuned on paraphrases of every scenario
+# and on small talk, which should stay unmatched)
+DEFAULT_MIN_SIMILARITY = 0.12
+# Messages with fewer non-stop words ("yes", "I don't know") carry too little signal to place
+MIN_CONTENT_WORDS = 3
+# Distinct words whose hashed feature columns are kept (the cache is cleared when full)
+WORD_CACHE_SIZE = 50000
+
+# How much each part of a scenario contributes to its vector
+FIELD_WEIGHTS = {"name": 2.0, "triggers": 2.0, "context": 1.0, "focus": 0.5}
+
+STOP_WORDS = frozenset("""
+a about after again all also am an and any are as at be been being but by can could did do does
+doing for from get got had has have having he her here him his how i i'd i'll i'm i've if in
+into is it it's its just me more my myself no not now of ok okay on one or our out over own
+really so some such than thanks that the their them then there these they this those through to
+too very was we were what when where which while who why will with would yeah you your
+""".split())
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def word_features(word):
+    """
+    Returns: the word feature and the character n-grams of the word padded with spaces
+    """
+    padded = f" {word} "
+    features = ["w:" + word]
+    for size in NGRAM_SIZES:
+        features.extend(padded[start:start + size] for start in range(len(padded) - size + 1))
+    return features
+
+
+class SemanticScenarioIndex:
+    """
+    Hashed TF-IDF vectors for a list of scenarios
+    matrix: (scenarios x dimensions) float32, rows L2-normalized
+    Features are hashed with CRC-32, so columns (and picks) are the same in every process and run
+    """
+
+    def __init__(self, scenarios, focus_key, dimensions=DEFAULT_DIMENSIONS, min_similarity=DEFAULT_MIN_SIMILARITY):
+        """
+        Args:
+            scenarios: list of scenario dicts with "name", "triggers", "context" and focus_key
+            focus_key: scenario key of the persona's focus list (e.g. "coaching_focus")
+        """
+        if dimensions & (dimensions - 1):
+            raise ValueError("dimensions must be a power of two")
+        self.scenarios = list(scenarios)
+        self.min_similarity = min_similarity
+        self._mask = dimensions - 1
+        self._word_columns_cache = {}
+
+        documents = [self._document_weights(scenario, focus_key) for scenario in self.scenarios]
+
+        # Smoothed IDF that drops to zero for features every scenario shares
+        document_frequency = np.zeros(dimensions, dtype=np.float32)
+        for weights in documents:
+            document_frequency[list(weights)] += 1
+        total = len(documents)
+        self.idf = np.log((1.0 + total) / (1.0 + document_frequency)).astype(np.float32)
+
+        self.matrix = np.zeros((total, dimensions), dtype=np.float32)
+        for row, weights in enumerate(documents):
+            columns = np.fromiter(weights.keys(), dtype=np.int64, count=len(weights))
+            vector = self._tf_idf(columns, np.fromiter(weights.values(), dtype=np.float32, count=len(weights)))
+            if vector is not None:
+                self.matrix[row, columns] = vector
+
+    def _word_columns(self, word):
+        """Hashed columns of a word's features, cached since the same words keep coming back"""
+        columns = self._word_columns_cache.get(word)
+        if columns is None:
+            mask = self._mask
+            # Not the built-in hash(): it is salted per process, so pool workers and replicas would disagree
+            columns = [zlib.crc32(feature.encode("utf-8")) & mask for feature in word_features(word)]
+            if len(self._word_columns_cache) >= WORD_CACHE_SIZE:
+                self._word_columns_cache.clear()
+            self._word_columns_cache[word] = columns
+        return columns
+
+    def _column_counts(self, normalized):
+        """
+        Returns: (dict of hashed column -> feature count, number of content words)
+        """
+        word_counts = {}
+        for word in _WORD.findall(normalized):
+            if word not in STOP_WORDS:
+                word_counts[word] = word_counts.get(word, 0) + 1
+        counts = {}
+        for word, count in word_counts.items():
+            for column in self._word_columns(word):
+                counts[column] = counts.get(column, 0) + count
+        return counts, sum(word_counts.values())
+
+    def _tf_idf(self, columns, term_weights):
+        """
+        Returns: L2-normalized TF-IDF values for the columns, or None when all weights are zero
+        """
+        vector = term_weights * self.idf[columns]
+        norm = math.sqrt(float(vector @ vector))
+        if not norm:
+            return None
+        return vector / norm
+
+    def _document_weights(self, scenario, focus_key):
+        weights = {}
+        fields = {
+            "name": scenario["name"],
+            "triggers": " ".join(scenario["triggers"]),
+            "context": scenario.get("context", ""),
+            "focus": " ".join(scenario.get(focus_key, [])),
+        }
+        for field, text in fields.items():
+            counts, _ = self._column_counts(normalize_text(text))
+            # Sublinear TF per field, then weighted by field
+            for column, count in counts.items():
+                weights[column] = weights.get(column, 0.0) + FIELD_WEIGHTS[field] * (1.0 + math.log(count))
+        return weights
+
+    def scores(self, text, normalized=None):
+        """
+        Returns: cosine similarity of the message to every scenario (NumPy array, scenario order);
+        all zero for messages under MIN_CONTENT_WORDS
+        """
+        if normalized is None:
+            normalized = normalize_text(text)
+        counts, words = self._column_counts(normalized)
+        if words < MIN_CONTENT_WORDS:
+            return np.zeros(len(self.scenarios), dtype=np.float32)
+        columns = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        term_counts = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        vector = self._tf_idf(columns, 1.0 + np.log(term_counts))
+        if vector is None:
+            return np.zeros(len(self.scenarios), dtype=np.float32)
+        return self.matrix[:, columns] @ vector
+
+    def best(self, text, normalized=None):
+        """
+        Returns: (scenario dict, similarity) for the closest scenario at or above min_similarity,
+        or (None, best similarity)
+        """
+        scores = self.scores(text, normalized)
+        if not len(scores):
+            return None, 0.0
+        position = int(np.argmax(scores))
+        similarity = float(scores[position])
+        if similarity < self.min_similarity:
+            return None, similarity
+        return self.scenarios[position], similarity
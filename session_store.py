@@ -0,0 +1,415 @@
+"""
+Session Store
+Persists coaching sessions so they survive restarts and moving between replicas
+Each turn is appended as it happens; a session is restored lazily by id with only the
+recent prompt window, the running summary, the crisis block and the recent chat display
+Answered turns are kept by idempotency key, so a resubmitted turn is answered once on any replica
+
+The default store is SQLite in WAL mode (COACH_SESSION_DB, default coach_sessions.db);
+set_session_store() plugs in any other SessionStore
+Sessions idle for longer than the retention period (COACH_SESSION_RETENTION_DAYS) are pruned
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from contextlib import contextmanager
+
+
+DEFAULT_DB_PATH = "coach_sessions.db"
+# Chat messages shown after a restore; older ones stay in the store
+DEFAULT_DISPLAY_LIMIT = 100
+# A turn claimed this long ago without a reply is taken over (the replica answering it is gone)
+DEFAULT_TURN_LEASE_SECONDS = 120.0
+# Sessions idle this long are deleted (0 keeps them forever)
+DEFAULT_RETENTION_DAYS = 30
+# Expired sessions are pruned at most this often, when a session is created
+PRUNE_INTERVAL_SECONDS = 3600.0
+
+# Channels of stored messages
+HISTORY = "history"  # Coach conversation (what the model sees)
+DISPLAY = "display"  # Chat messages shown in the UI, including welcome and safety messages
+
+SessionSnapshot = namedtuple(
+    "SessionSnapshot",
+    ["session_id", "persona", "country_code", "session_blocked", "summary", "history", "display_messages",
+     "history_count"],
+)
+
+
+class SessionStore(ABC):
+    """
+    Interface for session stores
+    history is only the part of the conversation still verbatim in the prompt window;
+    everything older is represented by the summary; history_count is every history message stored,
+    so a replica can tell whether another one has moved the conversation on
+    """
+
+    retention_seconds = None  # Sessions idle longer than this are pruned (None keeps them)
+    _pruned_at = None
+
+    @abstractmethod
+    def create_session(self, persona, country_code):
+        """Returns: a new session id"""
+
+    @abstractmethod
+    def append_turn(self, session_id, role, content, window_size, summary=None):
+        """
+        Append a conversation message
+        Args:
+            window_size: messages currently verbatim in the coach's prompt window
+            summary: new running summary, if it changed with this message
+        """
+
+    @abstractmethod
+    def append_display(self, session_id, role, content):
+        """Append a chat message as shown in the UI"""
+
+    @abstractmethod
+    def set_blocked(self, session_id, blocked=True):
+        """Record the crisis block for a session"""
+
+    @abstractmethod
+    def load(self, session_id, display_limit=DEFAULT_DISPLAY_LIMIT):
+        """Returns: SessionSnapshot, or None for an unknown session"""
+
+    @abstractmethod
+    def claim_turn(self, session_id, turn_id, lease_seconds=DEFAULT_TURN_LEASE_SECONDS):
+        """
+        Claim a turn by idempotency key for the caller to answer
+        Returns: (True, None) if the caller owns the turn, (False, reply) if it was answered,
+                 or (False, None) while another replica is still answering it
+        """
+
+    @abstractmethod
+    def finish_turn(self, session_id, turn_id, reply):
+        """Store the reply of a claimed turn"""
+
+    @abstractmethod
+    def release_turn(self, session_id, turn_id):
+        """Drop a claim that produced no reply, so a retry is answered again"""
+
+    @abstractmethod
+    def delete_session(self, session_id):
+        """Delete a session with all of its messages and turns"""
+
+    @abstractmethod
+    def prune(self, idle_before):
+        """
+        Delete every session with no activity since idle_before (a time.time() timestamp)
+        Returns: number of sessions deleted
+        """
+
+    def _prune_expired(self):
+        """Prune sessions past the retention period, at most every PRUNE_INTERVAL_SECONDS"""
+        if not self.retention_seconds:
+            return
+        now = time.monotonic()
+        if self._pruned_at is not None and now - self._pruned_at < PRUNE_INTERVAL_SECONDS:
+            return
+        self._pruned_at = now
+        self.prune(time.time() - self.retention_seconds)
+
+
+class MemorySessionStore(SessionStore):
+    """
+    In-process store, for tests and single-process development
+    """
+
+    def __init__(self, retention_seconds=None):
+        self.retention_seconds = retention_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create_session(self, persona, country_code):
+        self._prune_expired()
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = {
+                "persona": persona,
+                "country_code": country_code,
+                "session_blocked": False,
+                "summary": "",
+                "window_size": 0,
+                "updated_at": time.time(),
+                HISTORY: [],
+                DISPLAY: [],
+                "turns": {},  # turn id -> [reply or None, claimed at]
+            }
+        return session_id
+
+    def append_turn(self, session_id, role, content, window_size, summary=None):
+        with self._lock:
+            session = self._sessions[session_id]
+            session[HISTORY].append({"role": role, "content": content})
+            session["window_size"] = window_size
+            session["updated_at"] = time.time()
+            if summary is not None:
+                session["summary"] = summary
+
+    def append_display(self, session_id, role, content):
+        with self._lock:
+            self._sessions[session_id][DISPLAY].append({"role": role, "content": content})
+
+    def set_blocked(self, session_id, blocked=True):
+        with self._lock:
+            session = self._sessions[session_id]
+            session["session_blocked"] = blocked
+            session["updated_at"] = time.time()
+
+    def load(self, session_id, display_limit=DEFAULT_DISPLAY_LIMIT):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            window_size = session["window_size"]
+            return SessionSnapshot(
+                session_id=session_id,
+                persona=session["persona"],
+                country_code=session["country_code"],
+                session_blocked=session["session_blocked"],
+                summary=session["summary"],
+                history=list(session[HISTORY][-window_size:]) if window_size else [],
+                display_messages=list(session[DISPLAY][-display_limit:]) if display_limit else [],
+                history_count=len(session[HISTORY]),
+            )
+
+    def claim_turn(self, session_id, turn_id, lease_seconds=DEFAULT_TURN_LEASE_SECONDS):
+        now = time.time()
+        with self._lock:
+            turns = self._sessions[session_id]["turns"]
+            turn = turns.get(turn_id)
+            if turn is not None and (turn[0] is not None or now - turn[1] < lease_seconds):
+                return False, turn[0]
+            turns[turn_id] = [None, now]
+            return True, None
+
+    def finish_turn(self, session_id, turn_id, reply):
+        with self._lock:
+            self._sessions[session_id]["turns"][turn_id] = [reply, time.time()]
+
+    def release_turn(self, session_id, turn_id):
+        with self._lock:
+            turns = self._sessions[session_id]["turns"]
+            if turn_id in turns and turns[turn_id][0] is None:
+                del turns[turn_id]
+
+    def delete_session(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def prune(self, idle_before):
+        with self._lock:
+            expired = [key for key, session in self._sessions.items() if session["updated_at"] < idle_before]
+            for session_id in expired:
+                del self._sessions[session_id]
+        return len(expired)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    SQLite store in WAL mode: appends are cheap and readers never block the writer
+    One connection per store, shared across threads behind a lock
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        persona TEXT NOT NULL,
+        country_code TEXT NOT NULL,
+        session_blocked INTEGER NOT NULL DEFAULT 0,
+        summary TEXT NOT NULL DEFAULT '',
+        window_size INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS messages (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+        channel TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session_id, channel, seq);
+    CREATE TABLE IF NOT EXISTS turns (
+        session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+        turn_id TEXT NOT NULL,
+        reply TEXT,
+        claimed_at REAL NOT NULL,
+        PRIMARY KEY (session_id, turn_id)
+    );
+    CREATE INDEX IF NOT EXISTS sessions_by_update ON sessions (updated_at);
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, retention_seconds=None):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: durable across application crashes, one fsync per checkpoint
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(self.SCHEMA)
+
+    def create_session(self, persona, country_code):
+        self._prune_expired()
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (id, persona, country_code, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (session_id, persona, country_code, now, now),
+            )
+        return session_id
+
+    def append_turn(self, session_id, role, content, window_size, summary=None):
+        now = time.time()
+        with self._lock, self._transaction():
+            self._conn.execute(
+                "INSERT INTO messages (session_id, channel, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                (session_id, HISTORY, role, content, now),
+            )
+            if summary is None:
+                self._conn.execute(
+                    "UPDATE sessions SET window_size = ?, updated_at = ? WHERE id = ?",
+                    (window_size, now, session_id),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE sessions SET window_size = ?, summary = ?, updated_at = ? WHERE id = ?",
+                    (window_size, summary, now, session_id),
+                )
+
+    def append_display(self, session_id, role, content):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO messages (session_id, channel, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                (session_id, DISPLAY, role, content, time.time()),
+            )
+
+    def set_blocked(self, session_id, blocked=True):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET session_blocked = ?, updated_at = ? WHERE id = ?",
+                (int(blocked), time.time(), session_id),
+            )
+
+    def load(self, session_id, display_limit=DEFAULT_DISPLAY_LIMIT):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT persona, country_code, session_blocked, summary, window_size FROM sessions WHERE id = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            persona, country_code, session_blocked, summary, window_size = row
+            history = self._recent(session_id, HISTORY, window_size) if window_size else []
+            display_messages = self._recent(session_id, DISPLAY, display_limit)
+            (history_count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ? AND channel = ?", (session_id, HISTORY)
+            ).fetchone()
+        return SessionSnapshot(
+            session_id=session_id,
+            persona=persona,
+            country_code=country_code,
+            session_blocked=bool(session_blocked),
+            summary=summary,
+            history=history,
+            display_messages=display_messages,
+            history_count=history_count,
+        )
+
+    def claim_turn(self, session_id, turn_id, lease_seconds=DEFAULT_TURN_LEASE_SECONDS):
+        now = time.time()
+        with self._lock, self._transaction(immediate=True):
+            row = self._conn.execute(
+                "SELECT reply, claimed_at FROM turns WHERE session_id = ? AND turn_id = ?", (session_id, turn_id)
+            ).fetchone()
+            if row is not None and (row[0] is not None or now - row[1] < lease_seconds):
+                return False, row[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO turns (session_id, turn_id, reply, claimed_at) VALUES (?, ?, NULL, ?)",
+                (session_id, turn_id, now),
+            )
+            return True, None
+
+    def finish_turn(self, session_id, turn_id, reply):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE turns SET reply = ? WHERE session_id = ? AND turn_id = ?", (reply, session_id, turn_id)
+            )
+
+    def release_turn(self, session_id, turn_id):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM turns WHERE session_id = ? AND turn_id = ? AND reply IS NULL", (session_id, turn_id)
+            )
+
+    def delete_session(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def prune(self, idle_before):
+        # Messages and turns go with their session (ON DELETE CASCADE)
+        with self._lock:
+            return self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (idle_before,)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _recent(self, session_id, channel, limit):
+        rows = self._conn.execute(
+            "SELECT role, content FROM messages WHERE session_id = ? AND channel = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, channel, limit),
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    @contextmanager
+    def _transaction(self, immediate=False):
+        # IMMEDIATE takes the write lock up front, so a read-then-write is atomic across processes
+        self._conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+
+_store_lock = threading.Lock()
+_store = None
+
+
+def get_session_store():
+    """
+    Get the process-wide session store, creating the default SQLite store on first use
+    COACH_SESSION_DB=:memory: uses an in-process store instead
+    COACH_SESSION_RETENTION_DAYS sets how long idle sessions are kept (0 keeps them forever)
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                path = os.getenv("COACH_SESSION_DB", DEFAULT_DB_PATH)
+                days = float(os.getenv("COACH_SESSION_RETENTION_DAYS", DEFAULT_RETENTION_DAYS))
+                retention_seconds = days * 86400 if days > 0 else None
+                if path == ":memory:":
+                    _store = MemorySessionStore(retention_seconds)
+                else:
+                    _store = SQLiteSessionStore(path, retention_seconds)
+    return _store
+
+
+def set_session_store(store):
+    """Plug in a different SessionStore (None goes back to the default on next use)"""
+    global _store
+    with _store_lock:
+        _store = store
@@ -0,0 +1,291 @@
+"""
+Stub OpenAI Server
+Local stand-in for the chat-completions API, for load tests that should not spend real tokens
+Speaks the same wire format as /v1/chat/completions, including streamed server-sent events,
+with configurable latency, error rate and response length
+
+Run: python stub_server.py --port 8100
+Then point the coaches at it: OPENAI_BASE_URL=http://127.0.0.1:8100/v1
+"""
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+_WORDS = (
+    "let's take a moment to notice what is here right now and "
+    "see which small step feels possible for you today"
+).split()
+
+_ids = itertools.count(1)
+
+
+class StubSettings:
+    """
+    Behaviour of the stub server
+    """
+
+    def __init__(self, latency=0.5, latency_spread=0.3, distribution="lognormal",
+                 token_interval=0.01, completion_tokens=60, error_rate=0.0,
+                 error_status=500, retry_after=None, seed=None):
+        """
+        Args:
+            latency: typical seconds before the first token
+            latency_spread: spread of the latency distribution (seconds for uniform, sigma for lognormal)
+            distribution: one of LATENCY_DISTRIBUTIONS
+            token_interval: seconds between generated tokens
+            completion_tokens: tokens per response (capped by the request's max_tokens)
+            error_rate: fraction of requests answered with error_status
+            error_status: HTTP status for injected errors (429, 500, 503, ...)
+            retry_after: Retry-After header value sent with injected errors
+            seed: random seed for reproducible runs
+        """
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.latency = latency
+        self.latency_spread = latency_spread
+        self.distribution = distribution
+        self.token_interval = token_interval
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_latency(self):
+        """Returns: seconds to wait before the first token"""
+        with self._lock:
+            if self.distribution == "fixed":
+                return self.latency
+            if self.distribution == "uniform":
+                return max(0.0, self._random.uniform(self.latency - self.latency_spread,
+                                                     self.latency + self.latency_spread))
+            # Median at `latency`, long right tail like real upstream latency
+            return self._random.lognormvariate(0.0, self.latency_spread) * self.latency
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+def _completion_words(count):
+    return [_WORDS[i % len(_WORDS)] for i in range(count)]
+
+
+def _estimate_prompt_tokens(messages):
+    # Same rough chars/4 estimate as conversation_window
+    return sum(len(message.get("content") or "") for message in messages) // 4
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Handles /v1/chat/completions and /v1/models; settings come from the server
+    """
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, so the client connection pool is exercised
+
+    def log_message(self, format, *args):
+        # Quiet by default - load tests make thousands of requests
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/models"):
+            self._send_json(200, {
+                "object": "list",
+                "data": [{"id": "stub", "object": "model", "owned_by": "stub"}],
+            })
+        elif self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_error(404, "Not found", "invalid_request_error")
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_error(404, "Not found", "invalid_request_error")
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_error(400, "Request body is not valid JSON", "invalid_request_error")
+            return
+
+        settings = self.server.settings
+        latency = settings.sample_latency()
+        if settings.should_fail():
+            time.sleep(latency)
+            error_type = "rate_limit_error" if settings.error_status == 429 else "server_error"
+            self._send_error(settings.error_status, "Injected stub error", error_type,
+                             retry_after=settings.retry_after)
+            return
+
+        max_tokens = body.get("max_tokens") or settings.completion_tokens
+        words = _completion_words(min(settings.completion_tokens, max_tokens))
+        usage = {
+            "prompt_tokens": _estimate_prompt_tokens(body.get("messages", [])),
+            "completion_tokens": len(words),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        model = body.get("model", "stub")
+
+        time.sleep(latency)
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            self._stream_completion(model, words, usage if include_usage else None, settings.token_interval)
+        else:
+            time.sleep(settings.token_interval * len(words))
+            self._send_json(200, {
+                "id": f"chatcmpl-stub-{next(_ids)}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+    def _stream_completion(self, model, words, usage, token_interval):
+        """Send the completion as server-sent events, one chunk per word"""
+        completion_id = f"chatcmpl-stub-{next(_ids)}"
+        created = int(time.time())
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self._write_event(chunk({"role": "assistant", "content": ""}))
+            for index, word in enumerate(words):
+                if index:
+                    time.sleep(token_interval)
+                self._write_event(chunk({"content": word if index == 0 else " " + word}))
+            self._write_event(chunk({}, finish_reason="stop"))
+            if usage is not None:
+                final = chunk({})
+                final["choices"] = []
+                final["usage"] = usage
+                self._write_event(final)
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away mid-stream (e.g. a deadline fired)
+            self.close_connection = True
+
+    def _write_event(self, payload):
+        self._write_chunk(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message, error_type, retry_after=None):
+        headers = {}
+        if retry_after is not None:
+            headers["Retry-After"] = str(retry_after)
+        self._send_json(status, {"error": {"message": message, "type": error_type, "code": None}}, headers)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, settings=None):
+        super().__init__(address, StubHandler)
+        self.settings = settings or StubSettings()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_server(settings=None, host="127.0.0.1", port=0):
+    """
+    Start a stub server on a background thread
+    Args:
+        port: 0 picks a free port
+    Returns: the running StubServer (call shutdown() to stop it)
+    """
+    server = StubServer((host, port), settings)
+    thread = threading.Thread(target=server.serve_forever, name="stub-openai", daemon=True)
+    thread.start()
+    return server
+
+
+def add_settings_arguments(parser):
+    """Add the StubSettings options to an argparse parser"""
+    parser.add_argument("--latency", type=float, default=0.5, help="typical seconds before the first token")
+    parser.add_argument("--latency-spread", type=float, default=0.3,
+                        help="seconds (uniform) or sigma (lognormal)")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="seconds between tokens")
+    parser.add_argument("--completion-tokens", type=int, default=60, help="tokens per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status for injected errors")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After sent with errors")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def settings_from_args(args):
+    return StubSettings(
+        latency=args.latency,
+        latency_spread=args.latency_spread,
+        distribution=args.distribution,
+        token_interval=args.token_interval,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat-completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), settings_from_args(args))
+    print(f"Stub OpenAI server on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Regression tests for the offline batch evaluation
+Run: python -m pytest -q
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from test_semantic_index import MESSAGES
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CORPUS = MESSAGES + [
+    "I feel so overwhelmed at work and can't focus on anything",
+    "Hi there!",
+    "I keep procrastinating on my thesis",
+]
+
+
+def _run(tmp_path, name, workers, hash_seed):
+    """Run the CLI in its own interpreter; Returns: (output lines, summary without timing)"""
+    output, summary = tmp_path / f"{name}.jsonl", tmp_path / f"{name}.json"
+    subprocess.run(
+        [sys.executable, "batch_eval.py", str(tmp_path / "corpus.jsonl"), "--output", str(output),
+         "--summary", str(summary), "--workers", str(workers), "--chunk-size", "2"],
+        cwd=HERE, env=dict(os.environ, PYTHONHASHSEED=str(hash_seed)), capture_output=True, check=True,
+    )
+    result = json.loads(summary.read_text())
+    del result["elapsed_seconds"]
+    return output.read_text().splitlines(), result
+
+
+def test_pooled_run_matches_in_process_run(tmp_path):
+    with open(tmp_path / "corpus.jsonl", "w") as corpus:
+        for number, message in enumerate(CORPUS * 3):
+            corpus.write(json.dumps({"id": number, "message": message}) + "\n")
+
+    # Different hash seeds as well, as spawned workers (macOS, Windows) would not share the parent's
+    in_process = _run(tmp_path, "in_process", workers=0, hash_seed=1)
+    pooled = _run(tmp_path, "pooled", workers=2, hash_seed=2)
+    assert pooled == in_process
+    assert len(in_process[0]) == len(CORPUS) * 3
+    assert any(json.loads(line)["personas"]["anne"]["semantic"] for line in in_process[0])
@@ -0,0 +1,28 @@
+"""
+Regression tests for the benchmark comparison
+Run: python -m pytest -q
+"""
+
+from benchmarks import compare_results, same_machine
+
+META = {"platform": "Linux-x86_64", "python": "3.11.7", "definitions": "abc"}
+
+
+def _results(min_us, spread, meta=META):
+    return {"meta": dict(meta), "results": {"anne.detect_scenario.typical": {"min_us": min_us, "spread": spread}}}
+
+
+def test_slowdown_within_a_noisy_benchmarks_spread_is_not_a_regression():
+    _, regressions = compare_results(_results(10.0, 0.1), _results(12.0, 0.1))
+    assert regressions == []
+
+
+def test_slowdown_beyond_the_threshold_of_a_steady_benchmark_is_a_regression():
+    _, regressions = compare_results(_results(10.0, 0.01), _results(12.0, 0.01))
+    assert [row[0] for row in regressions] == ["anne.detect_scenario.typical"]
+
+
+def test_baselines_from_another_machine_are_not_comparable():
+    other = dict(META, platform="macOS-14-arm64")
+    assert same_machine(_results(10.0, 0.0), _results(10.0, 0.0))
+    assert not same_machine(_results(10.0, 0.0, other), _results(10.0, 0.0))
@@ -0,0 +1,71 @@
+"""
+Regression tests for idempotent turns across Chat API replicas
+Run: python -m pytest -q
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import llm_client
+from chat_api import ChatAPI
+from session_store import MemorySessionStore
+from test_coach_engine import MESSAGE, AsyncFlakyCompletions, FlakyCompletions
+
+
+async def _call(app, method, path, body=None, headers=None):
+    """Send one request straight to the ASGI app; Returns: (status, decoded JSON body)"""
+    raw = json.dumps(body).encode() if body is not None else b""
+    scope = {"type": "http", "method": method, "path": path, "query_string": b"",
+             "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]}
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.sleep(3600)  # Never disconnects
+        received = True
+        return {"type": "http.request", "body": raw, "more_body": False}
+
+    response = {"status": None, "body": b""}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        else:
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], json.loads(response["body"])
+
+
+@pytest.fixture
+def upstream():
+    async_completions = AsyncFlakyCompletions()
+    llm_client.set_client(SimpleNamespace(chat=SimpleNamespace(completions=FlakyCompletions())),
+                          SimpleNamespace(chat=SimpleNamespace(completions=async_completions)))
+    yield async_completions
+    llm_client.set_client(None)
+
+
+def test_retry_of_a_failed_turn_on_another_replica_calls_the_model_again(upstream):
+    store = MemorySessionStore()
+    first, second = ChatAPI(store=store), ChatAPI(store=store)
+    key = {"Idempotency-Key": "k1"}
+
+    async def run():
+        _, session = await _call(first, "POST", "/v1/sessions", {"persona": "anne", "welcome": False})
+        path = f"/v1/sessions/{session['session_id']}/messages"
+        failed = await _call(first, "POST", path, {"message": MESSAGE}, key)
+        retried = await _call(second, "POST", path, {"message": MESSAGE}, key)
+        repeated = await _call(first, "POST", path, {"message": MESSAGE}, key)
+        return failed, retried, repeated
+
+    failed, retried, repeated = asyncio.run(run())
+    assert failed[0] == 200 and failed[1]["reply"] != "reply 2"
+    assert retried[0] == 200 and retried[1]["reply"] == "reply 2"
+    # The completed turn is shared, so the other replica reuses it without calling the model
+    assert repeated[1]["reply"] == "reply 2"
+    assert upstream.calls == 2
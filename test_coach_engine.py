@@ -0,0 +1,90 @@
+"""
+Regression tests for idempotent turns in the coach engine
+Run: python -m pytest -q
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import llm_client
+from anne_rosental_coach import create_anne_coach, create_async_anne_coach
+
+MESSAGE = "I feel so overwhelmed at work and can't focus on anything"
+
+
+class UpstreamError(Exception):
+    status_code = 400  # Not retried, so the failing turn ends at once
+
+
+class FlakyCompletions:
+    """Fails the first call, then answers every call with a numbered reply"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, stream=False, **request):
+        self.calls += 1
+        if self.calls == 1:
+            raise UpstreamError("upstream failed")
+        text = f"reply {self.calls}"
+        if stream:
+            return iter([SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason="stop")], usage=None,
+            )])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None)
+
+
+class AsyncFlakyCompletions(FlakyCompletions):
+
+    async def create(self, stream=False, **request):
+        return FlakyCompletions.create(self, stream=False, **request)
+
+
+@pytest.fixture
+def completions():
+    completions = FlakyCompletions()
+    async_completions = AsyncFlakyCompletions()
+    llm_client.set_client(SimpleNamespace(chat=SimpleNamespace(completions=completions)),
+                          SimpleNamespace(chat=SimpleNamespace(completions=async_completions)))
+    yield completions, async_completions
+    llm_client.set_client(None)
+
+
+def test_retry_after_an_error_calls_the_model_again(completions):
+    upstream, _ = completions
+    coach = create_anne_coach()
+    failed = coach.generate_response(MESSAGE, turn_id="t1")
+    assert failed == coach._connection_error_message()
+    assert "t1" not in coach.turns
+
+    retried = coach.generate_response(MESSAGE, turn_id="t1")
+    assert retried == "reply 2"
+    assert upstream.calls == 2
+    # Answered now, so a further retry reuses the reply
+    assert coach.generate_response(MESSAGE, turn_id="t1") == "reply 2"
+    assert upstream.calls == 2
+
+
+def test_streamed_retry_after_an_error_calls_the_model_again(completions):
+    upstream, _ = completions
+    coach = create_anne_coach()
+    assert "".join(coach.stream_response(MESSAGE, turn_id="s1")) == coach._connection_error_message()
+    assert "".join(coach.stream_response(MESSAGE, turn_id="s1")) == "reply 2"
+    assert upstream.calls == 2
+
+
+def test_async_retry_after_an_error_calls_the_model_again(completions):
+    _, upstream = completions
+    coach = create_async_anne_coach()
+
+    async def run():
+        failed = await coach.generate_response(MESSAGE, turn_id="a1")
+        retried = await coach.generate_response(MESSAGE, turn_id="a1")
+        return failed, retried
+
+    failed, retried = asyncio.run(run())
+    assert failed == coach._connection_error_message()
+    assert retried == "reply 2"
+    assert upstream.calls == 2
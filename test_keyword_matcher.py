@@ -0,0 +1,58 @@
+"""
+Regression tests for safety keyword detection
+Run: python -m pytest -q
+"""
+
+import pytest
+
+from keyword_matcher import KeywordMatcher, get_safety_matcher
+
+
+def classify(text):
+    matcher = get_safety_matcher()
+    return matcher.classify(matcher.find_hits(text))
+
+
+@pytest.mark.parametrize("message", [
+    "I overdosed last night",
+    "thinking about jumping off a bridge",
+    "I was attacked",
+    "I jumped",
+    "I want to kill myself",
+    "I WANT TO DIE",
+])
+def test_inflected_crisis_phrases_are_crisis(message):
+    assert classify(message) == "crisis"
+
+
+@pytest.mark.parametrize("message", [
+    "I feel numb most days",
+    "I keep having nightmares",
+])
+def test_warning_phrases_are_warning(message):
+    assert classify(message) == "warning"
+
+
+@pytest.mark.parametrize("message", [
+    "I'm stressed about work deadlines",
+    "hello",
+    "my counterattack plan at chess failed",
+])
+def test_ordinary_messages_are_not_flagged(message):
+    assert classify(message) is None
+
+
+def test_crisis_phrase_is_routed_as_crisis_not_coaching():
+    from anne_rosental_coach import create_anne_coach
+
+    coach = create_anne_coach()
+    turn_type, scenario = coach._route_turn("thinking about jumping off a bridge")
+    assert turn_type == "crisis"
+    assert scenario is None
+
+
+def test_default_matcher_keeps_both_word_boundaries():
+    matcher = KeywordMatcher([("attack", None)])
+    assert [match.keyword for match in matcher.find_all("an attack")] == ["attack"]
+    assert matcher.find_all("attacks") == []
+    assert matcher.find_all("counterattack") == []
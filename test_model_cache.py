@@ -0,0 +1,57 @@
+"""
+Regression tests: replay misses are not hidden behind local fallbacks
+Run: python -m pytest -q
+"""
+
+import asyncio
+
+import pytest
+
+from conversation_window import ConversationWindow
+from model_cache import ModelCacheMiss
+from response_pool import ResponsePool
+
+
+def _miss(*args):
+    raise ModelCacheMiss("No recorded response")
+
+
+async def _miss_async(*args):
+    _miss()
+
+
+def _long_conversation(window):
+    for number in range(12):
+        window.append("user", f"Message {number} about my week at work. " * 20)
+        window.append("assistant", f"Reply {number} with a suggestion. " * 20)
+
+
+def test_history_summary_miss_is_raised():
+    with pytest.raises(ModelCacheMiss):
+        _long_conversation(ConversationWindow(token_budget=400, summarizer=_miss, background=False))
+
+
+def test_async_history_summary_miss_is_raised():
+    window = ConversationWindow(token_budget=400, summarizer=_miss_async, background=False)
+
+    async def run():
+        for number in range(12):
+            await window.append_async("user", f"Message {number} about my week at work. " * 20)
+            await window.append_async("assistant", f"Reply {number} with a suggestion. " * 20)
+
+    with pytest.raises(ModelCacheMiss):
+        asyncio.run(run())
+
+
+def test_summary_upstream_error_still_falls_back():
+    def failing(*args):
+        raise ConnectionError("upstream failed")
+
+    window = ConversationWindow(token_budget=400, summarizer=failing, background=False)
+    _long_conversation(window)
+    assert window.summary
+
+
+def test_pooled_generation_miss_is_raised():
+    with pytest.raises(ModelCacheMiss):
+        ResponsePool().get(("anne", "welcome", None), _miss)
@@ -0,0 +1,75 @@
+"""
+Regression tests for SLO-based model fallback
+Run: python -m pytest -q
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import llm_client
+from anne_rosental_coach import create_anne_coach
+from model_routing import MIN_LATENCY_SAMPLES, ModelRouter, model_router
+
+
+class ServerError(Exception):
+    status_code = 500  # Retried
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=None)],
+                           usage=None)
+
+
+class SlowFirstAttempt:
+    """The first call fails after a delay, later calls answer at once (streams in two chunks)"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, stream=False, **request):
+        self.calls += 1
+        if self.calls == 1:
+            time.sleep(0.3)
+            raise ServerError("upstream failed")
+        if stream:
+            return iter([_chunk("Hello "), _chunk("there")])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Hello"))], usage=None)
+
+
+@pytest.fixture
+def samples(monkeypatch):
+    llm_client.set_client(SimpleNamespace(chat=SimpleNamespace(completions=SlowFirstAttempt())))
+    recorded = []
+    monkeypatch.setattr(model_router, "record_latency",
+                        lambda route, model, seconds: recorded.append((route, model, seconds)))
+    yield recorded
+    llm_client.set_client(None)
+
+
+def test_latency_is_tracked_per_route():
+    router = ModelRouter()
+    coaching = router.route("coaching", "anne")
+    for _ in range(MIN_LATENCY_SAMPLES):
+        router.record_latency(coaching, "gpt-4", coaching.latency_slo + 1)
+
+    assert router.params("coaching", "anne")["model"] == "gpt-4o"
+    # Slow coaching replies say nothing about the crisis route's SLO
+    assert router.params("crisis", "anne")["model"] == "gpt-4"
+
+
+def test_only_the_successful_attempt_is_timed(samples):
+    create_anne_coach()._create("coaching", {"model": "gpt-4", "messages": []})
+    [(route, model, seconds)] = samples
+    assert route is model_router.route("coaching", "anne") and model == "gpt-4"
+    assert seconds < 0.3  # Not the failed attempt or the backoff
+
+
+def test_streams_are_timed_to_the_last_chunk(samples):
+    coach = create_anne_coach()
+    deltas = coach._stream_deltas("coaching", {"model": "gpt-4", "messages": []})
+    assert next(deltas) == "Hello "
+    assert samples == []  # A first chunk is not a complete reply
+    assert list(deltas) == ["there"]
+    assert len(samples) == 1 and samples[0][2] < 0.3
@@ -0,0 +1,63 @@
+"""
+Regression tests for the circuit breaker around model calls
+Run: python -m pytest -q
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, ResilientCaller, RetryPolicy
+
+
+class UpstreamError(Exception):
+    status_code = 500
+
+
+def _open_caller():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    caller = ResilientCaller(breaker, RetryPolicy(max_attempts=1))
+
+    def fail(timeout):
+        raise UpstreamError()
+
+    with pytest.raises(UpstreamError):
+        caller.call("coaching", fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.02)
+    return breaker, caller
+
+
+def test_cancelled_half_open_trial_does_not_leave_the_breaker_open():
+    breaker, caller = _open_caller()
+
+    async def hang(timeout):
+        await asyncio.sleep(10)
+
+    async def ok(timeout):
+        return "ok"
+
+    async def scenario():
+        trial = asyncio.ensure_future(caller.call_async("coaching", hang))
+        await asyncio.sleep(0.01)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        return await caller.call_async("coaching", ok)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_local_errors_do_not_count_as_healthy_upstream_calls():
+    breaker, caller = _open_caller()
+
+    def bug(timeout):
+        raise TypeError("bug")
+
+    with pytest.raises(TypeError):
+        caller.call("coaching", bug)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert caller.call("coaching", lambda timeout: "ok") == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
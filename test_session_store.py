@@ -0,0 +1,56 @@
+"""
+Regression tests for session retention
+Run: python -m pytest -q
+"""
+
+import time
+
+import pytest
+
+from session_store import MemorySessionStore, SessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield MemorySessionStore()
+    else:
+        store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+        yield store
+        store.close()
+
+
+def test_prune_deletes_idle_sessions_only(store):
+    idle = store.create_session("anne", "US")
+    store.append_turn(idle, "user", "Hello", window_size=1)
+    store.claim_turn(idle, "t1")
+    time.sleep(0.01)
+    cutoff = time.time()
+    active = store.create_session("hiro", "JP")
+    store.append_turn(active, "user", "Hi", window_size=1)
+
+    assert store.prune(cutoff) == 1
+    assert store.load(idle) is None
+    assert store.load(active).history == [{"role": "user", "content": "Hi"}]
+
+
+def test_expired_sessions_are_pruned_when_a_session_is_created(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), retention_seconds=0.01)
+    old = store.create_session("anne", "US")
+    store.append_display(old, "assistant", "Welcome")
+    time.sleep(0.02)
+    store._pruned_at = None  # Past the prune interval
+    store.create_session("anne", "US")
+    assert store.load(old) is None
+    # Messages go with the session
+    assert store._conn.execute("SELECT COUNT(*) FROM messages").fetchone() == (0,)
+    store.close()
+
+
+def test_stores_must_implement_the_whole_interface():
+    class Partial(SessionStore):
+        def create_session(self, persona, country_code):
+            return "s1"
+
+    with pytest.raises(TypeError):
+        Partial()
@@ -0,0 +1,122 @@
+"""
+Turn Registry
+Idempotent turn submission: each client turn carries an idempotency key, and a turn whose key is
+already in flight or answered is never routed again - the duplicate gets the original reply
+One registry per coach session; keys are only remembered for the most recent turns
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+
+
+# Answered turns remembered per session (duplicates arrive within seconds of the original)
+DEFAULT_MAX_TURNS = 64
+# Longest a duplicate waits for the original turn (the coaching deadline plus a summary call)
+DEFAULT_WAIT_SECONDS = 60.0
+
+
+class TurnRecord:
+    """
+    One turn by idempotency key; result is set once the original turn has answered
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.result = None
+        self.done = threading.Event()
+        self._waiters = []  # (loop, future) of async duplicates
+
+
+class TurnRegistry:
+    """
+    In-flight and answered turns of one session, by idempotency key
+    Safe to share between threads and event loops
+    """
+
+    def __init__(self, max_turns=DEFAULT_MAX_TURNS, wait_seconds=DEFAULT_WAIT_SECONDS):
+        self.max_turns = max_turns
+        self.wait_seconds = wait_seconds
+        self.duplicates = 0  # Turns answered from the registry instead of upstream
+        self._turns = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        """True if a turn with this key is in flight or answered (a resubmission would be a duplicate)"""
+        with self._lock:
+            return key in self._turns
+
+    def result(self, key):
+        """Returns: the reply of an answered turn, or None if the key is unknown, in flight or abandoned"""
+        with self._lock:
+            record = self._turns.get(key)
+            return record.result if record is not None and record.done.is_set() else None
+
+    def begin(self, key):
+        """
+        Claim a turn
+        Returns: (TurnRecord, True if the caller owns the turn and must answer it)
+        """
+        with self._lock:
+            record = self._turns.get(key)
+            if record is not None:
+                self.duplicates += 1
+                return record, False
+            record = TurnRecord(key)
+            self._turns[key] = record
+            # Forget the oldest answered turns; in-flight ones are kept until they finish
+            while len(self._turns) > self.max_turns:
+                oldest = next(iter(self._turns.values()))
+                if not oldest.done.is_set():
+                    break
+                self._turns.popitem(last=False)
+            return record, True
+
+    def finish(self, record, result):
+        """Store the owner's reply and wake every duplicate waiting for it"""
+        with self._lock:
+            record.result = result
+            record.done.set()
+            waiters, record._waiters = record._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future, result)
+
+    def abandon(self, record):
+        """
+        Forget a turn that produced nothing (e.g. a stream closed before its first delta),
+        so a retry with the same key is answered again; waiting duplicates get None
+        """
+        with self._lock:
+            if self._turns.get(record.key) is record:
+                del self._turns[record.key]
+        self.finish(record, None)
+
+    def wait(self, record):
+        """
+        Returns: the original turn's reply, or None if it was abandoned or did not finish in time
+        """
+        record.done.wait(self.wait_seconds)
+        return record.result
+
+    async def wait_async(self, record):
+        """Awaitable wait(), without blocking the event loop"""
+        with self._lock:
+            if record.done.is_set():
+                return record.result
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            record._waiters.append((loop, future))
+        try:
+            return await asyncio.wait_for(future, self.wait_seconds)
+        except asyncio.TimeoutError:
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._turns.clear()
+            self.duplicates = 0
+
+
+def _resolve(future, result):
+    if not future.done():
+        future.set_result(result)
@@ -0,0 +1,335 @@
+"""
+Turn Tracing
+Per-turn timing spans (normalization, safety, scenario, prompt build, upstream, time to first
+token, total), token counts from response.usage and the turn's outcome (ok, fallback or error)
+Finished turns go to pluggable sinks: log lines, a JSONL file, or a local Prometheus-text endpoint
+
+Sinks are configured in code (tracer.add_sink) or with COACH_TRACE_SINKS, e.g.
+COACH_TRACE_SINKS=log,file:traces.jsonl,prometheus:9464
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+logger = logging.getLogger(__name__)
+
+# Stage names in the order they happen in a turn
+STAGES = ("normalization", "safety", "scenario", "prompt_build", "upstream", "summary", "ttft", "total")
+
+# Turn outcomes, least to most severe: a model reply, a local fallback text, or an error reply
+OUTCOMES = ("ok", "fallback", "error")
+
+_current_trace = contextvars.ContextVar("current_turn_trace", default=None)
+
+
+class TurnTrace:
+    """
+    Timing spans and token counts for one coach turn
+    Repeated spans (e.g. two upstream calls) add up
+    """
+
+    def __init__(self, persona, turn_type=None):
+        self.persona = persona
+        self.turn_type = turn_type
+        self.spans = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.outcome = "ok"
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def first_token(self):
+        """Mark the first text handed to the client (later calls are ignored)"""
+        if "ttft" not in self.spans:
+            self.spans["ttft"] = time.perf_counter() - self._start
+
+    def record_usage(self, usage):
+        """Add token counts from a response's usage object (None is ignored)"""
+        if usage is None:
+            return
+        self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+        self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    def mark_outcome(self, outcome):
+        """Record a fallback or error; a turn keeps its most severe outcome"""
+        if OUTCOMES.index(outcome) > OUTCOMES.index(self.outcome):
+            self.outcome = outcome
+
+    def finish(self):
+        self.spans["total"] = time.perf_counter() - self._start
+
+    def as_dict(self):
+        return {
+            "timestamp": round(self.started_at, 3),
+            "persona": self.persona,
+            "turn_type": self.turn_type or "unknown",
+            "spans_ms": {
+                name: round(self.spans[name] * 1000, 3)
+                for name in sorted(self.spans, key=_stage_order)
+            },
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "outcome": self.outcome,
+        }
+
+
+def _stage_order(name):
+    return STAGES.index(name) if name in STAGES else len(STAGES)
+
+
+class LogSink:
+    """
+    One key=value log line per turn
+    """
+
+    def __init__(self, logger_name="coach.turns", level=logging.INFO):
+        self.logger = logging.getLogger(logger_name)
+        self.level = level
+
+    def emit(self, record):
+        spans = " ".join(f"{name}_ms={value}" for name, value in record["spans_ms"].items())
+        self.logger.log(
+            self.level, "turn persona=%s type=%s outcome=%s %s prompt_tokens=%d completion_tokens=%d",
+            record["persona"], record["turn_type"], record["outcome"], spans,
+            record["prompt_tokens"], record["completion_tokens"],
+        )
+
+
+class FileSink:
+    """
+    Appends one JSON object per turn to a file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+
+class PrometheusSink:
+    """
+    Aggregates turns into Prometheus histograms and counters
+    render() returns the text exposition format; serve() exposes it on /metrics
+    """
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self._histograms = {}  # (persona, turn_type, stage) -> [bucket counts..., sum, count]
+        self._tokens = {}      # (persona, turn_type, kind) -> total
+        self._turns = {}       # (persona, turn_type, outcome) -> count
+        self._lock = threading.Lock()
+        self._server = None
+
+    def emit(self, record):
+        labels = (record["persona"], record["turn_type"])
+        with self._lock:
+            for stage, value_ms in record["spans_ms"].items():
+                seconds = value_ms / 1000.0
+                histogram = self._histograms.setdefault(labels + (stage,), [0] * (len(self.BUCKETS) + 2))
+                for index, bound in enumerate(self.BUCKETS):
+                    if seconds <= bound:
+                        histogram[index] += 1
+                histogram[-2] += seconds
+                histogram[-1] += 1
+            for kind in ("prompt", "completion"):
+                key = labels + (kind,)
+                self._tokens[key] = self._tokens.get(key, 0) + record[f"{kind}_tokens"]
+            key = labels + (record["outcome"],)
+            self._turns[key] = self._turns.get(key, 0) + 1
+
+    def render(self):
+        lines = [
+            "# HELP coach_turn_stage_seconds Time spent per turn stage",
+            "# TYPE coach_turn_stage_seconds histogram",
+        ]
+        with self._lock:
+            for (persona, turn_type, stage), histogram in sorted(self._histograms.items()):
+                labels = f'persona="{persona}",turn_type="{turn_type}",stage="{stage}"'
+                for index, bound in enumerate(self.BUCKETS):
+                    lines.append(f'coach_turn_stage_seconds_bucket{{{labels},le="{bound}"}} {histogram[index]}')
+                lines.append(f'coach_turn_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram[-1]}')
+                lines.append(f"coach_turn_stage_seconds_sum{{{labels}}} {histogram[-2]:.6f}")
+                lines.append(f"coach_turn_stage_seconds_count{{{labels}}} {histogram[-1]}")
+            lines.append("# HELP coach_turn_tokens_total Tokens reported by response.usage")
+            lines.append("# TYPE coach_turn_tokens_total counter")
+            for (persona, turn_type, kind), total in sorted(self._tokens.items()):
+                lines.append(
+                    f'coach_turn_tokens_total{{persona="{persona}",turn_type="{turn_type}",kind="{kind}"}} {total}'
+                )
+            lines.append("# HELP coach_turns_total Finished turns by outcome (ok, fallback or error)")
+            lines.append("# TYPE coach_turns_total counter")
+            for (persona, turn_type, outcome), count in sorted(self._turns.items()):
+                lines.append(
+                    f'coach_turns_total{{persona="{persona}",turn_type="{turn_type}",outcome="{outcome}"}} {count}'
+                )
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9464, host="127.0.0.1"):
+        """
+        Serve /metrics on a background thread (local only by default)
+        Returns: the HTTP server
+        """
+        if self._server is not None:
+            return self._server
+        sink = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                data = sink.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="turn-metrics", daemon=True).start()
+        return self._server
+
+
+class Tracer:
+    """
+    Creates turn traces and hands finished ones to the sinks
+    """
+
+    def __init__(self, sinks=()):
+        self._sinks = list(sinks)
+        self._lock = threading.Lock()
+        self._configured_from_env = False
+
+    @property
+    def sinks(self):
+        return list(self._sinks)
+
+    def add_sink(self, sink):
+        with self._lock:
+            self._sinks = self._sinks + [sink]
+        return sink
+
+    def set_sinks(self, sinks):
+        with self._lock:
+            self._sinks = list(sinks)
+
+    @contextmanager
+    def turn(self, persona, turn_type=None):
+        """
+        Trace one turn; spans recorded anywhere inside (via span / current_trace) belong to it
+        Yields: the TurnTrace
+        """
+        trace = TurnTrace(persona, turn_type)
+        _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            trace.finish()
+            # Plain set rather than a reset token: stream generators may be closed from another context
+            if _current_trace.get() is trace:
+                _current_trace.set(None)
+            self.emit(trace.as_dict())
+
+    def emit(self, record):
+        for sink in self._sinks:
+            try:
+                sink.emit(record)
+            except Exception:
+                logger.exception("Turn trace sink %r failed", sink)
+
+    def configure_from_env(self):
+        """
+        Add sinks listed in COACH_TRACE_SINKS (once per process)
+        Entries: log, file:<path>, prometheus[:<port>]
+        """
+        with self._lock:
+            if self._configured_from_env:
+                return
+            self._configured_from_env = True
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        for entry in filter(None, (part.strip() for part in os.getenv("COACH_TRACE_SINKS", "").split(","))):
+            kind, _, arg = entry.partition(":")
+            if kind == "log":
+                self.add_sink(LogSink())
+            elif kind == "file":
+                self.add_sink(FileSink(arg or "turn_traces.jsonl"))
+            elif kind == "prometheus":
+                self.add_sink(PrometheusSink()).serve(int(arg or 9464))
+            else:
+                logger.warning("Unknown trace sink in COACH_TRACE_SINKS: %s", entry)
+
+
+def current_trace():
+    """Returns: the trace of the turn running in this context, or None"""
+    return _current_trace.get()
+
+
+def span(name):
+    """Time a block as a span of the current turn (no-op outside a turn)"""
+    trace = _current_trace.get()
+    return trace.span(name) if trace is not None else nullcontext()
+
+
+def set_turn_type(turn_type):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.turn_type = turn_type
+
+
+def record_usage(usage):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record_usage(usage)
+
+
+def set_outcome(outcome):
+    """Mark the current turn as answered by a fallback or an error (see OUTCOMES)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.mark_outcome(outcome)
+
+
+def traced(name):
+    """Decorator: time every call of the function as a span of the current turn"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Shared tracer for every coach in the process
+tracer = Tracer()
@@ -0,0 +1,151 @@
+"""
+Usage Ledger
+Prompt and completion tokens from response.usage, per call type and per scenario,
+rolled up per session (one ledger per coach) and for the whole process
+Costs are estimates from MODEL_PRICES
+"""
+
+import json
+import threading
+import time
+
+
+# USD per 1M tokens: (prompt, completion) - update when provider pricing changes
+MODEL_PRICES = {
+    "gpt-4": (30.00, 60.00),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """
+    Returns: estimated USD cost, or None for a model missing from MODEL_PRICES
+    """
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    prompt_price, completion_price = prices
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+class UsageTotals:
+    """
+    Running token and cost totals for one group of calls
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.unpriced_calls = 0
+
+    def add(self, prompt_tokens, completion_tokens, cost):
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        if cost is None:
+            self.unpriced_calls += 1
+        else:
+            self.cost += cost
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "cost_usd": round(self.cost, 6),
+            "unpriced_calls": self.unpriced_calls,
+        }
+
+
+class UsageLedger:
+    """
+    Token usage for one session (or, with keep_entries=False, the whole process)
+    Every recorded call is also added to the parent ledger
+    """
+
+    def __init__(self, persona=None, parent=None, keep_entries=True):
+        self.persona = persona
+        self.parent = parent
+        self.keep_entries = keep_entries
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Start a new session; the parent's totals are kept"""
+        with self._lock:
+            self.entries = []
+            self.total = UsageTotals()
+            self.by_call_type = {}
+            self.by_scenario = {}
+            self.by_model = {}
+            self.by_persona = {}
+
+    def record(self, call_type, model, usage, scenario=None, persona=None):
+        """
+        Add a response's usage (None is ignored - e.g. a stream without a usage chunk)
+        Args:
+            call_type: welcome, greeting, coaching, warning, crisis or summary
+            scenario: name of the matched scenario for coaching calls
+            persona: defaults to the ledger's persona
+        """
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        self._add({
+            "timestamp": round(time.time(), 3),
+            "persona": persona or self.persona,
+            "call_type": call_type,
+            "scenario": scenario,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost_usd": estimate_cost(model, prompt_tokens, completion_tokens),
+        })
+
+    def _add(self, entry):
+        with self._lock:
+            if self.keep_entries:
+                self.entries.append(entry)
+            groups = [
+                (self.by_call_type, entry["call_type"]),
+                (self.by_scenario, entry["scenario"] or "(none)"),
+                (self.by_model, entry["model"]),
+                (self.by_persona, entry["persona"]),
+            ]
+            for totals in [self.total] + [group.setdefault(key, UsageTotals()) for group, key in groups]:
+                totals.add(entry["prompt_tokens"], entry["completion_tokens"], entry["cost_usd"])
+        if self.parent is not None:
+            self.parent._add(entry)
+
+    def summary(self):
+        """
+        Returns: dict with the total and breakdowns by call type, scenario, model and persona
+        """
+        with self._lock:
+            return {
+                "total": self.total.as_dict(),
+                "by_call_type": {key: value.as_dict() for key, value in self.by_call_type.items()},
+                "by_scenario": {key: value.as_dict() for key, value in self.by_scenario.items()},
+                "by_model": {key: value.as_dict() for key, value in self.by_model.items()},
+                "by_persona": {key: value.as_dict() for key, value in self.by_persona.items()},
+            }
+
+    def to_jsonl(self):
+        """Returns: one JSON object per recorded call"""
+        with self._lock:
+            return "".join(json.dumps(entry) + "\n" for entry in self.entries)
+
+    def export_jsonl(self, path):
+        """Append the recorded calls to a JSONL file"""
+        data = self.to_jsonl()
+        with open(path, "a") as f:
+            f.write(data)
+
+
+# Totals for every coach in the process (per-call entries are kept by the session ledgers)
+process_usage = UsageLedger(keep_entries=False)